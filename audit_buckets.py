@@ -1,58 +1,420 @@
-import boto3
+"""
+Auditoría del pipeline: ¿cada foto subida a RAW quedó tileada completa y con resultados?
+
+Por cada foto de uploads/ (RAW) verifica en PROCESSED que estén todos los tiles de su
+cuadrícula (tiles/{foto}/{foto}_grid{R}x{C}_r{r}c{c}.*: R*C esperados, la cuadrícula
+va en el nombre de cada tile), su geometry/{foto}.json, y en OUTPUT que haya resultados (media_id en
+results/detections/*.parquet o reconstruction/{media_id}.json). El media_id es el de la tabla de
+tracking (bucket/key/ETag de la foto, ver tracking.media_id_for); los resultados anteriores usan
+el nombre de la foto y también cuentan.
+
+Los listados se hacen en paralelo partiendo el espacio de keys en rangos
+(StartAfter) y cada hilo va reduciendo sus keys a conjuntos compactos (nombre de foto
+-> máscara de bits de tiles vistos), sin guardar los listados completos. En vez de
+listar, también puede leer los manifest.json de S3 Inventory (CSV o Parquet).
+
+Ejemplos:
+  python audit_buckets.py
+  python audit_buckets.py --env prod --account 123456789012 --workers 64 --out auditoria.json
+  python audit_buckets.py --raw-inventory s3://inventario/raw/2026-10-01T01-00Z/manifest.json \\
+                          --processed-inventory s3://inventario/processed/2026-10-01T01-00Z/manifest.json
+"""
+import io
 import os
+import csv
+import gzip
+import json
+import string
+import argparse
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.common.s3_io import make_s3_client, parse_s3_uri, get_bytes, S3RangeFile
+from src.common.tiling import parse_tile_name, GEOMETRY_PREFIX
+from src.common.results_store import RESULTS_PREFIX
+from src.common.tracking import media_id_for
+
+# --- CONFIGURA TUS NOMBRES DE BUCKET AQUÍ (o con --env / --account / --*-bucket) ---
+ENV_NAME = "dev"
+ACCOUNT_ID = "038876987034"
+# -------------------------------------------------------------------------------
+
+RAW_PREFIX = "uploads/"
+TILES_PREFIX = "tiles/"
+RECONSTRUCTION_PREFIX = "reconstruction/"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Caracteres que parten el espacio de keys (orden de S3 = orden de bytes UTF-8)
+SHARD_CHARS = sorted(string.digits + string.ascii_letters + "-_.")
+# Cuántos faltantes de cada tipo se muestran por pantalla (--out guarda todos)
+SHOW_MAX = 30
+
+# =========================================================
+# LISTADO EN PARALELO
+# =========================================================
+
+def shard_bounds(prefix, depth):
+    """
+    Límites de los rangos de keys: prefix + cada combinación de `depth` caracteres.
+    Los rangos (b_k, b_k+1] cubren todo el prefijo, incluso keys con caracteres que no
+    están en SHARD_CHARS: solo cambia cómo se reparten entre los hilos.
+    """
+    bounds = [prefix]
+    for _ in range(depth):
+        bounds = [b + c for b in bounds for c in SHARD_CHARS]
+    return [None] + bounds + [None]
+
+def list_range(s3_client, bucket, prefix, start_after, stop_at, consume):
+    """Lista las keys de (start_after, stop_at] y se las pasa a consume (una por una, con su ETag)"""
+    kwargs = {'Bucket': bucket, 'Prefix': prefix}
+    if start_after:
+        kwargs['StartAfter'] = start_after
+    count = 0
+    for page in s3_client.get_paginator('list_objects_v2').paginate(**kwargs):
+        for obj in page.get('Contents', []):
+            if stop_at is not None and obj['Key'] > stop_at:
+                return count
+            consume(obj['Key'], obj.get('ETag'))
+            count += 1
+    return count
+
+def scan_prefix(s3_client, bucket, prefix, make_state, depth, workers):
+    """
+    Lista bucket/prefix en paralelo. make_state() crea el acumulador de cada rango
+    (objeto con .add(key, etag) y .merge(otro)); devuelve el acumulado y el total de keys.
+    """
+    bounds = shard_bounds(prefix, depth)
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+
+    def run(bound):
+        state = make_state()
+        return state, list_range(s3_client, bucket, prefix, bound[0], bound[1], state.add)
+
+    total, merged = 0, make_state()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for state, count in pool.map(run, ranges):
+            merged.merge(state)
+            total += count
+    return merged, total
+
+# =========================================================
+# S3 INVENTORY
+# =========================================================
+
+def read_uri(s3_client, uri):
+    if uri.startswith("s3://"):
+        return get_bytes(s3_client, *parse_s3_uri(uri))
+    with open(uri, 'rb') as f:
+        return f.read()
+
+def iter_inventory_keys(s3_client, manifest_uri, prefix=""):
+    """
+    (key, ETag) de un reporte de S3 Inventory a partir de su manifest.json (CSV o Parquet).
+    El ETag es None si el inventario no se configuró con ese campo.
+    Los archivos de datos se leen del bucket destino del inventario, o de la misma
+    carpeta que el manifest si es un archivo local.
+    """
+    manifest = json.loads(read_uri(s3_client, manifest_uri))
+    fmt = manifest['fileFormat'].upper()
+    local_dir = None if manifest_uri.startswith("s3://") else os.path.dirname(manifest_uri)
+    dest_bucket = manifest.get('destinationBucket', '').replace('arn:aws:s3:::', '')
+
+    for entry in manifest['files']:
+        uri = os.path.join(local_dir, os.path.basename(entry['key'])) if local_dir else f"s3://{dest_bucket}/{entry['key']}"
+        data = read_uri(s3_client, uri)
+        if fmt == 'CSV':
+            columns = [c.strip() for c in manifest['fileSchema'].split(',')]
+            key_col = columns.index('Key')
+            etag_col = columns.index('ETag') if 'ETag' in columns else None
+            for row in csv.reader(io.StringIO(gzip.decompress(data).decode('utf-8'))):
+                # Las keys del CSV de inventario vienen URL-encoded
+                key = urllib.parse.unquote_plus(row[key_col])
+                if key.startswith(prefix):
+                    yield key, row[etag_col] if etag_col is not None else None
+        elif fmt == 'PARQUET':
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(io.BytesIO(data))
+            columns = ['key'] + (['e_tag'] if 'e_tag' in parquet_file.schema_arrow.names else [])
+            table = parquet_file.read(columns=columns)
+            keys = table.column('key').to_pylist()
+            etags = table.column('e_tag').to_pylist() if 'e_tag' in columns else [None] * len(keys)
+            for key, etag in zip(keys, etags):
+                if key.startswith(prefix):
+                    yield key, etag
+        else:
+            raise ValueError(f"Formato de inventario no soportado: {fmt} (usar CSV o Parquet)")
+
+def scan_inventory(s3_client, manifest_uri, prefix, make_state):
+    state, total = make_state(), 0
+    for key, etag in iter_inventory_keys(s3_client, manifest_uri, prefix):
+        state.add(key, etag)
+        total += 1
+    return state, total
+
+# =========================================================
+# ACUMULADORES
+# =========================================================
+
+class RawPhotos:
+    """Nombres de foto (lo que usa el tiler como prefijo) -> key original (y su ETag)"""
+
+    def __init__(self):
+        self.keys, self.etags, self.duplicates = {}, {}, []
+
+    def add(self, key, etag=None):
+        if key.endswith('/') or not key.lower().endswith(IMAGE_EXTENSIONS):
+            return
+        name = os.path.basename(key).rsplit('.', 1)[0]
+        if name in self.keys:
+            self.duplicates.append(key)
+        else:
+            self.keys[name] = key
+            self.etags[name] = etag
+
+    def merge(self, other):
+        for name, key in other.keys.items():
+            if name in self.keys:
+                self.duplicates.append(key)
+            else:
+                self.keys[name] = key
+                self.etags[name] = other.etags.get(name)
+        self.duplicates += other.duplicates
+
+    def media_ids(self, bucket):
+        """Nombre de foto -> media_id de tracking (el que llevan sus resultados)"""
+        return {name: media_id_for(bucket, key, self.etags.get(name)) for name, key in self.keys.items()}
+
+class ProcessedTiles:
+    """
+    Por foto: {(rows, cols): máscara de bits de los tiles vistos} (un int por foto y
+    cuadrícula, en vez de las keys), qué fotos tienen geometry/{foto}.json y cuáles
+    tuvieron todos sus tiles descartados por el filtro de fondo (ver add_filtered_tiles).
+    """
+
+    def __init__(self):
+        self.grids = defaultdict(dict)
+        self.geometry = set()
+        self.all_filtered = set()
+        self.unparsed = 0
+
+    def add(self, key, etag=None):
+        if key.startswith(TILES_PREFIX):
+            parsed = parse_tile_name(key)
+            if parsed is None:
+                self.unparsed += 1
+                return
+            prefix, rows, cols, r, c = parsed
+            masks = self.grids[prefix]
+            masks[(rows, cols)] = masks.get((rows, cols), 0) | (1 << (r * cols + c))
+        elif key.startswith(f"{GEOMETRY_PREFIX}/") and key.endswith('.json'):
+            self.geometry.add(key[len(GEOMETRY_PREFIX) + 1:-5])
+
+    def merge(self, other):
+        for prefix, masks in other.grids.items():
+            mine = self.grids[prefix]
+            for grid, mask in masks.items():
+                mine[grid] = mine.get(grid, 0) | mask
+        self.geometry |= other.geometry
+        self.all_filtered |= other.all_filtered
+        self.unparsed += other.unparsed
+
+    def is_complete(self, prefix):
+        """Alguna cuadrícula de la foto tiene todos sus tiles (False si no tiene ninguno)"""
+        seen, expected = self.tiles_status(prefix)
+        return expected > 0 and seen == expected
+
+    def tiles_status(self, prefix):
+        """(tiles vistos, tiles esperados) de la cuadrícula más completa de la foto"""
+        statuses = [(bin(mask).count("1"), rows * cols) for (rows, cols), mask in self.grids.get(prefix, {}).items()]
+        return max(statuses, key=lambda s: (s[0] == s[1], s[0] / s[1]), default=(0, 0))
+
+class OutputResults:
+    """Archivos Parquet de resultados y fotos con reconstrucción"""
+
+    def __init__(self):
+        self.parquet_keys = []
+        self.reconstructed = set()
+
+    def add(self, key, etag=None):
+        if key.startswith(RESULTS_PREFIX) and key.endswith('.parquet'):
+            self.parquet_keys.append(key)
+        elif key.startswith(RECONSTRUCTION_PREFIX) and key.endswith('.json'):
+            self.reconstructed.add(key[len(RECONSTRUCTION_PREFIX):-5])
+
+    def merge(self, other):
+        self.parquet_keys += other.parquet_keys
+        self.reconstructed |= other.reconstructed
+
+def add_filtered_tiles(s3_client, bucket, processed, workers, photos=None):
+    """
+    Los tiles de fondo que descartó el filtro del tiler (TILE_FILTER=skip) no están en
+    tiles/ pero sí en el 'skipped' de la geometría: se cuentan como vistos. Se leen las
+    geometrías de las fotos (photos: nombres de RAW; por defecto todas las que tienen
+    geometría) que no están completas, incluidas las que no tienen ningún tile subido
+    porque el filtro los descartó todos: esas quedan en processed.all_filtered (no se
+    infieren, así que no se les piden resultados).
+    """
+    candidates = processed.geometry if photos is None else processed.geometry.intersection(photos)
+    names = sorted(prefix for prefix in candidates if not processed.is_complete(prefix))
+
+    def read(prefix):
+        geometry = json.loads(get_bytes(s3_client, bucket, f"{GEOMETRY_PREFIX}/{prefix}.json"))
+        skipped = geometry.get('skipped', [])
+        return prefix, skipped, bool(skipped) and set(skipped) >= {t['name'] for t in geometry.get('tiles', [])}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for prefix, skipped, all_filtered in pool.map(read, names):
+            for tile_name in skipped:
+                processed.add(f"{TILES_PREFIX}{tile_name}")
+            if all_filtered:
+                processed.all_filtered.add(prefix)
+    return len(names)
+
+def media_ids_with_results(s3_client, bucket, parquet_keys, workers):
+    """
+    media_id presentes en los Parquet de resultados. Con GETs por rango: el footer y
+    los column chunks de media_id (diccionario + índices, unos KB), no el archivo entero.
+    """
+    import pyarrow.parquet as pq
+
+    def read(key):
+        parquet_file = pq.ParquetFile(S3RangeFile(s3_client, bucket, key))
+        table = parquet_file.read(columns=['media_id'])
+        return set(table.column('media_id').unique().to_pylist())
+
+    found = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for ids in pool.map(read, parquet_keys):
+            found |= ids
+    return found
+
+# =========================================================
+# AUDITORÍA
+# =========================================================
+
+def audit(raw, processed, with_results, media_ids=None):
+    """
+    Cruza los acumulados. with_results: media_ids (o nombres, resultados anteriores) con
+    resultados, o None si no se auditó OUTPUT. media_ids: nombre de foto -> media_id.
+    Las fotos con todos los tiles descartados por el filtro no pasan por la inferencia:
+    cuentan como completas sin resultados y se listan aparte (all_filtered).
+    """
+    media_ids = media_ids or {}
+    report = {
+        'raw_photos': len(raw.keys),
+        'missing_tiles': [],
+        'incomplete_tiles': [],
+        'missing_geometry': [],
+        'missing_results': [],
+        'all_filtered': sorted(processed.all_filtered.intersection(raw.keys)),
+        'orphan_tiles': sorted(set(processed.grids) - set(raw.keys)),
+        'duplicate_names': sorted(raw.duplicates),
+        'unparsed_tile_keys': processed.unparsed,
+    }
+    complete = 0
+    for name in sorted(raw.keys):
+        seen, expected = processed.tiles_status(name)
+        if expected == 0:
+            report['missing_tiles'].append(raw.keys[name])
+            continue
+        if seen < expected:
+            report['incomplete_tiles'].append({'photo': raw.keys[name], 'tiles': seen, 'expected': expected})
+        if name not in processed.geometry:
+            report['missing_geometry'].append(name)
+        has_results = (
+            with_results is None or name in processed.all_filtered
+            or name in with_results or media_ids.get(name) in with_results
+        )
+        if not has_results:
+            report['missing_results'].append(name)
+        # Se cuenta cada foto una vez (una foto incompleta y sin resultados no resta dos veces)
+        complete += seen == expected and has_results
+    report['complete'] = complete
+    return report
+
+def print_report(report):
+    print(f"\nFotos en RAW: {report['raw_photos']}")
+    sections = [
+        ('missing_tiles', "❌ SIN TILES"),
+        ('incomplete_tiles', "❌ TILES INCOMPLETOS"),
+        ('missing_results', "❌ TILEADAS PERO SIN RESULTADOS"),
+        ('missing_geometry', "⚠️ SIN geometry/*.json (tileadas antes de que existiera)"),
+        ('all_filtered', "ℹ️ TODOS LOS TILES DESCARTADOS POR EL FILTRO (sin inferencia)"),
+        ('orphan_tiles', "⚠️ TILES SIN FOTO EN RAW"),
+        ('duplicate_names', "⚠️ NOMBRES REPETIDOS EN RAW (comparten carpeta de tiles)"),
+    ]
+    for field, title in sections:
+        items = report[field]
+        if not items:
+            continue
+        print(f"\n{title}: {len(items)}")
+        for item in items[:SHOW_MAX]:
+            print(f" - {item['photo']} ({item['tiles']}/{item['expected']})" if isinstance(item, dict) else f" - {item}")
+        if len(items) > SHOW_MAX:
+            print(f"   ... y {len(items) - SHOW_MAX} más")
+    if report['unparsed_tile_keys']:
+        print(f"\n⚠️ {report['unparsed_tile_keys']} keys en tiles/ que no siguen el formato de nombre")
+
+    if not report['missing_tiles'] and not report['incomplete_tiles'] and not report['missing_results']:
+        print("\n✅ ¡Todo perfecto! No falta nada.")
+    else:
+        print("\n💡 Revisa CloudWatch Logs buscando estos nombres.")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--env", default=ENV_NAME)
+    parser.add_argument("--account", default=ACCOUNT_ID)
+    parser.add_argument("--raw-bucket")
+    parser.add_argument("--processed-bucket")
+    parser.add_argument("--output-bucket")
+    parser.add_argument("--raw-inventory", help="manifest.json de S3 Inventory del bucket RAW (s3:// o local)")
+    parser.add_argument("--processed-inventory", help="manifest.json de S3 Inventory del bucket PROCESSED")
+    parser.add_argument("--output-inventory", help="manifest.json de S3 Inventory del bucket OUTPUT")
+    parser.add_argument("--skip-results", action="store_true", help="No auditar OUTPUT (solo tiles)")
+    parser.add_argument("--workers", type=int, default=32, help="Listados/lecturas en paralelo")
+    parser.add_argument("--shard-depth", type=int, default=2, help="Caracteres por rango de listado (2 = ~4000 rangos)")
+    parser.add_argument("--out", help="Guardar el reporte completo en JSON")
+    args = parser.parse_args()
+
+    raw_bucket = args.raw_bucket or f"phenoberry-{args.env}-raw-{args.account}"
+    processed_bucket = args.processed_bucket or f"phenoberry-{args.env}-processed-{args.account}"
+    output_bucket = args.output_bucket or f"phenoberry-{args.env}-output-{args.account}"
+    s3_client = make_s3_client(max_pool_connections=args.workers)
+
+    def scan(bucket, inventory, prefix, make_state):
+        if inventory:
+            return scan_inventory(s3_client, inventory, prefix, make_state)
+        return scan_prefix(s3_client, bucket, prefix, make_state, args.shard_depth, args.workers)
+
+    print("Iniciando auditoría...")
+    raw, n = scan(raw_bucket, args.raw_inventory, RAW_PREFIX, RawPhotos)
+    print(f"RAW: {n} objetos")
+
+    processed = ProcessedTiles()
+    for prefix in (TILES_PREFIX, f"{GEOMETRY_PREFIX}/"):
+        state, n = scan(processed_bucket, args.processed_inventory, prefix, ProcessedTiles)
+        processed.merge(state)
+        print(f"PROCESSED/{prefix}: {n} objetos")
+
+    add_filtered_tiles(s3_client, processed_bucket, processed, args.workers, raw.keys)
+
+    with_results = None
+    if not args.skip_results:
+        output = OutputResults()
+        for prefix in (RESULTS_PREFIX, RECONSTRUCTION_PREFIX):
+            state, n = scan(output_bucket, args.output_inventory, prefix, OutputResults)
+            output.merge(state)
+            print(f"OUTPUT/{prefix}: {n} objetos")
+        with_results = output.reconstructed | media_ids_with_results(
+            s3_client, output_bucket, output.parquet_keys, args.workers
+        )
+
+    report = audit(raw, processed, with_results, raw.media_ids(raw_bucket))
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte completo en {args.out}")
 
-# --- CONFIGURA TUS NOMBRES DE BUCKET AQUÍ ---
-BUCKET_RAW = "phenoberry-dev-raw-038876987034" 
-BUCKET_PROCESSED = "phenoberry-dev-processed-038876987034"
-# --------------------------------------------
-
-s3 = boto3.client('s3')
-
-def get_all_objects(bucket, prefix=""):
-    keys = []
-    paginator = s3.get_paginator('list_objects_v2')
-    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
-        if 'Contents' in page:
-            for obj in page['Contents']:
-                keys.append(obj['Key'])
-    return keys
-
-print("Iniciando auditoría...")
-
-# 1. Obtener lista de RAW (Nombres de archivo base)
-# Quitamos la extensión para comparar fácil
-raw_files = get_all_objects(BUCKET_RAW)
-raw_names = set()
-for f in raw_files:
-    # Ignorar carpetas o archivos ocultos
-    if f.endswith('/') or 'training-dataset' in f: 
-        continue
-    # Extraer nombre sin extensión (ej: 'foto1.jpg' -> 'foto1')
-    name = os.path.basename(f).rsplit('.', 1)[0]
-    raw_names.add(name)
-
-print(f"Archivos en RAW: {len(raw_names)}")
-
-# 2. Obtener lista de PROCESSED (Nombres de carpetas)
-processed_files = get_all_objects(BUCKET_PROCESSED)
-processed_folders = set()
-for f in processed_files:
-    # La estructura es: nombre_foto/tile_01.jpg
-    # Queremos 'nombre_foto'
-    folder_name = f.split('/')[0]
-    processed_folders.add(folder_name)
-
-print(f"Carpetas en PROCESSED: {len(processed_folders)}")
-
-# 3. Comparar (Resta de conjuntos)
-missing = raw_names - processed_folders
-
-if len(missing) == 0:
-    print("\n✅ ¡Todo perfecto! No falta nada.")
-else:
-    print(f"\n❌ FALTAN {len(missing)} IMÁGENES:")
-    print("-" * 30)
-    for m in missing:
-        print(f" - {m}")
-    print("-" * 30)
-    print("💡 Revisa CloudWatch Logs buscando estos nombres.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
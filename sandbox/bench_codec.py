@@ -0,0 +1,94 @@
+"""
+Micro-benchmark de codificación/decodificación de tiles (src/common/tiling.py).
+
+Mide, por formato y calidad: ms de encode y decode por tile y bytes por tile.
+También mide la decodificación de la foto completa a 1, 1/2, 1/4 y 1/8
+(IMREAD_REDUCED_*) y qué factor elegiría decode_reduction para esa foto.
+
+Ejemplos:
+  python sandbox/bench_codec.py                       # foto sintética de 12 MP
+  python sandbox/bench_codec.py --image foto.jpg --repeat 5
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.common.tiling import (
+    decode_image, encode_tile, iter_tile_crops, plan_tiling, decode_reduction, REDUCED_DECODE_FLAGS,
+)
+
+SETTINGS = [
+    ("jpg", 95), ("jpg", 90), ("jpg", 80), ("jpg", 70),
+    ("webp", 90), ("webp", 75),
+    ("npy", None),
+]
+
+def synthetic_photo(w, h, seed=0):
+    """Textura suave + ruido: comprime parecido a una foto real (no como ruido puro)"""
+    rng = np.random.default_rng(seed)
+    base = cv2.resize(rng.integers(0, 256, (h // 64, w // 64, 3), dtype=np.uint8), (w, h), interpolation=cv2.INTER_CUBIC)
+    noise = rng.normal(0, 6, (h, w, 3))
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+def timed_ms(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, result
+
+def bench_tiles(img, repeat):
+    crops = [crop for _, _, crop in iter_tile_crops(img, "bench")]
+    rows = []
+    for fmt, quality in SETTINGS:
+        enc_ms, encoded = timed_ms(lambda: [encode_tile(c, fmt, quality)[1] for c in crops], repeat)
+        dec_ms, _ = timed_ms(lambda: [decode_image(data) for data in encoded], repeat)
+        rows.append((f"{fmt}" + (f" q{quality}" if quality else ""), enc_ms / len(crops), dec_ms / len(crops),
+                     sum(len(d) for d in encoded) / len(crops)))
+    return len(crops), rows
+
+def bench_reduced_decode(data, repeat):
+    rows = []
+    for factor in sorted(REDUCED_DECODE_FLAGS):
+        ms, img = timed_ms(lambda: decode_image(data, reduce=factor), repeat)
+        rows.append((factor, ms, img.shape[1], img.shape[0]))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="Foto a usar (por defecto: sintética)")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3, help="Se reporta el mejor de N")
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)
+    if args.image:
+        with open(args.image, "rb") as f:
+            data = f.read()
+        img = decode_image(data)
+    else:
+        img = synthetic_photo(args.width, args.height)
+        data = cv2.imencode(".jpg", img)[1].tobytes()
+    h, w = img.shape[:2]
+
+    n_tiles, rows = bench_tiles(img, args.repeat)
+    print(f"\nFoto {w}x{h}, {n_tiles} tiles (TILING_MODE actual)")
+    print(f"{'formato':<10} {'encode ms/tile':>15} {'decode ms/tile':>15} {'KB/tile':>10}")
+    for name, enc, dec, size in rows:
+        print(f"{name:<10} {enc:>15.2f} {dec:>15.2f} {size / 1024:>10.1f}")
+
+    factor = decode_reduction(w, h, plan_tiling(w, h))
+    print(f"\nDecodificación de la foto completa (decode_reduction elegiría 1/{factor})")
+    print(f"{'factor':<8} {'ms':>10} {'tamaño':>14}")
+    for f, ms, rw, rh in bench_reduced_decode(data, args.repeat):
+        print(f"1/{f:<6} {ms:>10.1f} {f'{rw}x{rh}':>14}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark de src/common/feature_extraction.box_features en fotos densas.
+
+Compara la versión vectorizada (una conversión HSV + imágenes integrales) contra la
+forma ingenua (recortar cada caja, convertirla a HSV y promediar en un bucle de
+Python) y verifica que den lo mismo. Reporta ms por foto y cajas por segundo.
+
+Ejemplos:
+  python sandbox/bench_features.py
+  python sandbox/bench_features.py --width 8000 --height 6000 --boxes 500 2000 8000
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.common.feature_extraction import box_features, core_boxes
+
+def synthetic_photo(w, h, seed=0):
+    rng = np.random.default_rng(seed)
+    base = cv2.resize(rng.integers(0, 256, (h // 32, w // 32, 3), dtype=np.uint8), (w, h))
+    return cv2.add(base, rng.integers(0, 20, (h, w, 3), dtype=np.uint8))
+
+def synthetic_boxes(w, h, n, seed=0):
+    """Bayas de 15 a 80 px repartidas por la foto"""
+    rng = np.random.default_rng(seed + 1)
+    side = rng.uniform(15, 80, n)
+    x1, y1 = rng.uniform(0, w - side), rng.uniform(0, h - side)
+    return np.stack([x1, y1, x1 + side, y1 + side], axis=1)
+
+def naive_features(img, boxes):
+    """Referencia: un recorte y una conversión HSV por caja"""
+    height, width = img.shape[:2]
+    out = np.zeros((len(boxes), 5))
+    for i, (x1, y1, x2, y2) in enumerate(zip(*core_boxes(boxes, width, height))):
+        crop = img[y1:y2, x1:x2]
+        hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+        out[i, :3] = crop.reshape(-1, 3).mean(axis=0)
+        out[i, 3:] = hsv.reshape(-1, 3)[:, 1:].mean(axis=0)
+    return out
+
+def timed_ms(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--boxes", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=3, help="Se reporta el mejor de N")
+    parser.add_argument("--skip-naive", action="store_true", help="No medir la versión por caja (lenta)")
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)
+    img = synthetic_photo(args.width, args.height)
+    print(f"Foto {args.width}x{args.height}")
+    print(f"{'cajas':>8} {'vectorizado ms':>15} {'cajas/s':>12} {'por caja ms':>12} {'cajas/s':>12} {'aceleración':>12}")
+    for n in args.boxes:
+        boxes = synthetic_boxes(args.width, args.height, n)
+        fast_ms, features = timed_ms(lambda: box_features(img, boxes), args.repeat)
+        row = f"{n:>8} {fast_ms:>15.1f} {n / fast_ms * 1000:>12.0f}"
+        if not args.skip_naive:
+            naive_ms, reference = timed_ms(lambda: naive_features(img, boxes), 1)
+            fast = np.stack([features[k] for k in ('mean_b', 'mean_g', 'mean_r', 'mean_s', 'mean_v')], axis=1)
+            assert np.allclose(fast, reference, atol=1e-2), "la versión vectorizada no coincide con la referencia"
+            row += f" {naive_ms:>12.1f} {n / naive_ms * 1000:>12.0f} {naive_ms / fast_ms:>11.1f}x"
+        print(row)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Benchmark y control de regresión de src/common/tiling.py.
+
+Genera fotos sintéticas de 12 a 48 MP con etiquetas YOLO de 0 a 2000 cajas y mide,
+para el modo entrenamiento (process_tiling a disco, con etiquetas) y el modo
+inferencia (iter_tiles en memoria):
+  - ms por imagen y tiles por segundo
+  - pico de memoria (RSS) del proceso, cada caso en un proceso nuevo
+  - bytes escritos / generados
+Además verifica las etiquetas: cada línea de cada tile, llevada de vuelta a la
+foto, debe coincidir con la caja original (load_yolo_boxes) recortada al tile, y
+ninguna caja suficientemente visible puede faltar. El hash de todas las etiquetas
+permite detectar cambios silenciosos entre versiones del código.
+
+Ejemplos:
+  python sandbox/bench_tiling.py --quick
+  python sandbox/bench_tiling.py --save-baseline bench_tiling.json
+  python sandbox/bench_tiling.py --compare bench_tiling.json --tolerance 0.25
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.common.tiling import (
+    process_tiling, iter_tiles, load_yolo_boxes, compute_tile_grid, plan_tiling, parse_tile_name, MIN_AREA_THRESHOLD,
+)
+
+# (nombre, ancho, alto)
+SIZES = [("12MP", 4000, 3000), ("24MP", 6000, 4000), ("48MP", 8000, 6000), ("12MP-vertical", 3000, 4000)]
+BOX_COUNTS = [0, 200, 2000]
+QUICK_SIZES = SIZES[:1] + SIZES[3:]
+QUICK_BOX_COUNTS = [0, 2000]
+# Tolerancia (px) de la vuelta etiqueta -> foto (las etiquetas tienen 6 decimales)
+ROUND_TRIP_TOLERANCE_PX = 0.05
+
+def synthetic_photo(w, h, seed):
+    """Textura suave + ruido: comprime parecido a una foto real"""
+    rng = np.random.default_rng(seed)
+    base = cv2.resize(rng.integers(0, 256, (max(h // 64, 1), max(w // 64, 1), 3), dtype=np.uint8), (w, h))
+    noise = rng.integers(0, 12, (h, w, 3), dtype=np.uint8)
+    return cv2.add(base, noise)
+
+def synthetic_labels(w, h, n, seed):
+    """n cajas YOLO de 10 a 200 px (algunas pegadas a los bordes de la foto)"""
+    rng = np.random.default_rng(seed + 1)
+    bw, bh = rng.uniform(10, 200, n), rng.uniform(10, 200, n)
+    xc, yc = rng.uniform(0, w, n), rng.uniform(0, h, n)
+    lines = [
+        f"{rng.integers(0, 2)} {x / w:.6f} {y / h:.6f} {a / w:.6f} {b / h:.6f}"
+        for x, y, a, b in zip(xc, yc, bw, bh)
+    ]
+    return "\n".join(lines)
+
+def check_label_round_trip(boxes, label_dir, w, h):
+    """
+    Lleva cada etiqueta de tile a coordenadas de la foto y la compara con la caja
+    original recortada al tile. Devuelve la lista de errores (vacía si todo coincide).
+    La cuadrícula sale del nombre del tile y el solape de plan_tiling (igual que process_tiling).
+    """
+    rows, cols, overlap = plan_tiling(w, h)
+    grids, errors, found = {}, [], set()
+
+    for name in sorted(os.listdir(label_dir)):
+        _, grid_rows, grid_cols, r, c = parse_tile_name(name[:-4])
+        if (grid_rows, grid_cols) != (rows, cols):
+            errors.append(f"{name}: cuadrícula {grid_rows}x{grid_cols}, plan_tiling da {rows}x{cols}")
+        if (grid_rows, grid_cols) not in grids:
+            _, _, tiles = compute_tile_grid(w, h, plan=(grid_rows, grid_cols, overlap))
+            grids[(grid_rows, grid_cols)] = {(tr, tc): (x1, y1, x2, y2) for tr, tc, x1, y1, x2, y2 in tiles}
+        x1, y1, x2, y2 = grids[(grid_rows, grid_cols)][(r, c)]
+        tw, th = x2 - x1, y2 - y1
+        clipped = np.stack([
+            np.maximum(boxes[:, 1], x1), np.maximum(boxes[:, 2], y1),
+            np.minimum(boxes[:, 3], x2), np.minimum(boxes[:, 4], y2),
+        ], axis=1)
+        with open(os.path.join(label_dir, name)) as f:
+            for line in filter(None, f.read().split("\n")):
+                cls, xc, yc, bw, bh = line.split()
+                back = np.array([
+                    x1 + (float(xc) - float(bw) / 2) * tw, y1 + (float(yc) - float(bh) / 2) * th,
+                    x1 + (float(xc) + float(bw) / 2) * tw, y1 + (float(yc) + float(bh) / 2) * th,
+                ])
+                dist = np.abs(clipped - back).max(axis=1)
+                dist[boxes[:, 0] != int(cls)] = np.inf
+                j = int(dist.argmin())
+                if dist[j] > ROUND_TRIP_TOLERANCE_PX:
+                    errors.append(f"{name}: '{line}' no corresponde a ninguna caja (error {dist[j]:.3f}px)")
+                found.add((r, c, j))
+
+        # Toda caja con suficiente área visible debe estar en este tile
+        visible = np.clip(clipped[:, 2] - clipped[:, 0], 0, None) * np.clip(clipped[:, 3] - clipped[:, 1], 0, None)
+        area = (boxes[:, 3] - boxes[:, 1]) * (boxes[:, 4] - boxes[:, 2])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = np.flatnonzero((area > 0) & (visible / area >= MIN_AREA_THRESHOLD * 1.01))
+        missing = [j for j in expected if (r, c, j) not in found]
+        if missing:
+            errors.append(f"{name}: faltan {len(missing)} cajas visibles")
+    return errors
+
+def dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+def peak_rss_mb():
+    # ru_maxrss: KB en Linux, bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def prepare_inputs(work, w, h, n_boxes):
+    """Foto + etiquetas sintéticas en disco (se generan fuera del proceso medido)"""
+    img_path = os.path.join(work, "foto.jpg")
+    lbl_path = os.path.join(work, "foto.txt")
+    cv2.imwrite(img_path, synthetic_photo(w, h, seed=n_boxes))
+    with open(lbl_path, "w") as f:
+        f.write(synthetic_labels(w, h, n_boxes, seed=n_boxes))
+    return img_path, lbl_path
+
+def run_case(case):
+    """Un caso en un proceso nuevo (para que el pico de RSS sea solo de este caso)"""
+    size_name, w, h, n_boxes, mode, repeat, work = case
+    cv2.setNumThreads(1)
+    img_path, lbl_path = os.path.join(work, "foto.jpg"), os.path.join(work, "foto.txt")
+    with open(img_path, "rb") as f:
+        image_bytes = f.read()
+
+    times, n_tiles, out_bytes, label_hash, errors = [], 0, 0, None, []
+    for _ in range(repeat):
+        out_img, out_lbl = os.path.join(work, "images"), os.path.join(work, "labels")
+        shutil.rmtree(out_img, ignore_errors=True)
+        shutil.rmtree(out_lbl, ignore_errors=True)
+        os.makedirs(out_img)
+        os.makedirs(out_lbl)
+
+        start = time.perf_counter()
+        if mode == "training":
+            files = process_tiling(img_path, out_img, out_lbl, lbl_path, filename_prefix="foto")
+            n_tiles = len(files)
+        else:
+            tiles = list(iter_tiles(image_bytes, filename_prefix="foto"))
+            n_tiles = len(tiles)
+        times.append(time.perf_counter() - start)
+
+    if mode == "training":
+        out_bytes = dir_bytes(out_img) + dir_bytes(out_lbl)
+        digest = hashlib.blake2b(digest_size=16)
+        for name in sorted(os.listdir(out_lbl)):
+            with open(os.path.join(out_lbl, name), "rb") as f:
+                digest.update(name.encode() + b"\0" + f.read())
+        label_hash = digest.hexdigest()
+        errors = check_label_round_trip(load_yolo_boxes(lbl_path, w, h), out_lbl, w, h)
+    else:
+        out_bytes = sum(len(data) for _, _, data in tiles)
+
+    best = min(times)
+    return {
+        "case": f"{mode}/{size_name}/{n_boxes}",
+        "ms_per_image": best * 1000,
+        "tiles_per_s": n_tiles / best,
+        "peak_rss_mb": peak_rss_mb(),
+        "bytes": out_bytes,
+        "tiles": n_tiles,
+        "label_hash": label_hash,
+        "errors": errors,
+    }
+
+def run(sizes, box_counts, repeat):
+    cases = [
+        (size_name, w, h, n, mode)
+        for mode in ("training", "inference")
+        for size_name, w, h in sizes
+        for n in (box_counts if mode == "training" else [0])
+    ]
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for size_name, w, h, n, mode in cases:
+        work = tempfile.mkdtemp(prefix="bench_tiling_")
+        try:
+            prepare_inputs(work, w, h, n)
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                results.append(pool.submit(run_case, (size_name, w, h, n, mode, repeat, work)).result())
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+        r = results[-1]
+        status = "OK" if not r["errors"] else f"{len(r['errors'])} ERRORES"
+        print(f"{r['case']:<28} {r['ms_per_image']:>9.1f} ms {r['tiles_per_s']:>8.1f} tiles/s "
+              f"{r['peak_rss_mb']:>8.1f} MB {r['bytes'] / 1e6:>8.2f} MB  etiquetas: {status}")
+        for error in r["errors"][:5]:
+            print(f"    ❌ {error}")
+    return results
+
+def compare(results, baseline_path, tolerance):
+    """Falla si un caso es más lento que la línea base (+tolerancia) o si cambian las etiquetas"""
+    with open(baseline_path) as f:
+        baseline = {r["case"]: r for r in json.load(f)}
+    problems = []
+    for r in results:
+        base = baseline.get(r["case"])
+        if base is None:
+            continue
+        if r["ms_per_image"] > base["ms_per_image"] * (1 + tolerance):
+            problems.append(f"{r['case']}: {r['ms_per_image']:.1f} ms vs {base['ms_per_image']:.1f} ms de la línea base")
+        if r["label_hash"] != base["label_hash"]:
+            problems.append(f"{r['case']}: las etiquetas cambiaron respecto a la línea base")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="Solo 12 MP (apaisada y vertical), 0 y 2000 cajas")
+    parser.add_argument("--repeat", type=int, default=3, help="Se reporta el mejor de N")
+    parser.add_argument("--save-baseline", help="Guarda los resultados como línea base (JSON)")
+    parser.add_argument("--compare", help="Compara contra una línea base guardada")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento de tiempo admitido (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    sizes, box_counts = (QUICK_SIZES, QUICK_BOX_COUNTS) if args.quick else (SIZES, BOX_COUNTS)
+    results = run(sizes, box_counts, args.repeat)
+    failed = any(r["errors"] for r in results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Línea base guardada en {args.save_baseline}")
+    if args.compare:
+        problems = compare(results, args.compare, args.tolerance)
+        for problem in problems:
+            print(f"⚠️ {problem}")
+        failed = failed or bool(problems)
+
+    print("❌ Regresión detectada" if failed else "✅ Sin regresiones")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Compara configuraciones del planificador de tiles (src/common/tiling.plan_tiling).
+
+Por cada configuración reporta tiles por imagen, píxeles que entran al modelo y
+recall. Sin modelo el recall es un proxy a partir de las etiquetas: una caja
+cuenta como detectable si entra entera en algún tile y, al reducir ese tile a
+imgsz, su lado menor sigue midiendo al menos --min-model-px. Con --model se
+infiere de verdad (slice-and-merge) y se mide el recall con IoU >= 0.5.
+
+Ejemplos:
+  python sandbox/bench_tiling_plan.py                       # fotos sintéticas 12/24/48 MP
+  python sandbox/bench_tiling_plan.py --images data/raw/images --labels data/raw/labels
+  python sandbox/bench_tiling_plan.py --images ... --labels ... --model best.pt
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.common.tiling import plan_tiling, compute_tile_grid, load_yolo_boxes
+from src.common.detections import shift_to_image, concat_detections, merge_detections, pairwise_overlap
+
+# Configuraciones por defecto: (nombre, kwargs de plan_tiling)
+DEFAULT_SETTINGS = [
+    ("fixed", {"mode": "fixed"}),
+    ("adaptive min24", {"mode": "adaptive", "min_object_px": 24}),
+    ("adaptive min16", {"mode": "adaptive", "min_object_px": 16}),
+    ("adaptive min32", {"mode": "adaptive", "min_object_px": 32}),
+]
+SYNTHETIC_SIZES = [(4000, 3000), (3000, 4000), (5657, 4243), (8000, 6000)]
+FULLY_VISIBLE = 0.95
+
+def synthetic_dataset(n_per_size=5, seed=0):
+    """(nombre, w, h, cajas (N,5), None) con objetos de 10 a 150 px, sin imagen"""
+    rng = np.random.default_rng(seed)
+    for w, h in SYNTHETIC_SIZES:
+        for i in range(n_per_size):
+            n = int(rng.integers(50, 400))
+            side = rng.uniform(10, 150, n)
+            x1, y1 = rng.uniform(0, w - side), rng.uniform(0, h - side)
+            boxes = np.stack([rng.integers(0, 2, n), x1, y1, x1 + side, y1 + side], axis=1)
+            yield f"synth_{w}x{h}_{i}", w, h, boxes, None
+
+def folder_dataset(images_dir, labels_dir):
+    for name in sorted(os.listdir(images_dir)):
+        if not name.lower().endswith((".jpg", ".jpeg", ".png")):
+            continue
+        img_path = os.path.join(images_dir, name)
+        img = cv2.imread(img_path)
+        if img is None:
+            continue
+        h, w = img.shape[:2]
+        lbl_path = os.path.join(labels_dir, name.rsplit(".", 1)[0] + ".txt") if labels_dir else None
+        yield name, w, h, load_yolo_boxes(lbl_path, w, h), img_path
+
+def proxy_recall(boxes, tiles, imgsz, min_model_px):
+    """Cajas que quedan enteras en algún tile con tamaño suficiente a la entrada del modelo"""
+    if len(boxes) == 0:
+        return 0, 0
+    t = np.asarray([tile[2:] for tile in tiles], dtype=np.float64)[:, None, :]   # (T, 1, 4)
+    b = boxes[None, :, 1:5]                                                      # (1, N, 4)
+    iw = np.minimum(b[..., 2], t[..., 2]) - np.maximum(b[..., 0], t[..., 0])
+    ih = np.minimum(b[..., 3], t[..., 3]) - np.maximum(b[..., 1], t[..., 1])
+    area = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    visible = np.clip(iw, 0, None) * np.clip(ih, 0, None) / np.maximum(area, 1e-9)
+
+    tile_side = np.maximum(t[..., 2] - t[..., 0], t[..., 3] - t[..., 1])
+    scale = np.minimum(imgsz / tile_side, 1.0)
+    min_side = np.minimum(b[..., 2] - b[..., 0], b[..., 3] - b[..., 1])
+    ok = (visible >= FULLY_VISIBLE) & (min_side * scale >= min_model_px)
+    return int(ok.any(axis=0).sum()), len(boxes)
+
+def load_predictor(model_path):
+    """Devuelve predict(lista de imágenes BGR) -> lista de dicts xyxy/conf/cls"""
+    if model_path.endswith(".onnx"):
+        from src.sagemaker_training.yolo_task.onnx_backend import ExportedYolo
+        model = ExportedYolo(model_path)
+        return lambda images: model.predict_arrays(images, conf=0.25)
+
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+
+    def predict(images):
+        return [
+            {"xyxy": r.boxes.xyxy.cpu().numpy(), "conf": r.boxes.conf.cpu().numpy(), "cls": r.boxes.cls.cpu().numpy().astype(int)}
+            for r in model(images, conf=0.25, verbose=False)
+        ]
+    return predict
+
+def model_recall(predict, img_path, boxes, tiles, batch_size=16, iou=0.5):
+    """Slice-and-merge igual que infer_yolo.predict_image y recall contra las etiquetas"""
+    img = cv2.imread(img_path)
+    crops = [(tile[2:], img[tile[3]:tile[5], tile[2]:tile[4]]) for tile in tiles]
+    shifted = []
+    for start in range(0, len(crops), batch_size):
+        batch = crops[start:start + batch_size]
+        preds = predict([crop for _, crop in batch])
+        shifted.extend(shift_to_image(pred, box) for (box, _), pred in zip(batch, preds))
+    dets = merge_detections(concat_detections(shifted), 0.5, metric="ios")
+    if len(boxes) == 0:
+        return 0, 0
+
+    found = 0
+    for cls in np.unique(boxes[:, 0]):
+        gt = boxes[boxes[:, 0] == cls, 1:5]
+        pred = dets["xyxy"][dets["cls"] == cls]
+        if len(pred) == 0:
+            continue
+        overlap = pairwise_overlap(np.concatenate([gt, pred]).astype(np.float32))[:len(gt), len(gt):]
+        found += int((overlap.max(axis=1) >= iou).sum())
+    return found, len(boxes)
+
+def run(dataset, settings, imgsz, min_model_px, predict=None):
+    rows = []
+    data = list(dataset)
+    for label, kwargs in settings:
+        n_tiles, pixels, found, total, elapsed = 0, 0, 0, 0, 0.0
+        for name, w, h, boxes, img_path in data:
+            plan = plan_tiling(w, h, imgsz=imgsz, **kwargs)
+            _, _, tiles = compute_tile_grid(w, h, plan)
+            n_tiles += len(tiles)
+            pixels += len(tiles) * imgsz * imgsz
+            if predict is not None and img_path:
+                start = time.perf_counter()
+                f, t = model_recall(predict, img_path, boxes, tiles)
+                elapsed += time.perf_counter() - start
+            else:
+                f, t = proxy_recall(boxes, tiles, imgsz, min_model_px)
+            found, total = found + f, total + t
+        rows.append({
+            "setting": label,
+            "tiles_per_image": n_tiles / max(len(data), 1),
+            "model_mpix_per_image": pixels / max(len(data), 1) / 1e6,
+            "recall": found / total if total else float("nan"),
+            "s_per_image": elapsed / max(len(data), 1) if predict is not None else None,
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Carpeta de fotos originales (por defecto: sintéticas)")
+    parser.add_argument("--labels", help="Carpeta de etiquetas YOLO de esas fotos")
+    parser.add_argument("--model", help="Modelo .pt o .onnx para medir recall real")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--min-model-px", type=float, default=8, help="Lado mínimo útil a la entrada del modelo (proxy)")
+    args = parser.parse_args()
+
+    dataset = folder_dataset(args.images, args.labels) if args.images else synthetic_dataset()
+    predict = load_predictor(args.model) if args.model else None
+    rows = run(dataset, DEFAULT_SETTINGS, args.imgsz, args.min_model_px, predict)
+
+    kind = "modelo" if predict else "proxy etiquetas"
+    print(f"\n{'configuración':<18} {'tiles/img':>10} {'MPix modelo':>12} {'recall (' + kind + ')':>24}")
+    for row in rows:
+        extra = f"  {row['s_per_image']:.2f} s/img" if row["s_per_image"] is not None else ""
+        print(f"{row['setting']:<18} {row['tiles_per_image']:>10.1f} {row['model_mpix_per_image']:>12.1f} {row['recall']:>24.3f}{extra}")
+
+if __name__ == "__main__":
+    main()
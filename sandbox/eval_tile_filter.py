@@ -0,0 +1,106 @@
+"""
+Evaluación offline del filtro de fondo (src/aws_lambda/inference_coordinator/filter_logic.py)
+sobre un set de tiles etiquetados (formato YOLO: images/ + labels/, como el de dataset_tiling).
+
+Por cada configuración de umbrales reporta:
+  - tasa de descarte total y sobre tiles vacíos (lo que se ahorra)
+  - tiles con objetos descartados y cajas perdidas (pérdida de recall, cota superior:
+    toda caja en un tile descartado se da por perdida)
+  - ms por tile del filtro
+Con --sweep barre cada umbral por separado dejando el resto en su valor actual.
+
+Ejemplos:
+  python sandbox/eval_tile_filter.py --images data/tiles/images/val --labels data/tiles/labels/val
+  python sandbox/eval_tile_filter.py --images ... --labels ... --sweep
+  python sandbox/eval_tile_filter.py --images ... --labels ... --min-green 0.05 --show-lost 20
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.aws_lambda.inference_coordinator.filter_logic import tile_features, background_reason, DEFAULT_THRESHOLDS
+
+SWEEPS = {
+    'min_sharpness': [0, 5, 10, 15, 25, 40, 60],
+    'min_green': [0, 0.005, 0.01, 0.02, 0.05, 0.1],
+    'max_sky': [1.01, 0.98, 0.95, 0.9, 0.8],
+    'min_contrast': [0, 6, 12, 20, 30],
+}
+
+def load_tiles(images_dir, labels_dir):
+    """(nombre, features, cajas en el tile, ms) por tile"""
+    rows = []
+    for name in sorted(os.listdir(images_dir)):
+        if not name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+            continue
+        img = cv2.imread(os.path.join(images_dir, name))
+        if img is None:
+            continue
+        start = time.perf_counter()
+        features = tile_features(img)
+        ms = (time.perf_counter() - start) * 1000
+        lbl_path = os.path.join(labels_dir, name.rsplit('.', 1)[0] + '.txt')
+        n_boxes = 0
+        if os.path.exists(lbl_path):
+            with open(lbl_path) as f:
+                n_boxes = sum(1 for line in f if line.strip())
+        rows.append((name, features, n_boxes, ms))
+    return rows
+
+def evaluate(tiles, thresholds):
+    reasons = [background_reason(features, thresholds) for _, features, _, _ in tiles]
+    skipped = np.array([r is not None for r in reasons])
+    boxes = np.array([n for _, _, n, _ in tiles])
+    empty = boxes == 0
+    return {
+        'skip_rate': skipped.mean() if len(tiles) else 0.0,
+        'empty_skip_rate': skipped[empty].mean() if empty.any() else 0.0,
+        'lost_tiles': int((skipped & ~empty).sum()),
+        'box_loss': boxes[skipped].sum() / max(boxes.sum(), 1),
+        'lost': [(tiles[i][0], reasons[i], int(boxes[i])) for i in np.flatnonzero(skipped & ~empty)],
+    }
+
+def print_row(label, r):
+    print(f"{label:<28} {r['skip_rate']:>9.1%} {r['empty_skip_rate']:>12.1%} {r['lost_tiles']:>11} {r['box_loss']:>12.2%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="Carpeta de tiles")
+    parser.add_argument("--labels", help="Carpeta de etiquetas YOLO (por defecto: ../labels junto a images)")
+    for name, value in DEFAULT_THRESHOLDS.items():
+        parser.add_argument("--" + name.replace('_', '-'), type=float, default=value)
+    parser.add_argument("--sweep", action="store_true", help="Barrer cada umbral por separado")
+    parser.add_argument("--show-lost", type=int, default=10, help="Tiles con objetos descartados a listar")
+    args = parser.parse_args()
+
+    labels_dir = args.labels or os.path.join(os.path.dirname(os.path.normpath(args.images)), "labels")
+    thresholds = {name: getattr(args, name) for name in DEFAULT_THRESHOLDS}
+
+    cv2.setNumThreads(1)
+    tiles = load_tiles(args.images, labels_dir)
+    if not tiles:
+        sys.exit(f"No hay tiles en {args.images}")
+    n_empty = sum(1 for _, _, n, _ in tiles if n == 0)
+    print(f"{len(tiles)} tiles ({n_empty} vacíos, {n_empty / len(tiles):.0%}) | "
+          f"filtro: {np.mean([ms for *_, ms in tiles]):.2f} ms/tile")
+
+    print(f"\n{'configuración':<28} {'descarte':>9} {'desc. vacíos':>12} {'tiles perd.':>11} {'cajas perd.':>12}")
+    result = evaluate(tiles, thresholds)
+    print_row("actual", result)
+    if args.sweep:
+        for name, values in SWEEPS.items():
+            for value in values:
+                print_row(f"{name}={value}", evaluate(tiles, {**thresholds, name: value}))
+
+    if result['lost']:
+        print(f"\nTiles con objetos que se descartarían ({len(result['lost'])}):")
+        for name, reason, n in result['lost'][:args.show_lost]:
+            print(f" - {name}: {reason} ({n} cajas)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Simulador local del pipeline completo para pruebas de carga:
+
+    uploads/ (raw) --> ingest_trigger
+                   \\-> tiler --> tiles/ (processed) --> inference_cv --> results/ (output)
+
+Ejecuta los handlers REALES contra S3/DynamoDB en memoria (moto) y reemplaza las
+notificaciones de S3 por colas locales: cada etapa tiene su propio pool de
+"contenedores" (hilos) con la concurrencia indicada, igual que la concurrencia
+reservada de cada Lambda en infrastructure/template.yaml.
+
+Por etapa reporta invocaciones, errores, latencia p50/p95/p99, espera en cola
+p50/p95, máxima cola y throughput; y la latencia de punta a punta por foto
+(subida -> último tile inferido).
+
+Notas:
+- Los hilos comparten el estado de los módulos: equivale a contenedores ya
+  calientes (el modelo se carga una vez). El INIT de la 1a invocación se ve en
+  la latencia de la primera invocación de cada etapa.
+- --fake-model reemplaza el modelo por uno que duerme --fake-model-ms por tile
+  (sin GPU/ultralytics); sin esa opción se usa el modelo de --model (.pt/.onnx).
+
+Ejemplos:
+  python sandbox/pipeline_sim.py --fake-model --photos 50 --rate 10
+  python sandbox/pipeline_sim.py --fake-model --photos 200 --burst --tiler-concurrency 4 --inference-concurrency 32
+  python sandbox/pipeline_sim.py --model best.onnx --backend onnx --photos 20
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+RAW_BUCKET = "sim-raw"
+PROCESSED_BUCKET = "sim-processed"
+OUTPUT_BUCKET = "sim-output"
+ARTIFACTS_BUCKET = "sim-artifacts"
+TABLE_NAME = "sim-tracking"
+
+def configure_env(args):
+    """Variables de entorno de template.yaml (antes de importar cualquier handler)"""
+    os.environ.update({
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "sim",
+        "AWS_SECRET_ACCESS_KEY": "sim",
+        "PROCESSED_BUCKET": PROCESSED_BUCKET,
+        "OUTPUT_BUCKET": OUTPUT_BUCKET,
+        "DYNAMO_TABLE": TABLE_NAME,
+        "INFERENCE_BACKEND": args.backend,
+        "OVERLAY_MODE": args.overlay_mode,
+        "MODEL_CACHE_DIR": "/tmp/sim_models",
+        "FALLBACK_MODEL_URI": f"s3://{ARTIFACTS_BUCKET}/model_legacy/model.pt",
+    })
+    if args.fake_model:
+        # El modelo falso se inyecta a mano: sin prefetch en segundo plano
+        os.environ["MODEL_PREFETCH"] = "0"
+
+# =========================================================
+# MODELO FALSO
+# =========================================================
+
+class FakeModel:
+    """Mismo contrato que ExportedYolo: predict_arrays(images, conf) -> lista de dicts"""
+
+    names = {0: "flor", 1: "arandano"}
+
+    def __init__(self, ms_per_image, boxes_per_image=20, seed=0):
+        self.ms_per_image = ms_per_image
+        self.boxes_per_image = boxes_per_image
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+
+    def predict_arrays(self, images, conf=0.25):
+        time.sleep(self.ms_per_image * len(images) / 1000)
+        outputs = []
+        with self.lock:
+            for img in images:
+                h, w = img.shape[:2]
+                n = int(self.rng.poisson(self.boxes_per_image))
+                xy = self.rng.uniform(0, [w - 40, h - 40], (n, 2))
+                wh = self.rng.uniform(10, 40, (n, 2))
+                outputs.append({
+                    "xyxy": np.hstack([xy, xy + wh]).astype(np.float32),
+                    "conf": self.rng.uniform(conf, 1, n).astype(np.float32),
+                    "cls": self.rng.integers(0, 2, n),
+                })
+        return outputs
+
+def install_fake_model(ms_per_image):
+    from src.sagemaker_training.yolo_task import infer_yolo
+    model = FakeModel(ms_per_image)
+    infer_yolo.INFERENCE_BACKEND = "onnx"   # predict_arrays delega en model.predict_arrays
+    infer_yolo.import_runtime = lambda: None
+    infer_yolo.load_model = lambda: model
+
+# =========================================================
+# ETAPAS
+# =========================================================
+
+class Stage:
+    """Un Lambda simulado: pool de contenedores + métricas de cola y latencia"""
+
+    def __init__(self, name, handler, concurrency, on_done=None):
+        self.name = name
+        self.handler = handler
+        self.on_done = on_done
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=name)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.max_queue = 0
+        self.waits, self.latencies, self.errors = [], [], []
+        self.first_start = self.last_end = None
+
+    def submit(self, event, context=None):
+        with self.lock:
+            self.pending += 1
+            self.max_queue = max(self.max_queue, self.pending)
+        return self.pool.submit(self._run, event, context, time.perf_counter())
+
+    def _run(self, event, context, queued_at):
+        start = time.perf_counter()
+        with self.lock:
+            self.pending -= 1
+            self.first_start = start if self.first_start is None else self.first_start
+        error, result = None, None
+        try:
+            result = self.handler(event, None)
+        except Exception as e:
+            error = e
+        end = time.perf_counter()
+        with self.lock:
+            self.waits.append(start - queued_at)
+            self.latencies.append(end - start)
+            self.last_end = end
+            if error is not None:
+                self.errors.append(f"{type(error).__name__}: {error}")
+        if self.on_done is not None:
+            self.on_done(event, context, result, error)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+    def report(self):
+        lat = np.array(self.latencies) * 1000
+        wait = np.array(self.waits) * 1000
+        span = (self.last_end - self.first_start) if self.latencies else 0
+        return {
+            "stage": self.name,
+            "invocations": len(lat),
+            "errors": len(self.errors),
+            "p50_ms": float(np.percentile(lat, 50)) if len(lat) else 0,
+            "p95_ms": float(np.percentile(lat, 95)) if len(lat) else 0,
+            "p99_ms": float(np.percentile(lat, 99)) if len(lat) else 0,
+            "wait_p50_ms": float(np.percentile(wait, 50)) if len(wait) else 0,
+            "wait_p95_ms": float(np.percentile(wait, 95)) if len(wait) else 0,
+            "max_queue": self.max_queue,
+            "per_s": len(lat) / span if span else 0,
+        }
+
+def s3_event(bucket, keys):
+    return {"Records": [{"s3": {"bucket": {"name": bucket}, "object": {"key": key}}} for key in keys]}
+
+def synthetic_photos(n_variants, w, h):
+    """Unas pocas fotos codificadas que se reutilizan (generarlas no debe ser el cuello de botella)"""
+    import cv2
+    rng = np.random.default_rng(0)
+    photos = []
+    for _ in range(n_variants):
+        base = cv2.resize(rng.integers(0, 256, (h // 64, w // 64, 3), dtype=np.uint8), (w, h))
+        photos.append(cv2.imencode(".jpg", cv2.add(base, rng.integers(0, 12, (h, w, 3), dtype=np.uint8)))[1].tobytes())
+    return photos
+
+# =========================================================
+# SIMULACIÓN
+# =========================================================
+
+def create_resources(args):
+    import boto3
+    s3 = boto3.client("s3")
+    for bucket in (RAW_BUCKET, PROCESSED_BUCKET, OUTPUT_BUCKET, ARTIFACTS_BUCKET):
+        s3.create_bucket(Bucket=bucket)
+    boto3.client("dynamodb").create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{"AttributeName": "media_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "media_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    if not args.fake_model:
+        # Registro de modelos (LATEST_YOLO_MODEL) apuntando al modelo local; el registro
+        # siempre guarda el .pt y model_cache deriva el .onnx/.xml según el backend
+        pt_key = "models/sim/model.pt"
+        s3.upload_file(args.model, ARTIFACTS_BUCKET, "models/sim/model" + os.path.splitext(args.model)[1])
+        boto3.resource("dynamodb").Table(TABLE_NAME).put_item(Item={
+            "media_id": "LATEST_YOLO_MODEL", "model_version": "sim",
+            "s3_path": f"s3://{ARTIFACTS_BUCKET}/{pt_key}",
+        })
+    return s3
+
+def run(args):
+    s3 = create_resources(args)
+    if args.fake_model:
+        install_fake_model(args.fake_model_ms)
+
+    from src.aws_lambda.ingest_trigger import app as ingest
+    from src.aws_lambda.inference_coordinator import tiler
+    from src.aws_lambda.inference_cv import inference
+
+    uploaded_at, remaining, finished_at = {}, {}, {}
+    state_lock = threading.Lock()
+
+    def inference_done(event, prefix, result, error):
+        with state_lock:
+            remaining[prefix] -= len(event["Records"])
+            if remaining[prefix] <= 0:
+                finished_at[prefix] = time.perf_counter()
+
+    inference_stage = Stage("inference_cv", inference.lambda_handler, args.inference_concurrency, inference_done)
+
+    def tiler_done(event, prefix, result, error):
+        # Notificación S3 de cada tile subido -> inferencia (en lotes si --inference-batch > 1)
+        if error is not None:
+            return
+        paginator = s3.get_paginator("list_objects_v2")
+        keys = [o["Key"] for page in paginator.paginate(Bucket=PROCESSED_BUCKET, Prefix=f"tiles/{prefix}/")
+                for o in page.get("Contents", [])]
+        with state_lock:
+            remaining[prefix] = len(keys)
+            if not keys:   # todos los tiles descartados por el filtro (TILE_FILTER=skip)
+                finished_at[prefix] = time.perf_counter()
+        for start in range(0, len(keys), args.inference_batch):
+            inference_stage.submit(s3_event(PROCESSED_BUCKET, keys[start:start + args.inference_batch]), prefix)
+
+    ingest_stage = Stage("ingest_trigger", ingest.lambda_handler, args.ingest_concurrency)
+    tiler_stage = Stage("tiler", tiler.lambda_handler, args.tiler_concurrency, tiler_done)
+
+    photos = synthetic_photos(args.variants, args.width, args.height)
+    interval = 0 if args.burst else 1 / args.rate
+    print(f"🚜 Subiendo {args.photos} fotos {args.width}x{args.height} "
+          f"({'ráfaga' if args.burst else f'{args.rate}/s'})...")
+
+    wall_start = time.perf_counter()
+    for i in range(args.photos):
+        prefix = f"sim_{i:05d}"
+        key = f"uploads/{prefix}.jpg"
+        s3.put_object(Bucket=RAW_BUCKET, Key=key, Body=random.choice(photos))
+        uploaded_at[prefix] = time.perf_counter()
+        event = s3_event(RAW_BUCKET, [key])
+        ingest_stage.submit(event)
+        tiler_stage.submit(event, prefix)
+        if interval:
+            time.sleep(interval)
+
+    # Las etapas se cierran en orden: la inferencia recibe trabajo hasta que termina el tiler
+    ingest_stage.shutdown()
+    tiler_stage.shutdown()
+    inference_stage.shutdown()
+    wall = time.perf_counter() - wall_start
+
+    stages = [ingest_stage, tiler_stage, inference_stage]
+    e2e = np.array([finished_at[p] - uploaded_at[p] for p in finished_at]) * 1000
+    return {
+        "photos": args.photos,
+        "completed": len(finished_at),
+        "wall_s": wall,
+        "photos_per_s": len(finished_at) / wall if wall else 0,
+        "e2e_p50_ms": float(np.percentile(e2e, 50)) if len(e2e) else 0,
+        "e2e_p95_ms": float(np.percentile(e2e, 95)) if len(e2e) else 0,
+        "stages": [stage.report() for stage in stages],
+        "errors": {stage.name: stage.errors[:5] for stage in stages if stage.errors},
+    }
+
+def print_report(report):
+    print(f"\n{'etapa':<16} {'invoc':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'cola p50':>9} {'cola p95':>9} {'cola max':>9} {'inv/s':>7}")
+    for s in report["stages"]:
+        print(f"{s['stage']:<16} {s['invocations']:>6} {s['errors']:>4} {s['p50_ms']:>9.0f} {s['p95_ms']:>9.0f} "
+              f"{s['p99_ms']:>9.0f} {s['wait_p50_ms']:>9.0f} {s['wait_p95_ms']:>9.0f} {s['max_queue']:>9} {s['per_s']:>7.1f}")
+    print(f"\nFotos completas: {report['completed']}/{report['photos']} en {report['wall_s']:.1f}s "
+          f"({report['photos_per_s']:.2f} fotos/s) | punta a punta p50 {report['e2e_p50_ms']:.0f} ms, "
+          f"p95 {report['e2e_p95_ms']:.0f} ms")
+    for stage, errors in report["errors"].items():
+        for error in errors:
+            print(f"  ❌ {stage}: {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=5, help="Fotos por segundo")
+    parser.add_argument("--burst", action="store_true", help="Subir todas las fotos de golpe")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--variants", type=int, default=3, help="Fotos sintéticas distintas que se reutilizan")
+    parser.add_argument("--ingest-concurrency", type=int, default=4)
+    parser.add_argument("--tiler-concurrency", type=int, default=4)
+    parser.add_argument("--inference-concurrency", type=int, default=16)
+    parser.add_argument("--inference-batch", type=int, default=1, help="Tiles por evento de inferencia (1 = S3 directo)")
+    parser.add_argument("--fake-model", action="store_true", help="Modelo falso (sin ultralytics/onnx)")
+    parser.add_argument("--fake-model-ms", type=float, default=40, help="ms por tile del modelo falso")
+    parser.add_argument("--model", help="Modelo real (.pt o .onnx) a registrar como LATEST_YOLO_MODEL")
+    parser.add_argument("--backend", default="torch", help="INFERENCE_BACKEND: torch | onnx | openvino")
+    parser.add_argument("--overlay-mode", default="off", help="OVERLAY_MODE de la inferencia")
+    parser.add_argument("--json", help="Guardar el reporte en este archivo")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los prints de los handlers")
+    args = parser.parse_args()
+    if not args.fake_model and not args.model:
+        parser.error("Indicar --fake-model o --model")
+
+    configure_env(args)
+    from moto import mock_aws
+    import contextlib
+    import io
+
+    with mock_aws():
+        # Los handlers imprimen por cada registro: se silencian salvo --verbose
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            report = run(args)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from src.common.metrics import emit_metrics
+
+# Filtro previo a la inferencia: descarta tiles de fondo (cielo, suelo, desenfocados)
+# antes de subirlos, para no pagar YOLO completo por ellos.
+#   off  -> no se calcula nada (por defecto)
+#   log  -> se calcula y se emiten las métricas, pero se suben todos (modo sombra)
+#   skip -> los tiles de fondo no se suben y quedan listados en la geometría
+TILE_FILTER = os.environ.get('TILE_FILTER', 'off').lower()
+
+# Lado (px) al que se reduce el tile para calcular las métricas
+FILTER_SIDE = int(os.environ.get('TILE_FILTER_SIDE', 128))
+# Varianza del Laplaciano (sobre el tile reducido) por debajo de la cual está desenfocado
+MIN_SHARPNESS = float(os.environ.get('TILE_FILTER_MIN_SHARPNESS', 15))
+# Fracción mínima de píxeles de vegetación (exceso de verde)
+MIN_GREEN = float(os.environ.get('TILE_FILTER_MIN_GREEN', 0.02))
+# Fracción máxima de cielo (píxeles claros con azul dominante)
+MAX_SKY = float(os.environ.get('TILE_FILTER_MAX_SKY', 0.9))
+# Rango mínimo de grises (percentil 98 - percentil 2 del histograma): tiles planos
+MIN_CONTRAST = float(os.environ.get('TILE_FILTER_MIN_CONTRAST', 12))
+
+# Umbral de exceso de verde (2g - r - b, cromaticidades normalizadas) de un píxel de hoja
+EXG_THRESHOLD = 0.05
+SKY_MIN_BRIGHTNESS = 150
+
+DEFAULT_THRESHOLDS = {
+    'min_sharpness': MIN_SHARPNESS,
+    'min_green': MIN_GREEN,
+    'max_sky': MAX_SKY,
+    'min_contrast': MIN_CONTRAST,
+}
+
+def tile_features(crop, side=FILTER_SIDE):
+    """
+    Métricas baratas de un tile BGR (todo vectorizado sobre el tile reducido a `side`):
+    - sharpness: varianza del Laplaciano en grises
+    - green: fracción de píxeles con exceso de verde (hojas)
+    - sky: fracción de píxeles claros con el azul como canal dominante
+    - contrast: percentil 98 - percentil 2 del histograma de grises
+    """
+    h, w = crop.shape[:2]
+    scale = side / max(h, w)
+    small = cv2.resize(crop, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA) \
+        if scale < 1 else crop
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    bgr = small.astype(np.float32)
+    b, g, r = bgr[..., 0], bgr[..., 1], bgr[..., 2]
+    total = b + g + r + 1e-6
+    exg = (2 * g - r - b) / total
+
+    cdf = np.cumsum(np.bincount(gray.ravel(), minlength=256)) / gray.size
+    p2, p98 = np.searchsorted(cdf, 0.02), np.searchsorted(cdf, 0.98)
+
+    return {
+        'sharpness': float(cv2.Laplacian(gray, cv2.CV_32F).var()),
+        'green': float((exg > EXG_THRESHOLD).mean()),
+        'sky': float(((b >= g) & (b > r) & (gray >= SKY_MIN_BRIGHTNESS)).mean()),
+        'contrast': float(p98 - p2),
+    }
+
+def background_reason(features, thresholds=None):
+    """Motivo por el que el tile es fondo ('flat', 'sky', 'blur', 'no_vegetation') o None si se infiere"""
+    t = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    if features['contrast'] < t['min_contrast']:
+        return 'flat'
+    if features['sky'] > t['max_sky']:
+        return 'sky'
+    if features['sharpness'] < t['min_sharpness']:
+        return 'blur'
+    if features['green'] < t['min_green']:
+        return 'no_vegetation'
+    return None
+
+def filter_tiles(crops, thresholds=None):
+    """
+    Evalúa los tiles (base_name, tile_box, crop) de iter_tile_crops.
+    Devuelve (nombres de tiles de fondo, estadísticas para las métricas).
+    """
+    skipped, reasons, n, elapsed = set(), {}, 0, 0.0
+    for base_name, _, crop in crops:
+        start = time.perf_counter()
+        reason = background_reason(tile_features(crop), thresholds)
+        elapsed += time.perf_counter() - start
+        n += 1
+        if reason is not None:
+            skipped.add(base_name)
+            reasons[reason] = reasons.get(reason, 0) + 1
+    return skipped, {'tiles': n, 'skipped': len(skipped), 'reasons': reasons, 'ms': elapsed * 1000}
+
+def emit_filter_metrics(stats, mode=TILE_FILTER):
+    """Tasa de descarte y tiempo por tile del filtro (EMF, una línea por imagen)"""
+    n = max(stats['tiles'], 1)
+    metrics = {
+        'TileFilterTiles': stats['tiles'],
+        'TileFilterSkipped': stats['skipped'],
+        'TileFilterSkipRate': stats['skipped'] / n,
+        'TileFilterMsPerTile': stats['ms'] / n,
+        **{f"TileFilterSkipped_{reason}": count for reason, count in stats['reasons'].items()},
+    }
+    units = {name: 'Count' for name in metrics}
+    units['TileFilterSkipRate'] = 'None'
+    units['TileFilterMsPerTile'] = 'Milliseconds'
+    return emit_metrics(metrics, dimensions={'Function': 'tiler', 'TileFilter': mode}, unit=units)
@@ -1,53 +1,49 @@
 import json
 import os
-import boto3
-import uuid
-import shutil
-import urllib.parse
-from datetime import datetime, timezone
-from src.common.tiling import process_tiling
+from src.common.tiling import (
+    iter_tiles, iter_tile_crops, decode_image, tile_manifest, geometry_key, image_size, plan_tiling, decode_reduction,
+    TILE_FORMAT, TILE_DECODE_REDUCE,
+)
+from src.common.s3_io import make_s3_client, upload_many, put_bytes, iter_s3_objects, get_bytes_parallel
+from src.common.tracking import media_id_for, update_status, now_iso
+from src.aws_lambda.inference_coordinator.filter_logic import TILE_FILTER, filter_tiles, emit_filter_metrics
 
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+# Numero de subidas simultaneas de tiles (y tamano del pool de conexiones)
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', 12))
+
+TILE_CONTENT_TYPES = {'jpg': 'image/jpeg', 'webp': 'image/webp', 'npy': 'application/octet-stream'}
+
+s3_client = make_s3_client(max_pool_connections=UPLOAD_CONCURRENCY)
 
 PROCESSED_BUCKET = os.environ.get('PROCESSED_BUCKET')
 TABLE_NAME = os.environ.get('DYNAMO_TABLE')
-table = dynamodb.Table(TABLE_NAME)
 
-def lambda_handler(event, context):
-    # Directorios temporales
-    local_input_path = "/tmp/input_image.jpg"
-    output_dir = "/tmp/tiles"
-    
-    if os.path.exists(output_dir):
-        shutil.rmtree(output_dir)
-    os.makedirs(output_dir)
+def base_attributes(source_bucket, source_key):
+    """Atributos que también escribe el ingest: se ponen solo si el item no los tiene"""
+    return {
+        's3_bucket': source_bucket,
+        's3_key': source_key,
+        'original_filename': source_key.split('/')[-1],
+        'upload_timestamp': now_iso(),
+    }
 
-    try:
-        record = event['Records'][0]
-        source_bucket = record['s3']['bucket']['name']
-        # Decodificar nombre (evita errores con espacios o tildes)
-        source_key = urllib.parse.unquote_plus(record['s3']['object']['key'], encoding='utf-8')
-        
-        print(f"Procesando: {source_key}")
-
-        # --- 1. REGISTRO MLOps (DynamoDB) ---
-        # Registramos que llegó la imagen y empezamos a procesar
-        media_id = str(uuid.uuid4())
-        timestamp = datetime.utcnow().isoformat()
-        
-        item = {
-            'media_id': media_id,
-            'original_filename': source_key,
-            's3_raw_bucket': source_bucket,
-            'upload_timestamp': timestamp,
-            'status': 'PROCESSING_TILING', # Estado intermedio
-            'ml_stage': 'preprocessing'
-        }
-        table.put_item(Item=item)
+def process_record(source_bucket, source_key, etag=None):
+    """
+    Tilea una imagen y sube sus tiles. Devuelve (resumen del registro, actualización
+    de estado pendiente): el estado final de todo el evento se escribe junto al final.
+    """
+    print(f"Procesando: {source_key}")
+
+    # --- 1. REGISTRO MLOps (DynamoDB) ---
+    # Mismo media_id que calcula el ingest para esta foto (bucket/key/ETag). No hay
+    # escritura inicial: el item lo crea el ingest y acá solo se escribe el resultado
+    media_id = media_id_for(source_bucket, source_key, etag)
 
+    try:
         # --- 2. DESCARGA ---
-        s3_client.download_file(source_bucket, source_key, local_input_path)
+        # Directo a memoria (fotos grandes: por rangos en paralelo). Sin /tmp: nada
+        # que limpiar y varios registros pueden procesarse a la vez en el contenedor
+        image_bytes = get_bytes_parallel(s3_client, source_bucket, source_key, max_workers=UPLOAD_CONCURRENCY)
 
         # --- 3. TILING (Lógica Compartida) ---
         # CORRECCIÓN: Usamos rsplit('.', 1) para quitar SOLO la extensión final (.jpg)
@@ -55,43 +51,129 @@ def lambda_handler(event, context):
         relative_path = source_key.replace("uploads/", "")
         filename = os.path.basename(relative_path)
         filename_prefix = filename.rsplit('.', 1)[0]
-        
-        generated_files = process_tiling(
-            img_path=local_input_path,
-            output_dir_img=output_dir,
-            output_dir_lbl=None, # Inferencia = Sin etiquetas
-            lbl_path=None,
-            filename_prefix=filename_prefix
+
+        # Tamaño y cuadrícula se deciden sobre la foto original; si el modelo igual
+        # va a reducir los tiles, se decodifica directamente a 1/2, 1/4 u 1/8
+        plan, scale, source_size = None, 1, None
+        if TILE_DECODE_REDUCE:
+            source_size = image_size(image_bytes)
+            plan = plan_tiling(*source_size)
+            scale = decode_reduction(*source_size, plan)
+
+        img = decode_image(image_bytes, reduce=scale)
+        if img is None:
+            raise ValueError(f"No se pudo decodificar la imagen {source_key}")
+
+        # --- 4. FILTRO DE FONDO ---
+        # Sobre los recortes en memoria (vistas, sin copiar ni codificar): en modo
+        # 'skip' los tiles de cielo/suelo/desenfocados no se suben ni se infieren
+        skipped = set()
+        if TILE_FILTER != 'off':
+            skipped, filter_stats = filter_tiles(iter_tile_crops(img, filename_prefix, plan))
+            emit_filter_metrics(filter_stats)
+            if TILE_FILTER != 'skip':
+                skipped = set()
+
+        # --- 5. GEOMETRÍA ---
+        # Se guarda ANTES que los tiles: cuando la inferencia recibe un tile ya
+        # puede ubicarlo en la foto original sin re-derivar nada del nombre.
+        # La orientación EXIF se aplica una sola vez (al decodificar) y el manifest
+        # ya guarda el tamaño orientado: nadie más necesita leer el EXIF.
+        h, w = img.shape[:2]
+        geometry = tile_manifest(filename_prefix, w, h, plan=plan, scale=scale, source_size=source_size)
+        # Los tiles descartados quedan registrados: la auditoría los cuenta como
+        # procesados y la reconstrucción los trata como tiles sin detecciones
+        geometry['skipped'] = sorted(skipped)
+        # Id de la tabla de tracking: la inferencia lo escribe en los resultados y la
+        # reconstrucción actualiza ese mismo item (el prefijo no es único entre carpetas)
+        geometry['media_id'] = media_id
+        put_bytes(
+            s3_client, PROCESSED_BUCKET, geometry_key(filename_prefix),
+            json.dumps(geometry).encode(), content_type='application/json'
+        )
+
+        # --- 6. SUBIDA DE TILES ---
+        # Los tiles se generan en memoria y se suben en paralelo directo a S3 (sin /tmp).
+        # Guardamos en carpeta con el nombre de la foto original dentro de tiles
+        tiles = (
+            (f"tiles/{filename_prefix}/{file_name}", tile_bytes)
+            for file_name, tile_box, tile_bytes in iter_tiles(img, filename_prefix=filename_prefix, plan=plan, skip=skipped)
         )
-        
-        # --- 4. SUBIDA DE TILES ---
-        uploaded_tiles = []
-        for file_path in generated_files:
-            file_name = os.path.basename(file_path)
-            # Guardamos en carpeta con el nombre de la foto original dentro de tiles
-            s3_dest_key = f"tiles/{filename_prefix}/{file_name}"
-            
-            s3_client.upload_file(file_path, PROCESSED_BUCKET, s3_dest_key)
-            uploaded_tiles.append(s3_dest_key)
-
-        # --- 5. ACTUALIZACIÓN MLOps ---
-        # Actualizamos DynamoDB para decir que terminamos
-        table.update_item(
-            Key={'media_id': media_id},
-            UpdateExpression="set #st = :s, total_tiles = :t, processed_timestamp = :pt",
-            ExpressionAttributeNames={'#st': 'status'},
-            ExpressionAttributeValues={
-                ':s': 'TILED_COMPLETE',
-                ':t': len(uploaded_tiles),
-                ':pt': datetime.now(timezone.utc).isoformat()
-            }
+        uploaded_tiles, failed_tiles = upload_many(
+            s3_client, PROCESSED_BUCKET, tiles,
+            max_workers=UPLOAD_CONCURRENCY, content_type=TILE_CONTENT_TYPES[TILE_FORMAT]
         )
 
-        return {
-            'statusCode': 200,
-            'body': json.dumps({'tiles_created': len(uploaded_tiles), 'media_id': media_id})
-        }
+        if not uploaded_tiles and not failed_tiles and not skipped:
+            raise ValueError(f"No se generaron tiles para {source_key}")
+        if failed_tiles:
+            raise RuntimeError(f"Fallaron {len(failed_tiles)} subidas de tiles: {failed_tiles[:3]}")
 
     except Exception as e:
-        print(f"Error critico: {str(e)}")
-        raise e
\ No newline at end of file
+        update_status([(
+            media_id,
+            {'status': 'TILING_FAILED', 'error_message': str(e)[:1000]},
+            base_attributes(source_bucket, source_key),
+        )], TABLE_NAME)
+        raise
+
+    # --- 7. ACTUALIZACIÓN MLOps ---
+    # Estado final (lo escribe lambda_handler para todo el evento: UpdateItems en paralelo)
+    status_update = (
+        media_id,
+        {
+            'status': 'TILED_COMPLETE',
+            'ml_stage': 'pending_inference',
+            'total_tiles': len(uploaded_tiles),
+            'skipped_tiles': len(skipped),
+            'processed_timestamp': now_iso(),
+            'image_width': geometry['width'],
+            'image_height': geometry['height'],
+            'grid': f"{geometry['rows']}x{geometry['cols']}",
+            'geometry_key': geometry_key(filename_prefix),
+        },
+        base_attributes(source_bucket, source_key),
+        ('error_message',),
+    )
+
+    return {'source_key': source_key, 'media_id': media_id, 'tiles_created': len(uploaded_tiles)}, status_update
+
+def lambda_handler(event, context):
+    # Procesamos TODOS los registros del evento (S3 directo o lote de SQS).
+    # Un registro que falla no detiene a los demas: se reporta al final.
+    processed, failures, status_updates = [], [], []
+    failed_messages = set()
+
+    for item_id, source_bucket, source_key, etag in iter_s3_objects(event):
+        try:
+            summary, status_update = process_record(source_bucket, source_key, etag)
+            processed.append(summary)
+            status_updates.append(status_update)
+        except Exception as e:
+            print(f"Error critico en {source_key}: {str(e)}")
+            failures.append({'source_key': source_key, 'error': str(e)})
+            if item_id is not None:
+                failed_messages.add(item_id)
+
+    # Estado final de todas las fotos OK (idempotente: si falla, reintentar el lote es seguro)
+    if status_updates:
+        update_status(status_updates, TABLE_NAME)
+
+    print(f"Tiling terminado: {len(processed)} OK, {len(failures)} con error")
+
+    # SQS: reintentar solo los mensajes fallidos (requiere ReportBatchItemFailures)
+    if failed_messages:
+        return {'batchItemFailures': [{'itemIdentifier': m} for m in sorted(failed_messages)]}
+
+    # S3 directo: lanzar error para que Lambda reintente / mande a la DLQ
+    if failures:
+        raise RuntimeError(f"Fallaron {len(failures)} registros: {json.dumps(failures)}")
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'tiles_created': sum(p['tiles_created'] for p in processed),
+            'media_ids': [p['media_id'] for p in processed],
+            'records': processed
+        })
+    }
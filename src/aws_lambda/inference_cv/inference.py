@@ -1,18 +1,164 @@
+import time
+_INIT_START = time.perf_counter()
+
 import json, os
-import boto3
-from src.sagemaker_training.yolo_task.infer_yolo import run_inference
+import hashlib
+import threading
+from datetime import datetime, timezone
+from src.common.metrics import timed, emit_metrics, INIT_PHASES
+
+# Solo imports livianos en el arranque: infer_yolo (cv2, ultralytics/onnxruntime)
+# se importa en segundo plano para no bloquear el INIT ni las peticiones inválidas
+with timed('imports_light'):
+    from src.common.s3_io import iter_s3_objects, make_s3_client, download_many, get_bytes, parse_s3_uri
+    from src.common.tracking import media_id_for
 
-s3_client = boto3.client('s3')
 PROCESSED_BUCKET = os.environ['PROCESSED_BUCKET']
+# Prefijo de las fotos originales (modo imagen completa)
+RAW_PREFIX = "uploads/"
+TILE_PREFIX = "tiles/"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Formatos de tile del tiler (tiling.TILE_EXTENSIONS; no se importa para no cargar cv2 en el INIT)
+TILE_EXTENSIONS = IMAGE_EXTENSIONS + ('.webp', '.npy')
+# Carga del modelo en segundo plano durante el INIT (0 = carga perezosa en la 1a petición)
+MODEL_PREFETCH = os.environ.get('MODEL_PREFETCH', '1') == '1'
+MODEL_WARMUP = os.environ.get('MODEL_WARMUP', '1') == '1'
+
+s3_client = make_s3_client()
+
+_loader = {'thread': None, 'module': None, 'error': None}
+_loader_lock = threading.Lock()
+_cold_start = True
+
+def _load_inference():
+    """Import pesado + descarga/construcción del modelo + warmup (fases medidas)"""
+    try:
+        with timed('imports_heavy'):
+            from src.sagemaker_training.yolo_task import infer_yolo
+            infer_yolo.import_runtime()
+        infer_yolo.load_model()   # model_download / model_build (ver model_cache)
+        if MODEL_WARMUP:
+            infer_yolo.warmup()
+        _loader['module'] = infer_yolo
+    except Exception as e:
+        _loader['error'] = e
+
+def start_model_prefetch():
+    with _loader_lock:
+        if _loader['thread'] is None:
+            _loader['thread'] = threading.Thread(target=_load_inference, name="model-prefetch", daemon=True)
+            _loader['thread'].start()
+
+def get_inference():
+    """Espera (o dispara) la carga del modelo y devuelve el módulo infer_yolo"""
+    start_model_prefetch()
+    with timed('handler_wait_model'):
+        _loader['thread'].join()
+    if _loader['error'] is not None:
+        error, _loader['error'], _loader['thread'] = _loader['error'], None, None
+        raise error
+    return _loader['module']
+
+if MODEL_PREFETCH:
+    start_model_prefetch()
+
+INIT_PHASES['init_module'] = (time.perf_counter() - _INIT_START) * 1000
+
+def image_media_id(bucket, s3_key, etag=None):
+    """
+    media_id de la tabla de tracking (el mismo que calculan el ingest y el tiler).
+    Sin ETag (invocación directa) se toma el de la versión actual del objeto.
+    """
+    if etag is None:
+        etag = s3_client.head_object(Bucket=bucket, Key=s3_key)['ETag']
+    return media_id_for(bucket, s3_key, etag)
+
+def event_part(event, tile_keys):
+    """
+    (part_id, fecha) del Parquet de un evento: hash de sus tiles (o del media_id de la
+    foto en modo imagen completa) + eventTime de S3. Si el evento se reintenta, el
+    Parquet nuevo pisa al anterior en vez de duplicar filas.
+    """
+    part_id = hashlib.sha1("\n".join(sorted(tile_keys)).encode()).hexdigest()[:12]
+    for record in event.get('Records', []):
+        s3_records = json.loads(record['body']).get('Records', []) if record.get('eventSource') == 'aws:sqs' else [record]
+        for s3_record in s3_records:
+            if s3_record.get('eventTime'):
+                return part_id, datetime.fromisoformat(s3_record['eventTime'].replace('Z', '+00:00'))
+    return part_id, datetime.now(timezone.utc)
+
+def _emit_cold_start(function_start):
+    global _cold_start
+    if not _cold_start:
+        return
+    _cold_start = False
+    phases = dict(INIT_PHASES)
+    phases['first_invocation'] = (time.perf_counter() - function_start) * 1000
+    emit_metrics(phases, dimensions={'Function': 'inference_cv', 'Backend': os.environ.get('INFERENCE_BACKEND', 'torch')})
 
 def lambda_handler(event, context):
-    for record in event['Records']:
-        s3_key = record['s3']['object']['key'] # ej: tiles/test_grid4x3_r0c0.jpg
-        
-        # Extraemos el nombre del archivo sin la extensión y sin el prefijo
-        file_name = os.path.basename(s3_key) # test_grid4x3_r0c0.jpg
-        tile_id = os.path.splitext(file_name)[0] # test_grid4x3_r0c0
-        
-        run_inference(f"s3://{PROCESSED_BUCKET}/{s3_key}", tile_id)
-    
+    function_start = time.perf_counter()
+    try:
+        return _handle(event)
+    finally:
+        _emit_cold_start(function_start)
+
+def _handle(event):
+    # Invocación directa en modo imagen completa: {"image_s3_path": "s3://raw/uploads/foto.jpg"}
+    if 'image_s3_path' in event:
+        media_id = event.get('media_id') or image_media_id(*parse_s3_uri(event['image_s3_path']))
+        part_id, created = event_part(event, [media_id])
+        payload = get_inference().run_inference_image(event['image_s3_path'], media_id, part_id=part_id, created=created)
+        return {'statusCode': 200, 'body': json.dumps({'media_id': media_id, 'detections': len(payload['detections'])})}
+
+    # 1. Validación (sin tocar el modelo)
+    images, tile_keys, tile_ids = [], [], []
+    for _, bucket, s3_key, etag in iter_s3_objects(event):
+        if not s3_key.lower().endswith(TILE_EXTENSIONS):
+            print(f"Ignorado (no es imagen): {s3_key}")
+            continue
+        if s3_key.startswith(RAW_PREFIX) and s3_key.lower().endswith(IMAGE_EXTENSIONS):
+            images.append((bucket, s3_key, etag))
+        elif s3_key.startswith(TILE_PREFIX):
+            # s3_key ej: tiles/test/test_grid4x3_r0c0.jpg
+            # Extraemos el nombre del archivo sin la extensión y sin el prefijo
+            file_name = os.path.basename(s3_key) # test_grid4x3_r0c0.jpg
+            tile_ids.append(os.path.splitext(file_name)[0]) # test_grid4x3_r0c0
+            tile_keys.append(s3_key)
+        else:
+            print(f"Ignorado (prefijo desconocido): {s3_key}")
+
+    if not images and not tile_keys:
+        return {'statusCode': 200, 'body': json.dumps('Nothing to infer')}
+
+    # 2. Descarga de los tiles en este hilo mientras el modelo termina de cargar
+    start_model_prefetch()
+    payloads = download_many(s3_client, [(PROCESSED_BUCKET, key) for key in tile_keys])
+    image_payloads = [get_bytes(s3_client, bucket, key) for bucket, key, _ in images]
+
+    infer = get_inference()
+
+    for (bucket, s3_key, etag), image_bytes in zip(images, image_payloads):
+        # Foto original: tiling en memoria + un lote + fusión global
+        media_id = image_media_id(bucket, s3_key, etag)
+        part_id, created = event_part(event, [media_id])
+        infer.run_inference_image(
+            f"s3://{bucket}/{s3_key}", media_id, image_bytes=image_bytes, part_id=part_id, created=created
+        )
+
+    if tile_keys:
+        # Todos los tiles del evento en un solo lote (un forward)
+        tile_paths = [f"s3://{PROCESSED_BUCKET}/{key}" for key in tile_keys]
+        part_id, created = event_part(event, tile_keys)
+        summary = infer.run_inference_batch(tile_paths, tile_ids, payloads=payloads, part_id=part_id, created=created)
+
+        # Un tile corrupto no se arregla reintentando: se registra y no se relanza
+        invalid = [tile_id for tile_id, error in summary['failed'] if error == infer.INVALID_IMAGE]
+        if invalid:
+            print(f"⚠️ Tiles inválidos (no se reintentan): {invalid[:10]}")
+        retryable = [f for f in summary['failed'] if f[1] != infer.INVALID_IMAGE]
+        if retryable:
+            # Lanzar el error para que AWS reintente el evento (el Parquet se reescribe en la misma key)
+            raise RuntimeError(f"Fallaron {len(retryable)} tiles: {json.dumps(retryable[:10])}")
+
     return {'statusCode': 200, 'body': json.dumps('Inference done')}
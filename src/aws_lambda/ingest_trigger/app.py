@@ -1,44 +1,68 @@
 import json
 import os
-import boto3
 import uuid
-from datetime import datetime, timezone
 import urllib.parse
+from datetime import datetime, timezone
+import boto3
+from botocore.exceptions import ClientError
+
+# Lambda autocontenida (zip con solo boto3): no importa src.common. media_id_for
+# es copia de src/common/tracking.py y un test comprueba que den el mismo id.
+# El alta del item (put condicional) solo se hace acá; el resto de las Lambdas
+# actualizan con tracking.update_status.
 
 # Inicializar clientes fuera del handler para reusar conexiones
 dynamodb = boto3.resource('dynamodb')
 TABLE_NAME = os.environ['DYNAMO_TABLE']
 table = dynamodb.Table(TABLE_NAME)
 
+def media_id_for(bucket, key, etag=None):
+    """Mismo id que tracking.media_id_for: uuid5 de s3://bucket/key#etag"""
+    etag = (etag or '').strip('"')
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"s3://{bucket}/{key}" + (f"#{etag}" if etag else '')))
+
+def iter_s3_objects(event):
+    """(bucket, key, etag) de un evento S3 directo o envuelto en SQS"""
+    for record in event.get('Records', []):
+        s3_records = json.loads(record['body']).get('Records', []) if record.get('eventSource') == 'aws:sqs' else [record]
+        for s3_record in s3_records:
+            if 's3' not in s3_record:
+                continue
+            s3_object = s3_record['s3']['object']
+            # Decodificar el nombre del archivo (espacios suelen venir como + o %20)
+            key = urllib.parse.unquote_plus(s3_object['key'], encoding='utf-8')
+            yield s3_record['s3']['bucket']['name'], key, s3_object.get('eTag')
+
 def lambda_handler(event, context):
     try:
-        # 1. Leer evento de S3
+        # 1. Leer evento de S3 (directo o envuelto en SQS)
         # El evento puede traer múltiples registros, iteramos (aunque usualmente es 1)
-        for record in event['Records']:
-            bucket_name = record['s3']['bucket']['name']
-            # Decodificar el nombre del archivo (espacios suelen venir como + o %20)
-            file_key = urllib.parse.unquote_plus(record['s3']['object']['key'], encoding='utf-8')
-            
+        for bucket_name, file_key, etag in iter_s3_objects(event):
             print(f"Procesando archivo: {file_key} del bucket: {bucket_name}")
 
             # 2. Generar Metadata Inicial
-            # Usamos un nombre unico para el ID
-            media_id = str(uuid.uuid4()) 
-            timestamp = datetime.now(timezone.utc).isoformat()
-            
+            # El ID sale de bucket/key/ETag: el tiler calcula el mismo para la misma foto
+            media_id = media_id_for(bucket_name, file_key, etag)
+
             item = {
                 'media_id': media_id,         # Primary Key
                 's3_bucket': bucket_name,
                 's3_key': file_key,
-                'upload_timestamp': timestamp,
+                'upload_timestamp': datetime.now(timezone.utc).isoformat(),
                 'status': 'UPLOADED',         # Estado inicial
                 'ml_stage': 'pending_tiling', # Siguiente paso en el flujo
                 'original_filename': file_key.split('/')[-1]
             }
 
-            # 3. Guardar en DynamoDB
-            table.put_item(Item=item)
-            print(f"Registro creado en DynamoDB para: {media_id}")
+            # 3. Guardar en DynamoDB (condicional: un reintento o un tiler más rápido
+            # ya lo registró, y no hay que volver el estado atrás)
+            try:
+                table.put_item(Item=item, ConditionExpression='attribute_not_exists(media_id)')
+                print(f"Registro creado en DynamoDB para: {media_id}")
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                print(f"Registro ya existente para: {media_id}")
 
         return {
             'statusCode': 200,
@@ -48,4 +72,4 @@ def lambda_handler(event, context):
     except Exception as e:
         print(f"Error en ingesta: {str(e)}")
         # Lanzar el error para que AWS reintente o mande a logs
-        raise e
\ No newline at end of file
+        raise e
@@ -0,0 +1,52 @@
+import os
+from datetime import datetime, timedelta, timezone
+import boto3
+
+TABLE_NAME = os.environ.get('DYNAMO_TABLE')
+# Días después del tiling en los que pueden caer los Parquet de la foto (cola atrasada, medianoche)
+RESULT_DATE_WINDOW_DAYS = int(os.environ.get('RESULT_DATE_WINDOW_DAYS', 1))
+
+dynamodb = boto3.resource('dynamodb')
+
+def get_media_item(media_id, table_name=None):
+    """Item de tracking de una foto ({} si no está o no hay tabla configurada)"""
+    table_name = table_name or TABLE_NAME
+    if not table_name:
+        return {}
+    return dynamodb.Table(table_name).get_item(Key={'media_id': media_id}).get('Item') or {}
+
+def result_dates(item, window_days=None):
+    """
+    Particiones date=YYYY-MM-DD donde buscar los resultados de una foto: desde el día del
+    processed_timestamp (tiling) hasta window_days después, sin pasar de hoy.
+    Devuelve [] si la foto todavía no se procesó.
+    """
+    window_days = RESULT_DATE_WINDOW_DAYS if window_days is None else window_days
+    if not item.get('processed_timestamp'):
+        return []
+    start = datetime.fromisoformat(item['processed_timestamp']).astimezone(timezone.utc).date()
+    today = datetime.now(timezone.utc).date()
+    days = [start + timedelta(days=i) for i in range(window_days + 1)]
+    return [d.isoformat() for d in days if d <= today] or [start.isoformat()]
+
+def update_media_counts(media_id, counts, total, table_name=None):
+    """
+    Guarda los conteos por clase de la foto reconstruida en la tabla de tracking
+    (un UpdateItem: no pisa los demás atributos del item).
+    """
+    table_name = table_name or TABLE_NAME
+    if not table_name:
+        print("⚠️ DYNAMO_TABLE no configurada, no se actualizan los conteos")
+        return None
+
+    return dynamodb.Table(table_name).update_item(
+        Key={'media_id': media_id},
+        UpdateExpression='SET #counts = :counts, total_detections = :total, #status = :status, reconstructed_at = :ts',
+        ExpressionAttributeNames={'#counts': 'counts', '#status': 'status'},
+        ExpressionAttributeValues={
+            ':counts': {name: int(n) for name, n in counts.items()},
+            ':total': int(total),
+            ':status': 'RECONSTRUCTED',
+            ':ts': datetime.now(timezone.utc).isoformat(),
+        },
+    )
@@ -0,0 +1,419 @@
+import os
+import json
+import hashlib
+import cv2
+import numpy as np
+from botocore.exceptions import ClientError
+from src.common.s3_io import (
+    make_s3_client, parse_s3_uri, get_bytes, get_byte_range, put_bytes, S3RangeFile, iter_s3_objects,
+)
+from src.common.tiling import (
+    decode_image, image_size, compute_tile_grid, parse_tile_name, read_geometry, manifest_tile_boxes,
+)
+from src.common.detections import empty_detections, shift_to_image, concat_detections, merge_detections
+from src.common.results_store import RESULTS_PREFIX
+
+# Overlays (cajas dibujadas) fuera del camino de la inferencia:
+# off = nunca | sample = una fracción determinista | always = todos
+OVERLAY_MODE = os.environ.get('OVERLAY_MODE', 'sample')
+OVERLAY_SAMPLE_RATE = float(os.environ.get('OVERLAY_SAMPLE_RATE', 0.02))
+OVERLAY_PREFIX = "overlays"
+# Lado máximo del overlay de la foto completa (solo para revisión visual)
+OVERLAY_MAX_SIDE = int(os.environ.get('OVERLAY_MAX_SIDE', 2048))
+OVERLAY_JPEG_QUALITY = 85
+
+# Colores BGR por clase (0 = flor, 1 = arandano)
+CLASS_COLORS = {0: (0, 200, 255), 1: (255, 80, 0)}
+DEFAULT_COLOR = (0, 0, 255)
+
+def should_render(key, mode=None, rate=None):
+    """
+    Decide si se dibuja el overlay de un tile/foto.
+    El muestreo es determinista (hash del nombre): un reintento elige lo mismo.
+    """
+    mode = OVERLAY_MODE if mode is None else mode
+    rate = OVERLAY_SAMPLE_RATE if rate is None else rate
+    if mode == 'always':
+        return True
+    if mode != 'sample' or rate <= 0:
+        return False
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64 < rate
+
+def render_overlay(img_bgr, dets, names, max_side=None):
+    """
+    Dibuja las detecciones (dict xyxy/conf/cls) sobre la imagen y devuelve el JPEG en bytes.
+    Con max_side se reduce la imagen antes de dibujar (las cajas se escalan igual).
+    """
+    h, w = img_bgr.shape[:2]
+    scale = 1.0
+    if max_side and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        img_bgr = cv2.resize(img_bgr, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    else:
+        img_bgr = img_bgr.copy()
+
+    thickness = max(1, round(max(img_bgr.shape[:2]) / 400))
+    boxes = np.round(np.asarray(dets["xyxy"], dtype=np.float32).reshape(-1, 4) * scale).astype(int)
+    for (x1, y1, x2, y2), conf, cls in zip(boxes, dets["conf"], dets["cls"]):
+        color = CLASS_COLORS.get(int(cls), DEFAULT_COLOR)
+        cv2.rectangle(img_bgr, (x1, y1), (x2, y2), color, thickness)
+        label = f"{names.get(int(cls), cls)} {float(conf):.2f}"
+        cv2.putText(img_bgr, label, (x1, max(y1 - 3, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1, cv2.LINE_AA)
+
+    ok, buf = cv2.imencode('.jpg', img_bgr, [cv2.IMWRITE_JPEG_QUALITY, OVERLAY_JPEG_QUALITY])
+    if not ok:
+        raise ValueError("No se pudo codificar el overlay")
+    return buf.tobytes()
+
+def overlay_key(name):
+    return f"{OVERLAY_PREFIX}/{name}_detected.jpg"
+
+def load_detections(s3_client, bucket, results_key, media_id, tile=None):
+    """
+    Lee las detecciones de un media_id (y opcionalmente de un tile) desde un
+    Parquet de results/detections. Devuelve (dict xyxy/conf/cls, names, image_coords).
+    """
+    import pyarrow.parquet as pq
+
+    filters = [("media_id", "=", media_id)] + ([("tile", "=", tile)] if tile else [])
+    table = pq.read_table(S3RangeFile(s3_client, bucket, results_key), filters=filters)
+    rows = table.to_pydict()
+    if not rows["media_id"]:
+        return empty_detections(), {}, tile is None
+
+    # Modo tile: coordenadas del tile; modo imagen: coordenadas de la foto
+    image_coords = tile is None
+    prefix = "img" if image_coords else "tile"
+    xyxy = np.array([rows[f"{prefix}_{a}"] for a in ("x1", "y1", "x2", "y2")], dtype=np.float32).T
+    dets = {
+        "xyxy": xyxy,
+        "conf": np.array(rows["conf"], dtype=np.float32),
+        "cls": np.array(rows["cls"], dtype=np.int64),
+    }
+    names = dict(zip(rows["cls"], rows["name"]))
+    return dets, names, image_coords
+
+# =========================================================
+# RECONSTRUCCIÓN DE LA FOTO COMPLETA
+# =========================================================
+
+# Fusión de duplicados en las zonas de solape (mismo criterio que el modo imagen completa)
+MERGE_METHOD = os.environ.get('MERGE_METHOD', 'nms')   # nms | wbf
+MERGE_IOS_THRESHOLD = float(os.environ.get('MERGE_IOS_THRESHOLD', 0.5))
+RECONSTRUCTION_PREFIX = "reconstruction"
+# Bytes iniciales que se piden para leer el tamaño de la foto (cabecera JPEG/PNG + EXIF)
+HEADER_BYTES = 256 * 1024
+
+RESULT_COLUMNS = [
+    "media_id", "tile", "row", "col", "cls", "name", "conf",
+    "tile_x1", "tile_y1", "tile_x2", "tile_y2", "img_x1", "img_y1", "img_x2", "img_y2", "inference_ts",
+]
+
+def read_image_size(s3_client, bucket, key):
+    """Tamaño de la foto original con un GET parcial (cae a la descarga completa si no alcanza)"""
+    try:
+        return image_size(get_byte_range(s3_client, bucket, key, 0, HEADER_BYTES - 1))
+    except Exception:
+        return image_size(get_bytes(s3_client, bucket, key))
+
+def list_result_keys(s3_client, bucket, dates, prefix=RESULTS_PREFIX):
+    """
+    Keys de los Parquet de resultados de las fechas indicadas. Las fechas son
+    obligatorias: recorrer todas las particiones crece con el histórico completo.
+    """
+    if not dates:
+        raise ValueError("Se requieren las fechas de las particiones a leer")
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for d in dates:
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/date={d}/"):
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith(".parquet"):
+                    yield obj["Key"]
+
+def result_sources(s3_client, bucket, dates, results_keys=None):
+    """
+    Parquet de resultados de una foto como archivos de GETs por rango (S3RangeFile):
+    iter_media_rows solo baja el footer, las columnas necesarias y los row groups
+    cuyas estadísticas pueden contener el media_id, no el archivo entero.
+    - results_keys: partes anotadas en el item de tracking por la inferencia; si
+      alguna ya no existe (compactación) se listan las particiones de dates.
+    """
+    if results_keys:
+        try:
+            files = [S3RangeFile(s3_client, bucket, key) for key in sorted(results_keys)]
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+                raise
+            print("⚠️ Partes de resultados compactadas, se listan las particiones")
+        else:
+            yield from files
+            return
+    for results_key in list_result_keys(s3_client, bucket, dates):
+        yield S3RangeFile(s3_client, bucket, results_key)
+
+def iter_media_rows(sources, media_id):
+    """
+    Recorre los Parquet de a uno (memoria acotada: un archivo, solo las columnas
+    necesarias y solo las filas del media_id) y genera un dict de columnas por archivo.
+    - sources: rutas locales o buffers (ej: generador que descarga de S3 bajo demanda).
+    - media_id: un id o varios (ej: id de tracking + prefijo de resultados antiguos).
+    """
+    import pyarrow.parquet as pq
+    media_ids = [media_id] if isinstance(media_id, str) else list(media_id)
+    for source in sources:
+        table = pq.read_table(source, columns=RESULT_COLUMNS, filters=[("media_id", "in", media_ids)])
+        if table.num_rows:
+            yield table.to_pydict()
+
+def tile_offsets(w, h, rows, cols):
+    """
+    (r, c) -> (x_start, y_start) con la misma cuadrícula (y el mismo recorte en
+    los bordes) que usó process_tiling. Comprueba que la orientación coincida.
+    """
+    grid_rows, grid_cols, tiles = compute_tile_grid(w, h)
+    if (grid_rows, grid_cols) != (rows, cols):
+        raise ValueError(
+            f"La cuadrícula {rows}x{cols} del tile no corresponde a una imagen {w}x{h} "
+            f"(se esperaba {grid_rows}x{grid_cols})"
+        )
+    return {(r, c): (x_start, y_start, x_end, y_end) for r, c, x_start, y_start, x_end, y_end in tiles}
+
+def collect_tile_detections(row_groups):
+    """
+    Agrupa las filas por tile (o por foto en el modo imagen completa).
+    Si un tile se infirió más de una vez (reintentos) se queda con la inferencia más reciente.
+    Devuelve {tile_o_None: (inference_ts, [filas])}.
+    """
+    groups = {}
+    for cols in row_groups:
+        for i in range(len(cols["media_id"])):
+            key, ts = cols["tile"][i], cols["inference_ts"][i]
+            current = groups.get(key)
+            if current is None or ts > current[0]:
+                groups[key] = current = (ts, [])
+            if ts == current[0]:
+                current[1].append({name: values[i] for name, values in cols.items()})
+    return groups
+
+def _rows_to_detections(rows, prefix):
+    return {
+        "xyxy": np.array([[r[f"{prefix}_{a}"] for a in ("x1", "y1", "x2", "y2")] for r in rows], dtype=np.float32).reshape(-1, 4),
+        "conf": np.array([r["conf"] for r in rows], dtype=np.float32),
+        "cls": np.array([r["cls"] for r in rows], dtype=np.int64),
+    }
+
+def reconstruct_detections(row_groups, image_size, tile_boxes=None, tile_scale=1):
+    """
+    Detecciones de todos los tiles de una foto -> coordenadas de la foto original,
+    sin duplicados en los solapes. Devuelve (dets, names).
+    - image_size: (w, h) de la foto original.
+    - tile_boxes / tile_scale: offsets reales y escala del manifest de geometría;
+      sin él, los tiles se ubican recalculando la cuadrícula a partir del nombre.
+    """
+    w, h = image_size
+    groups = collect_tile_detections(row_groups)
+    names, shifted, offsets = {}, [], {}
+
+    for tile, (_, rows) in groups.items():
+        names.update((r["cls"], r["name"]) for r in rows)
+        if all(r["img_x1"] is not None for r in rows):
+            # Ya vienen en coordenadas de la foto (modo imagen completa o tile con offset)
+            shifted.append(_rows_to_detections(rows, "img"))
+            continue
+
+        if tile_boxes and tile in tile_boxes:
+            dets = _rows_to_detections(rows, "tile")
+            dets["xyxy"] *= tile_scale
+            shifted.append(shift_to_image(dets, tile_boxes[tile]))
+            continue
+
+        parsed = parse_tile_name(tile) if tile else None
+        if parsed is None:
+            print(f"⚠️ Tile sin geometría reconocible, se ignora: {tile}")
+            continue
+        _, rows_n, cols_n, r, c = parsed
+        if (rows_n, cols_n) not in offsets:
+            offsets[(rows_n, cols_n)] = tile_offsets(w, h, rows_n, cols_n)
+        shifted.append(shift_to_image(_rows_to_detections(rows, "tile"), offsets[(rows_n, cols_n)][(r, c)]))
+
+    if not shifted:
+        return empty_detections(), names
+
+    # IoS: una baya cortada en el borde de un tile queda contenida en la del vecino
+    merged = merge_detections(concat_detections(shifted), MERGE_IOS_THRESHOLD, method=MERGE_METHOD, metric="ios")
+    merged["xyxy"][:, [0, 2]] = merged["xyxy"][:, [0, 2]].clip(0, w)
+    merged["xyxy"][:, [1, 3]] = merged["xyxy"][:, [1, 3]].clip(0, h)
+    return merged, names
+
+def count_by_class(dets, names):
+    """{nombre_clase: cantidad} de las detecciones ya fusionadas"""
+    classes, counts = np.unique(dets["cls"], return_counts=True)
+    return {names.get(int(c), str(int(c))): int(n) for c, n in zip(classes, counts)}
+
+def render_photo_overlay(image_bytes, dets, names, image_size, max_side=None):
+    """
+    Overlay de la foto completa decodificando a 1/4 de resolución (IMREAD_REDUCED_COLOR_4):
+    mucha menos memoria y CPU que decodificar la foto entera para una vista previa.
+    """
+    img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_REDUCED_COLOR_4)
+    if img is None:
+        raise ValueError("No se pudo decodificar la foto original")
+    scale = img.shape[1] / image_size[0]
+    scaled = dict(dets, xyxy=dets["xyxy"] * scale)
+    return render_overlay(img, scaled, names, max_side=max_side or OVERLAY_MAX_SIDE)
+
+def reconstruct_media(s3_client, output_bucket, media_id, dates, image_s3_path=None, overlay=True,
+                      geometry_bucket=None, filename_prefix=None, results_keys=None):
+    """
+    Reconstrucción completa de una foto desde S3:
+    resultados de todos sus tiles -> coordenadas de la foto -> fusión -> conteos + overlay.
+    Guarda reconstruction/{media_id}.json (y overlays/{foto}_detected.jpg) y devuelve el resumen.
+    - media_id: id de la tabla de tracking (media_id_for); es el que llevan los resultados.
+    - dates: particiones date=... donde están sus resultados (ver dashboard_update.result_dates).
+    - results_keys: Parquet anotados en el item de tracking; con ellos no se lista nada.
+    - filename_prefix: nombre de la foto sin extensión, con el que el tiler guardó la
+      geometría y los tiles. Resultados anteriores a que el manifest trajera el media_id
+      quedaron guardados con este prefijo y también se leen.
+    - geometry_bucket: bucket de los tiles; con el manifest del tiler no se toca la foto
+      original salvo para el overlay.
+    """
+    filename_prefix = filename_prefix or media_id
+    geometry = read_geometry(s3_client, geometry_bucket, filename_prefix) if geometry_bucket else None
+    if geometry is not None:
+        size = (geometry["width"], geometry["height"])
+        tile_boxes, tile_scale = manifest_tile_boxes(geometry), geometry.get("scale", 1)
+    elif image_s3_path:
+        size = read_image_size(s3_client, *parse_s3_uri(image_s3_path))
+        tile_boxes, tile_scale = None, 1
+    else:
+        raise ValueError(f"Sin manifest de geometría ni foto original para {media_id}")
+
+    if geometry is not None and geometry.get("media_id") not in (None, media_id):
+        raise ValueError(f"La geometría de {filename_prefix} es de otra foto ({geometry['media_id']}, no {media_id})")
+    row_ids = {media_id} if geometry is not None and "media_id" in geometry else {media_id, filename_prefix}
+
+    sources = result_sources(s3_client, output_bucket, dates, results_keys)
+    dets, names = reconstruct_detections(iter_media_rows(sources, row_ids), size, tile_boxes, tile_scale)
+    summary = {
+        "media_id": media_id,
+        "filename_prefix": filename_prefix,
+        "source": image_s3_path,
+        "image_size": list(size),
+        "counts": count_by_class(dets, names),
+        "total": int(len(dets["conf"])),
+        "detections": [
+            {"box": [round(float(v), 1) for v in box], "conf": round(float(conf), 4), "cls": int(cls)}
+            for box, conf, cls in zip(dets["xyxy"], dets["conf"], dets["cls"])
+        ],
+    }
+    put_bytes(
+        s3_client, output_bucket, f"{RECONSTRUCTION_PREFIX}/{media_id}.json",
+        json.dumps(summary).encode(), content_type='application/json'
+    )
+
+    if overlay and image_s3_path:
+        photo = render_photo_overlay(get_bytes(s3_client, *parse_s3_uri(image_s3_path)), dets, names, size)
+        summary["overlay_key"] = overlay_key(filename_prefix)
+        put_bytes(s3_client, output_bucket, summary["overlay_key"], photo, content_type='image/jpeg')
+
+    print(f"✅ Reconstrucción de {filename_prefix} ({media_id}): {summary['total']} detecciones {summary['counts']}")
+    return summary
+
+s3_client = None
+
+def reconstruct_tracked(output_bucket, media_id, options=None, new_results_key=None):
+    """
+    Reconstruye una foto de la tabla de tracking y guarda sus conteos en el item.
+    options: image_s3_path / dates / overlay del evento (por defecto salen del item).
+    new_results_key: Parquet que disparó la reconstrucción; se suma a los results_keys
+    del item por si la inferencia todavía no terminó de anotarlo.
+    """
+    from src.aws_lambda.reconstruction.dashboard_update import update_media_counts, get_media_item, result_dates
+    options = options or {}
+    item = get_media_item(media_id)
+    image_s3_path = options.get('image_s3_path') or (
+        f"s3://{item['s3_bucket']}/{item['s3_key']}" if item.get('s3_key') else None
+    )
+    dates = options.get('dates') or result_dates(item)
+    if not dates:
+        raise ValueError(f"Sin fechas de resultados para {media_id} (falta processed_timestamp)")
+    results_keys = item.get('results_keys')
+    if results_keys and new_results_key:
+        results_keys = set(results_keys) | {new_results_key}
+    # Mismo prefijo que el tiler: nombre del archivo sin la extensión final
+    source_key = item.get('s3_key') or (parse_s3_uri(image_s3_path)[1] if image_s3_path else media_id)
+    filename_prefix = os.path.basename(source_key).rsplit('.', 1)[0]
+    # Overlay de la foto: el pedido explícito manda; si no, el muestreo de OVERLAY_MODE
+    summary = reconstruct_media(
+        s3_client, output_bucket, media_id, dates, image_s3_path,
+        overlay=options.get('overlay', should_render(filename_prefix)),
+        geometry_bucket=os.environ.get('PROCESSED_BUCKET'),
+        filename_prefix=filename_prefix,
+        results_keys=results_keys,
+    )
+    update_media_counts(media_id, summary['counts'], summary['total'])
+    return summary
+
+def media_ids_in_part(bucket, results_key):
+    """media_id de un Parquet de resultados (solo el footer y la columna media_id)"""
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(S3RangeFile(s3_client, bucket, results_key))
+    return sorted(parquet_file.read(columns=['media_id']).column('media_id').unique().to_pylist())
+
+def lambda_handler(event, context):
+    """
+    Evento S3 (directo o por SQS) de un Parquet nuevo en results/detections/: reconstruye
+    las fotos que trae (una foto repartida en varias partes se reconstruye con cada una;
+    la última deja los conteos completos). Los compactados (compacted-*) se ignoran.
+
+    Invocación directa:
+    - Reconstrucción de la foto completa (conteos + overlay reducido):
+      {"action": "reconstruct", "media_id": "<id de la tabla de tracking>",
+       "image_s3_path": "s3://raw/uploads/foto.jpg" (opcional: por defecto el s3_key del item),
+       "dates": ["2026-01-10"] (opcional: por defecto salen del processed_timestamp del item),
+       "overlay": true|false (opcional: por defecto según OVERLAY_MODE / should_render)}
+      Con PROCESSED_BUCKET configurado se usa el manifest de geometría del tiler.
+    - Overlay bajo demanda a partir de un archivo de resultados concreto:
+      {"image_s3_path": "s3://raw/uploads/foto.jpg" | "s3://processed/tiles/x/x_grid3x4_r0c0.jpg",
+       "media_id": "foto", "tile": "foto_grid3x4_r0c0" (opcional),
+       "results_key": "results/detections/date=.../part-....parquet"}
+    """
+    global s3_client
+    if s3_client is None:
+        s3_client = make_s3_client()
+    output_bucket = os.environ['OUTPUT_BUCKET']
+
+    if 'Records' in event:
+        from src.aws_lambda.reconstruction.dashboard_update import get_media_item
+        reconstructed = []
+        for _, bucket, results_key, _ in iter_s3_objects(event):
+            name = os.path.basename(results_key)
+            if not results_key.startswith(f"{RESULTS_PREFIX}/") or not name.startswith("part-"):
+                print(f"Ignorado (no es una parte de resultados): {results_key}")
+                continue
+            for media_id in media_ids_in_part(bucket, results_key):
+                # Resultados con un id que no es de tracking (prefijo de archivo, anteriores)
+                if not get_media_item(media_id):
+                    print(f"⚠️ {media_id} no está en la tabla de tracking, no se reconstruye")
+                    continue
+                reconstruct_tracked(bucket, media_id, new_results_key=results_key)
+                reconstructed.append(media_id)
+        return {'statusCode': 200, 'body': json.dumps({'reconstructed': len(reconstructed)})}
+
+    if event.get('action') == 'reconstruct':
+        summary = reconstruct_tracked(output_bucket, event['media_id'], event)
+        return {'statusCode': 200, 'body': json.dumps({k: v for k, v in summary.items() if k != 'detections'})}
+
+    # Overlay bajo demanda de un tile o de la foto
+    tile = event.get('tile')
+    dets, names, _ = load_detections(s3_client, output_bucket, event['results_key'], event['media_id'], tile)
+    img = decode_image(get_bytes(s3_client, *parse_s3_uri(event['image_s3_path'])))
+    if img is None:
+        raise ValueError(f"No se pudo decodificar la imagen: {event['image_s3_path']}")
+
+    max_side = None if tile else OVERLAY_MAX_SIDE
+    key = overlay_key(tile or event['media_id'])
+    put_bytes(s3_client, output_bucket, key, render_overlay(img, dets, names, max_side), content_type='image/jpeg')
+    print(f"🖼️ Overlay guardado en s3://{output_bucket}/{key}")
+    return {'statusCode': 200, 'overlay_key': key, 'detections': len(dets["conf"])}
@@ -10,6 +10,8 @@ def lambda_handler(event, context):
     timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
     branch = os.environ.get('GITHUB_BRANCH', 'main')
     job_name = f"phenoberry-yolo-{timestamp}"
+    # Misma versión que lee train_yolo (se le pasa como DATASET_VERSION)
+    dataset_version = os.environ.get('DATASET_VERSION', 'dataset_v001')
     
     print(f"🚀 Iniciando SageMaker Training Job: {job_name}")
 
@@ -19,7 +21,9 @@ def lambda_handler(event, context):
             TrainingJobName=job_name,
             AlgorithmSpecification={
                 'TrainingImage': '763104351884.dkr.ecr.us-east-1.amazonaws.com/pytorch-training:2.0.0-gpu-py310',
-                'TrainingInputMode': 'File'
+                # FastFile: el canal se monta y los objetos se leen en streaming al abrirlos,
+                # sin copiar todo el dataset antes de arrancar (train_yolo lee los shards)
+                'TrainingInputMode': 'FastFile'
             },
             RoleArn=os.environ['SAGEMAKER_ROLE_ARN'],
             InputDataConfig=[{
@@ -27,7 +31,7 @@ def lambda_handler(event, context):
                 'DataSource': {
                     'S3DataSource': {
                         'S3DataType': 'S3Prefix',
-                        'S3Uri': f"s3://{os.environ['ARTIFACTS_BUCKET']}/datasets/yolo/dataset_v001/",
+                        'S3Uri': f"s3://{os.environ['ARTIFACTS_BUCKET']}/datasets/yolo/{dataset_version}/",
                         'S3DataDistributionType': 'FullyReplicated'
                     }
                 }
@@ -43,6 +47,11 @@ def lambda_handler(event, context):
             StoppingCondition={
                 'MaxRuntimeInSeconds': 86400
             },
+            # Misma configuración de tiling que el tiler de inferencia (TILING_*)
+            Environment={
+                **{k: v for k, v in os.environ.items() if k.startswith('TILING_')},
+                'DATASET_VERSION': dataset_version,
+            },
             HyperParameters={
                 'sagemaker_program': 'src/sagemaker_training/yolo_task/train_yolo.py',
                 'sagemaker_submit_directory': f"s3://{os.environ['ARTIFACTS_BUCKET']}/code/sourcedir.tar.gz",
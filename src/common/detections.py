@@ -0,0 +1,128 @@
+import numpy as np
+
+# IoU por encima del cual dos cajas de la misma clase se consideran duplicadas
+MERGE_IOU_THRESHOLD = 0.5
+
+def empty_detections():
+    """Conjunto de detecciones vacio (mismo formato que predict_arrays)"""
+    return {
+        "xyxy": np.zeros((0, 4), dtype=np.float32),
+        "conf": np.zeros((0,), dtype=np.float32),
+        "cls": np.zeros((0,), dtype=np.int64),
+    }
+
+def shift_to_image(pred, tile_box):
+    """Pasa las cajas de coordenadas del tile a coordenadas de la imagen original"""
+    x_start, y_start = tile_box[0], tile_box[1]
+    xyxy = pred["xyxy"].astype(np.float32, copy=True)
+    xyxy[:, [0, 2]] += x_start
+    xyxy[:, [1, 3]] += y_start
+    return {"xyxy": xyxy, "conf": pred["conf"], "cls": pred["cls"]}
+
+def concat_detections(preds):
+    if not preds:
+        return empty_detections()
+    return {
+        "xyxy": np.concatenate([p["xyxy"] for p in preds]).reshape(-1, 4),
+        "conf": np.concatenate([p["conf"] for p in preds]),
+        "cls": np.concatenate([p["cls"] for p in preds]).astype(np.int64),
+    }
+
+def _overlap(a, b, metric="iou"):
+    """Solapamiento elemento a elemento entre dos arrays (N, 4) de cajas xyxy"""
+    area_a = np.clip(a[..., 2] - a[..., 0], 0, None) * np.clip(a[..., 3] - a[..., 1], 0, None)
+    area_b = np.clip(b[..., 2] - b[..., 0], 0, None) * np.clip(b[..., 3] - b[..., 1], 0, None)
+    iw = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    ih = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = iw * ih
+    if metric == "iou":
+        denom = area_a + area_b - inter
+    elif metric == "ios":
+        denom = np.minimum(area_a, area_b)
+    else:
+        raise ValueError(f"Metrica de solapamiento desconocida: {metric}")
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denom > 0, inter / denom, 0.0)
+
+def pairwise_overlap(boxes, metric="iou"):
+    """
+    Solapamiento (N, N) de todas las parejas de cajas xyxy (para evaluar contra el GT;
+    el NMS usa overlap_pairs, que no arma la matriz entera).
+    - "iou": interseccion / union.
+    - "ios": interseccion / area de la caja mas pequena. Mejor para cajas cortadas
+      en el borde de un tile, cuyo IoU con la caja completa puede ser bajo.
+    """
+    return _overlap(boxes[:, None], boxes[None], metric)
+
+def overlap_pairs(boxes, threshold, metric="iou"):
+    """
+    Parejas (i, j) de cajas cuyo solapamiento supera el umbral, sin la matriz (N, N):
+    ordena por x1 y solo evalua las parejas que se cruzan en x (barrido). Con cajas
+    chicas repartidas en la foto son ~N * vecinos en vez de N^2.
+    Devuelve dos arrays de indices sobre boxes, cada pareja una sola vez.
+    """
+    n = len(boxes)
+    order = np.argsort(boxes[:, 0], kind="stable")
+    b = boxes[order]
+    # Candidatas de la caja i: las siguientes en el orden con x1 < x2 de i
+    first = np.arange(1, n + 1)
+    counts = np.clip(np.searchsorted(b[:, 0], b[:, 2], side="left") - first, 0, None)
+    i = np.repeat(np.arange(n), counts)
+    j = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+    hit = _overlap(b[i], b[j], metric) > threshold
+    return order[i[hit]], order[j[hit]]
+
+def nms_clusters(dets, iou_threshold=MERGE_IOU_THRESHOLD, metric="iou"):
+    """
+    NMS por clase (greedy por confianza) sobre las parejas que se solapan en cada clase.
+    Devuelve (keep, members): indices de las cajas que sobreviven y, para cada una,
+    los indices de las cajas que absorbio (incluida ella misma).
+    """
+    keep, members = [], []
+    for c in np.unique(dets["cls"]):
+        idx = np.flatnonzero(dets["cls"] == c)
+        order = idx[np.argsort(-dets["conf"][idx], kind="stable")]
+        a, b = overlap_pairs(dets["xyxy"][order].astype(np.float64), iou_threshold, metric)
+
+        # Vecinos de cada caja en rango de confianza (posicion en order), solo hacia abajo
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        sort = np.lexsort((hi, lo))
+        lo, hi = lo[sort], hi[sort]
+        bounds = np.searchsorted(lo, np.arange(len(order) + 1))
+
+        suppressed = np.zeros(len(order), dtype=bool)
+        for i in range(len(order)):
+            if suppressed[i]:
+                continue
+            neighbors = hi[bounds[i]:bounds[i + 1]]
+            group = np.concatenate([[i], neighbors[~suppressed[neighbors]]])
+            suppressed[group] = True
+            keep.append(order[i])
+            members.append(order[group])
+
+    if not keep:
+        return np.zeros((0,), dtype=np.int64), []
+
+    # Orden final por confianza descendente
+    keep = np.asarray(keep, dtype=np.int64)
+    final = np.argsort(-dets["conf"][keep], kind="stable")
+    return keep[final], [members[i] for i in final]
+
+def merge_detections(dets, iou_threshold=MERGE_IOU_THRESHOLD, method="nms", metric="iou"):
+    """
+    Fusiona duplicados (ej: la misma baya vista en dos tiles solapados).
+    - method="nms": se queda con la caja de mayor confianza de cada grupo.
+    - method="wbf": promedia las coordenadas del grupo ponderadas por confianza.
+    """
+    keep, members = nms_clusters(dets, iou_threshold, metric)
+    if method == "nms" or len(keep) == 0:
+        return {k: v[keep] for k, v in dets.items()}
+
+    if method != "wbf":
+        raise ValueError(f"Metodo de fusion desconocido: {method}")
+
+    xyxy = np.empty((len(keep), 4), dtype=np.float32)
+    for j, group in enumerate(members):
+        w = dets["conf"][group][:, None]
+        xyxy[j] = (dets["xyxy"][group] * w).sum(axis=0) / w.sum()
+    return {"xyxy": xyxy, "conf": dets["conf"][keep], "cls": dets["cls"][keep]}
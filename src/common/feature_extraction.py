@@ -0,0 +1,173 @@
+import os
+
+import cv2
+import numpy as np
+
+# Fraccion central de cada caja (ancho y alto) sobre la que se mide el color: las
+# bayas son redondas y las esquinas de la caja son hojas o fondo
+CORE_FRACTION = 0.6
+# Escala de la foto (mm por pixel), si se conoce (ej: por la distancia de la camara)
+MM_PER_PX = float(os.environ.get('FEATURES_MM_PER_PX', 0)) or None
+
+# Rangos HSV de OpenCV (H en 0-179) de cada estado de madurez:
+# (h_min, h_max, s_min, v_min, v_max); el rojo cruza el 0 y tiene dos rangos
+RIPENESS_HSV = {
+    'ripe': [(95, 165, 25, 0, 255)],                       # azul / morado
+    'turning': [(166, 179, 60, 0, 255), (0, 12, 60, 0, 255)],  # rojo / rosado (pinton)
+    'unripe': [(25, 90, 40, 0, 255)],                      # verde
+}
+# Pixeles casi negros: bayas maduras en sombra
+RIPE_MAX_V = 45
+# Si el centro de las cajas cubre menos que esta fraccion de la region, se leen solo
+# esos pixeles; si no, imagenes integrales de toda la region
+INTEGRAL_MIN_COVERAGE = 0.35
+
+# Canales por pixel que se promedian en cada caja (3 imagenes uint8 de 3 canales)
+CHANNELS = ('b', 'g', 'r', 'h', 's', 'v', 'ripe', 'turning', 'unripe')
+
+def _integral(plane):
+    """
+    Imagen integral (H+1, W+1, C) de una imagen uint8, leida como uint32. OpenCV
+    acumula en int32 y en fotos grandes desborda, pero el desborde es modular: la suma
+    de un rectangulo (a - b - c + d en uint32) es exacta mientras el resultado real
+    quepa en 32 bits (cajas de hasta ~16 MP con valores de 0 a 255).
+    """
+    ii = cv2.integral(plane, sdepth=cv2.CV_32S).view(np.uint32)
+    return ii if ii.ndim == 3 else ii[..., None]
+
+def _in_ranges(hsv, ranges):
+    """Mascara 0/255 de los pixeles dentro de alguno de los rangos HSV"""
+    mask = None
+    for h_min, h_max, s_min, v_min, v_max in ranges:
+        m = cv2.inRange(hsv, (h_min, s_min, v_min), (h_max, 255, v_max))
+        mask = m if mask is None else cv2.bitwise_or(mask, m)
+    return mask
+
+def pixel_planes(bgr):
+    """
+    Los CHANNELS de cada pixel de una imagen BGR en 3 imagenes de 3 canales (BGR, HSV
+    y mascaras de madurez en 0/255), con funciones de OpenCV: una sola conversion a
+    HSV y una pasada por mascara, sin separar canales.
+    """
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    ripe = cv2.bitwise_or(_in_ranges(hsv, RIPENESS_HSV['ripe']), cv2.inRange(hsv, (0, 0, 0), (179, 255, RIPE_MAX_V)))
+    not_ripe = cv2.bitwise_not(ripe)
+    turning = cv2.bitwise_and(_in_ranges(hsv, RIPENESS_HSV['turning']), not_ripe)
+    unripe = cv2.bitwise_and(_in_ranges(hsv, RIPENESS_HSV['unripe']), not_ripe)
+    return [np.ascontiguousarray(bgr), hsv, cv2.merge([ripe, turning, unripe])]
+
+def _integral_means(region, x1, y1, x2, y2, area):
+    """Medias (N, C) con una imagen integral por plano: 4 lecturas por caja y canal"""
+    means = []
+    for plane in pixel_planes(region):
+        ii = _integral(plane)
+        means.append((ii[y2, x2] - ii[y1, x2] - ii[y2, x1] + ii[y1, x1]) / area[:, None])
+    return np.concatenate(means, axis=1)
+
+def _gather_means(img, x1, y1, x2, y2, area):
+    """
+    Medias (N, C) leyendo solo los pixeles del centro de cada caja. Cada caja son
+    h tramos contiguos de w pixeles: los indices de todos los tramos se arman de una
+    vez (sin divisiones) y la suma por caja es un reduceat por canal.
+    """
+    width = img.shape[1]
+    w, h = x2 - x1, y2 - y1
+    run_box = np.repeat(np.arange(len(w)), h)
+    run_row = np.arange(h.sum()) - np.repeat(np.cumsum(h) - h, h)
+    run_start = (y1[run_box] + run_row) * width + x1[run_box]
+    run_len = w[run_box]
+    idx = np.arange(run_len.sum()) + np.repeat(run_start - (np.cumsum(run_len) - run_len), run_len)
+
+    pixels = np.take(np.ascontiguousarray(img).reshape(-1, 3), idx, axis=0).reshape(1, -1, 3)
+    counts = (w * h).astype(np.int64)
+    box_start = np.cumsum(counts) - counts
+    return np.stack([
+        np.add.reduceat(channel.ravel(), box_start, dtype=np.uint32)
+        for plane in pixel_planes(pixels) for channel in cv2.split(plane)
+    ], axis=1) / area[:, None]
+
+
+def core_boxes(boxes, width, height, fraction=CORE_FRACTION):
+    """Rectangulo central de cada caja en pixeles enteros [x1, x2) x [y1, y2), al menos 1x1"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    cx, cy = (boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2
+    hw = np.maximum((boxes[:, 2] - boxes[:, 0]) * fraction / 2, 0.5)
+    hh = np.maximum((boxes[:, 3] - boxes[:, 1]) * fraction / 2, 0.5)
+    x1 = np.clip(np.floor(cx - hw), 0, width - 1).astype(np.intp)
+    y1 = np.clip(np.floor(cy - hh), 0, height - 1).astype(np.intp)
+    x2 = np.clip(np.ceil(cx + hw), x1 + 1, width).astype(np.intp)
+    y2 = np.clip(np.ceil(cy + hh), y1 + 1, height).astype(np.intp)
+    return x1, y1, x2, y2
+
+def box_features(img, boxes, mm_per_px=MM_PER_PX, core_fraction=CORE_FRACTION):
+    """
+    Rasgos por deteccion de una foto ya decodificada (BGR), para miles de cajas:
+    sin recortes ni bucles por caja. Con cajas densas se usan imagenes integrales de
+    la region (4 lecturas por caja y canal); con pocas, solo se leen sus pixeles.
+    - boxes: (N, 4) xyxy en pixeles de img.
+    Devuelve {nombre: array (N,)}:
+      width_px, height_px, diameter_px (media de ancho y alto), area_px,
+      diameter_mm (si se conoce mm_per_px),
+      mean_b/g/r, mean_s/v y hue_deg (tono del color medio, 0-360) del centro de la caja,
+      ripe / turning / unripe (fraccion de pixeles de cada color) y
+      ripeness (0 = verde, 0.5 = pinton, 1 = madura; NaN si no hay pixeles de esos colores).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    w_px = np.clip(boxes[:, 2] - boxes[:, 0], 0, None)
+    h_px = np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+    features = {
+        'width_px': w_px,
+        'height_px': h_px,
+        'diameter_px': (w_px + h_px) / 2,
+        'area_px': w_px * h_px,
+    }
+    if mm_per_px:
+        features['diameter_mm'] = features['diameter_px'] * mm_per_px
+    if len(boxes) == 0:
+        for name in ('mean_b', 'mean_g', 'mean_r', 'mean_s', 'mean_v', 'hue_deg', 'ripe', 'turning', 'unripe', 'ripeness'):
+            features[name] = np.zeros(0)
+        return {name: values.astype(np.float32) for name, values in features.items()}
+
+    height, width = img.shape[:2]
+    x1, y1, x2, y2 = core_boxes(boxes, width, height, core_fraction)
+    area = ((x2 - x1) * (y2 - y1)).astype(np.float64)
+
+    # Solo la region que cubren las cajas; si los centros cubren poco de ella, es mas
+    # barato leer esos pixeles que recorrer la region entera
+    ox, oy, ex, ey = int(x1.min()), int(y1.min()), int(x2.max()), int(y2.max())
+    if area.sum() < INTEGRAL_MIN_COVERAGE * (ex - ox) * (ey - oy):
+        channel_means = _gather_means(img, x1, y1, x2, y2, area)
+    else:
+        channel_means = _integral_means(img[oy:ey, ox:ex], x1 - ox, y1 - oy, x2 - ox, y2 - oy, area)
+    means = dict(zip(CHANNELS, channel_means.T))
+
+    for name in ('b', 'g', 'r', 's', 'v'):
+        features[f'mean_{name}'] = means[name]
+    # Tono del color medio (la media de H no sirve: en el rojo salta de 179 a 0)
+    mean_bgr = np.stack([means['b'], means['g'], means['r']], axis=1).astype(np.float32) / 255
+    features['hue_deg'] = cv2.cvtColor(mean_bgr[:, None], cv2.COLOR_BGR2HSV)[:, 0, 0]
+    for name in ('ripe', 'turning', 'unripe'):
+        features[name] = means[name] / 255
+
+    colored = features['ripe'] + features['turning'] + features['unripe']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        features['ripeness'] = np.where(colored > 0, (features['ripe'] + 0.5 * features['turning']) / colored, np.nan)
+
+    return {name: values.astype(np.float32) for name, values in features.items()}
+
+def flower_density(dets, tile_boxes, flower_cls):
+    """
+    Flores por tile: cuenta las detecciones de la clase flower_cls cuyo centro cae en
+    cada tile (T, 4) xyxy y las divide por el area del tile.
+    Devuelve (conteo (T,), flores por megapixel (T,)).
+    """
+    tiles = np.asarray(tile_boxes, dtype=np.float64).reshape(-1, 4)
+    xyxy = dets['xyxy'][dets['cls'] == flower_cls]
+    cx, cy = (xyxy[:, 0] + xyxy[:, 2]) / 2, (xyxy[:, 1] + xyxy[:, 3]) / 2
+    inside = (
+        (cx[None] >= tiles[:, 0:1]) & (cx[None] < tiles[:, 2:3])
+        & (cy[None] >= tiles[:, 1:2]) & (cy[None] < tiles[:, 3:4])
+    )
+    counts = inside.sum(axis=1)
+    mpx = (tiles[:, 2] - tiles[:, 0]) * (tiles[:, 3] - tiles[:, 1]) / 1e6
+    return counts, np.where(mpx > 0, counts / np.maximum(mpx, 1e-12), 0.0)
@@ -0,0 +1,47 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Namespace de CloudWatch para las métricas emitidas por log (EMF)
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'PhenoBerry')
+
+# Fases de arranque (cold start) acumuladas en ms, por nombre de fase
+INIT_PHASES = {}
+_lock = threading.Lock()
+
+@contextmanager
+def timed(name, sink=None):
+    """Mide la duración del bloque (ms) y la acumula en sink[name] (por defecto INIT_PHASES)"""
+    sink = INIT_PHASES if sink is None else sink
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        with _lock:
+            sink[name] = sink.get(name, 0.0) + elapsed
+
+def emit_metrics(metrics, dimensions=None, unit='Milliseconds', namespace=METRICS_NAMESPACE):
+    """
+    Escribe una línea JSON en formato CloudWatch Embedded Metric Format (EMF).
+    CloudWatch la convierte en métricas sin llamadas a la API (PutMetricData).
+    - metrics: {nombre: valor}; dimensions: {nombre: valor} (strings).
+    """
+    dimensions = dimensions or {}
+    units = unit if isinstance(unit, dict) else {name: unit for name in metrics}
+    payload = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': units.get(name, 'None')} for name in sorted(metrics)],
+            }],
+        },
+        **dimensions,
+        **{name: round(value, 3) if isinstance(value, float) else value for name, value in metrics.items()},
+    }
+    print(json.dumps(payload))
+    return payload
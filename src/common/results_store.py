@@ -0,0 +1,203 @@
+import io
+import os
+import uuid
+import argparse
+from datetime import datetime, timezone
+
+# Prefijo de los resultados columnar en OUTPUT_BUCKET (particionado Hive por fecha)
+RESULTS_PREFIX = "results/detections"
+# Tamaño objetivo de los archivos compactados
+COMPACT_TARGET_ROWS = 5_000_000
+
+# (columna, tipo pyarrow). Coordenadas *_x1.. en píxeles; img_* = imagen original
+SCHEMA_FIELDS = [
+    ("media_id", "string"),
+    ("tile", "string"),
+    ("row", "int16"),
+    ("col", "int16"),
+    ("x_off", "int32"),
+    ("y_off", "int32"),
+    ("cls", "int16"),
+    ("name", "string"),
+    ("conf", "float32"),
+    ("tile_x1", "float32"), ("tile_y1", "float32"), ("tile_x2", "float32"), ("tile_y2", "float32"),
+    ("img_x1", "float32"), ("img_y1", "float32"), ("img_x2", "float32"), ("img_y2", "float32"),
+    ("model_version", "string"),
+    ("inference_ts", "timestamp[ms, tz=UTC]"),
+]
+
+def arrow_schema():
+    import pyarrow as pa
+    types = {
+        "string": pa.string(), "int16": pa.int16(), "int32": pa.int32(), "float32": pa.float32(),
+        "timestamp[ms, tz=UTC]": pa.timestamp("ms", tz="UTC"),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in SCHEMA_FIELDS])
+
+class DetectionBuffer:
+    """
+    Acumula las detecciones de una invocación en columnas (listas) y las escribe
+    como un único archivo Parquet al final, en vez de un JSON por tile.
+    - part_id / created: nombre y fecha fijos de la parte (ej: derivados del evento), para
+      que un reintento sobrescriba el mismo archivo en vez de duplicar las filas.
+    """
+
+    def __init__(self, model_version=None, part_id=None, created=None):
+        self.model_version = model_version
+        self.part_id = part_id
+        self.columns = {name: [] for name, _ in SCHEMA_FIELDS}
+        self.created = created or datetime.now(timezone.utc)
+
+    def __len__(self):
+        return len(self.columns["media_id"])
+
+    def add(self, media_id, dets, names, tile=None, row=None, col=None, offset=None, image_coords=False, scale=1):
+        """
+        Agrega las detecciones (dict xyxy/conf/cls) de un tile o de una imagen completa.
+        - offset=(x_off, y_off): si se conoce, se calculan también las coordenadas en la imagen.
+        - scale: pixeles de la imagen por pixel del tile (tiles de una decodificación reducida).
+        - image_coords=True: las cajas ya están en coordenadas de la imagen (modo imagen completa).
+        """
+        n = len(dets["conf"])
+        if n == 0:
+            return
+        xyxy = dets["xyxy"].reshape(-1, 4).tolist()
+        x_off, y_off = offset if offset is not None else (None, None)
+
+        cols = self.columns
+        cols["media_id"] += [media_id] * n
+        cols["tile"] += [tile] * n
+        cols["row"] += [row] * n
+        cols["col"] += [col] * n
+        cols["x_off"] += [x_off] * n
+        cols["y_off"] += [y_off] * n
+        cols["cls"] += [int(c) for c in dets["cls"]]
+        cols["name"] += [names[int(c)] for c in dets["cls"]]
+        cols["conf"] += [float(c) for c in dets["conf"]]
+        cols["model_version"] += [self.model_version] * n
+        cols["inference_ts"] += [self.created] * n
+
+        for i, axis in enumerate(("x1", "y1", "x2", "y2")):
+            values = [box[i] for box in xyxy]
+            if image_coords:
+                cols[f"tile_{axis}"] += [None] * n
+                cols[f"img_{axis}"] += values
+            else:
+                shift = x_off if axis[0] == "x" else y_off
+                cols[f"tile_{axis}"] += values
+                cols[f"img_{axis}"] += [v * scale + shift for v in values] if shift is not None else [None] * n
+
+    def to_table(self):
+        import pyarrow as pa
+        return pa.Table.from_pydict(self.columns, schema=arrow_schema())
+
+    def to_parquet_bytes(self):
+        import pyarrow.parquet as pq
+        buf = io.BytesIO()
+        pq.write_table(self.to_table(), buf, compression="zstd")
+        return buf.getvalue()
+
+    def partition_key(self, prefix=RESULTS_PREFIX):
+        """results/detections/date=YYYY-MM-DD/part-<hora>-<part_id o uuid>.parquet"""
+        date = self.created.strftime("%Y-%m-%d")
+        stamp = self.created.strftime("%H%M%S")
+        return f"{prefix}/date={date}/part-{stamp}-{self.part_id or uuid.uuid4().hex[:12]}.parquet"
+
+    def flush_to_s3(self, s3_client, bucket, prefix=RESULTS_PREFIX):
+        """Sube el buffer como un único Parquet. Devuelve la key (o None si estaba vacío)."""
+        if len(self) == 0:
+            return None
+        key = self.partition_key(prefix)
+        s3_client.put_object(Bucket=bucket, Key=key, Body=self.to_parquet_bytes())
+        return key
+
+# =========================================================
+# COMPACTACIÓN DE PARTES PEQUEÑAS
+# =========================================================
+
+def _compact_sources(read_sources, write_output, target_rows=COMPACT_TARGET_ROWS):
+    """
+    Une los archivos (uno por invocación) en archivos grandes, leyendo de a un
+    row group para no cargar todo en memoria. Devuelve las rutas escritas.
+    """
+    import pyarrow.parquet as pq
+
+    written, writer, buf, rows = [], None, None, 0
+    for source in read_sources:
+        parquet_file = pq.ParquetFile(source)
+        for i in range(parquet_file.num_row_groups):
+            table = parquet_file.read_row_group(i).cast(arrow_schema())
+            if writer is None:
+                buf = io.BytesIO()
+                writer = pq.ParquetWriter(buf, arrow_schema(), compression="zstd")
+            writer.write_table(table)
+            rows += table.num_rows
+            if rows >= target_rows:
+                writer.close()
+                written.append(write_output(buf.getvalue()))
+                writer, rows = None, 0
+    if writer is not None:
+        writer.close()
+        written.append(write_output(buf.getvalue()))
+    return written
+
+def compact_local(partition_dir, target_rows=COMPACT_TARGET_ROWS):
+    """Compacta los part-*.parquet de una carpeta local (reemplaza las partes)."""
+    parts = sorted(
+        os.path.join(partition_dir, f) for f in os.listdir(partition_dir)
+        if f.startswith("part-") and f.endswith(".parquet")
+    )
+    if len(parts) < 2:
+        return []
+
+    def write_output(data):
+        path = os.path.join(partition_dir, f"compacted-{uuid.uuid4().hex[:12]}.parquet")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    written = _compact_sources(parts, write_output, target_rows)
+    for path in parts:
+        os.remove(path)
+    return written
+
+def compact_s3(s3_client, bucket, partition_prefix, target_rows=COMPACT_TARGET_ROWS):
+    """Compacta los part-*.parquet de un prefijo de S3 (ej: results/detections/date=2026-01-10/)."""
+    partition_prefix = partition_prefix.rstrip("/") + "/"
+    parts = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=partition_prefix + "part-"):
+        parts += [obj["Key"] for obj in page.get("Contents", []) if obj["Key"].endswith(".parquet")]
+    if len(parts) < 2:
+        return []
+
+    def read(key):
+        return io.BytesIO(s3_client.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+    def write_output(data):
+        key = f"{partition_prefix}compacted-{uuid.uuid4().hex[:12]}.parquet"
+        s3_client.put_object(Bucket=bucket, Key=key, Body=data)
+        return key
+
+    written = _compact_sources((read(k) for k in parts), write_output, target_rows)
+    # Solo se borran las partes después de escribir los compactados
+    for start in range(0, len(parts), 1000):
+        s3_client.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": k} for k in parts[start:start + 1000]], "Quiet": True}
+        )
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compacta los Parquet de detecciones de una partición")
+    parser.add_argument("--bucket", help="Bucket de salida (si no se indica, --path es una carpeta local)")
+    parser.add_argument("--path", required=True, help="Prefijo S3 o carpeta local de la partición")
+    parser.add_argument("--target-rows", type=int, default=COMPACT_TARGET_ROWS)
+    args = parser.parse_args()
+
+    if args.bucket:
+        import boto3
+        outputs = compact_s3(boto3.client("s3"), args.bucket, args.path, args.target_rows)
+    else:
+        outputs = compact_local(args.path, args.target_rows)
+    print(f"✅ Compactado en {len(outputs)} archivo(s): {outputs}")
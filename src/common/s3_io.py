@@ -0,0 +1,241 @@
+import io
+import json
+import os
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# Concurrencia por defecto para subidas/descargas a S3
+DEFAULT_MAX_WORKERS = int(os.environ.get('S3_MAX_CONCURRENCY', 16))
+
+# Por encima de este tamano se usa subida multipart (upload_fileobj)
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=MULTIPART_THRESHOLD, use_threads=False)
+# Archivos grandes (shards, modelos): cada uno ademas sube sus partes en paralelo
+FILE_TRANSFER_CONFIG = TransferConfig(multipart_threshold=MULTIPART_THRESHOLD, max_concurrency=4)
+
+# Descargas a memoria: los objetos mas grandes que una parte se bajan por rangos en paralelo
+RANGED_GET_PART_SIZE = int(os.environ.get('RANGED_GET_PART_MB', 8)) * 1024 * 1024
+
+def make_s3_client(max_pool_connections=DEFAULT_MAX_WORKERS):
+    """
+    Cliente S3 con el pool de conexiones dimensionado para la concurrencia.
+    Los clientes de boto3 son thread-safe: se crea uno por contenedor y se reutiliza.
+    """
+    config = Config(
+        max_pool_connections=max_pool_connections,
+        retries={'max_attempts': 5, 'mode': 'adaptive'}
+    )
+    return boto3.client('s3', config=config)
+
+def put_bytes(s3_client, bucket, key, data, content_type=None):
+    """Sube un buffer en memoria. Usa multipart si supera MULTIPART_THRESHOLD."""
+    extra = {'ContentType': content_type} if content_type else {}
+    if len(data) >= MULTIPART_THRESHOLD:
+        s3_client.upload_fileobj(io.BytesIO(data), bucket, key, ExtraArgs=extra or None, Config=TRANSFER_CONFIG)
+    else:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=data, **extra)
+    return key
+
+def upload_many(s3_client, bucket, items, max_workers=DEFAULT_MAX_WORKERS, content_type=None):
+    """
+    Sube en paralelo los items (key, data) con un pool de hilos acotado.
+    - items puede ser un generador (ej: iter_tiles): se consume de forma perezosa y
+      nunca hay mas de 2 * max_workers buffers pendientes en memoria.
+    Devuelve (uploaded_keys, failed) con failed = [(key, error_str), ...].
+    """
+    uploaded, failed = [], []
+    max_pending = max(1, 2 * max_workers)
+
+    def collect(done):
+        for fut in done:
+            key = pending.pop(fut)
+            try:
+                fut.result()
+                uploaded.append(key)
+            except Exception as e:
+                failed.append((key, str(e)))
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for key, data in items:
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            fut = pool.submit(put_bytes, s3_client, bucket, key, data, content_type)
+            pending[fut] = key
+
+        if pending:
+            done, _ = wait(pending)
+            collect(done)
+
+    return uploaded, failed
+
+def upload_files(s3_client, bucket, items, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Sube en paralelo archivos locales: items = [(local_path, key), ...].
+    Devuelve (uploaded_keys, failed) con failed = [(key, error_str), ...].
+    """
+    uploaded, failed = [], []
+
+    def upload(item):
+        local_path, key = item
+        try:
+            s3_client.upload_file(local_path, bucket, key, Config=FILE_TRANSFER_CONFIG)
+            return key, None
+        except Exception as e:
+            return key, str(e)
+
+    if not items:
+        return uploaded, failed
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        for key, error in pool.map(upload, items):
+            if error is None:
+                uploaded.append(key)
+            else:
+                failed.append((key, error))
+    return uploaded, failed
+
+def iter_s3_objects(event):
+    """
+    Normaliza eventos S3 directos o envueltos en SQS.
+    Genera (item_id, bucket, key, etag) donde item_id es el messageId de SQS (o None si
+    el evento viene directo de S3) y etag el ETag del objeto (None si el evento no lo
+    trae). Los eventos de prueba de S3 (s3:TestEvent) se ignoran.
+    """
+    for record in event.get('Records', []):
+        if record.get('eventSource') == 'aws:sqs':
+            body = json.loads(record['body'])
+            for s3_record in body.get('Records', []):
+                yield record['messageId'], s3_record['s3']['bucket']['name'], _decode_key(s3_record), _etag(s3_record)
+        elif 's3' in record:
+            yield None, record['s3']['bucket']['name'], _decode_key(record), _etag(record)
+
+def _etag(record):
+    return record['s3']['object'].get('eTag')
+
+def _decode_key(record):
+    # Decodificar nombre (evita errores con espacios o tildes)
+    return urllib.parse.unquote_plus(record['s3']['object']['key'], encoding='utf-8')
+
+def parse_s3_uri(uri):
+    """s3://bucket/key -> (bucket, key)"""
+    bucket, key = uri.replace("s3://", "", 1).split("/", 1)
+    return bucket, key
+
+def get_bytes(s3_client, bucket, key):
+    """Descarga un objeto completo a memoria"""
+    return s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+def get_byte_range(s3_client, bucket, key, start, end):
+    """Descarga solo los bytes [start, end] (inclusive) de un objeto"""
+    return s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")['Body'].read()
+
+class S3RangeFile(io.RawIOBase):
+    """
+    Archivo de solo lectura sobre un objeto S3: cada read es un GET por rango.
+    Pensado para formatos con índice al final (Parquet): el primer GET trae la cola
+    del objeto (footer) y de su Content-Range sale el tamaño, y después solo se piden
+    los bytes que el lector realmente usa (ej: una columna), no el archivo entero.
+    """
+
+    def __init__(self, s3_client, bucket, key, tail_bytes=64 * 1024):
+        self.s3_client, self.bucket, self.key = s3_client, bucket, key
+        response = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=-{tail_bytes}")
+        self.tail = response['Body'].read()
+        content_range = response.get('ContentRange')
+        self.size = int(content_range.rsplit('/', 1)[1]) if content_range else len(self.tail)
+        self.tail_start = self.size - len(self.tail)
+        self.position = 0
+        self.requests = 1
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, buffer):
+        start, end = self.position, min(self.position + len(buffer), self.size)
+        if start >= end:
+            return 0
+        if start >= self.tail_start:
+            data = self.tail[start - self.tail_start:end - self.tail_start]
+        else:
+            data = get_byte_range(self.s3_client, self.bucket, self.key, start, end - 1)
+            self.requests += 1
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+def get_bytes_parallel(s3_client, bucket, key, part_size=RANGED_GET_PART_SIZE, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Descarga un objeto a memoria sin pasar por disco.
+    El primer GET pide solo la primera parte y de su Content-Range sale el tamano
+    total (sin HEAD extra); si el objeto es mas grande, el resto se baja por rangos
+    en paralelo con IfMatch al ETag de la primera parte, para no mezclar versiones
+    si el objeto se sobrescribe durante la descarga.
+    Devuelve bytes si entra en la primera parte y si no el bytearray donde se armo
+    (sin copiarlo a bytes: seria duplicar la foto en memoria). Una parte incompleta
+    es un IOError, nunca un objeto mas corto.
+    """
+    try:
+        first = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{part_size - 1}")
+    except ClientError as e:
+        # Un objeto vacio no tiene ningun rango valido
+        if e.response['Error']['Code'] == 'InvalidRange':
+            return b''
+        raise
+    head = first['Body'].read()
+    content_range = first.get('ContentRange')
+    total = int(content_range.rsplit('/', 1)[1]) if content_range else len(head)
+    if len(head) != min(part_size, total):
+        raise IOError(f"s3://{bucket}/{key}: primera parte incompleta ({len(head)} de {min(part_size, total)} bytes)")
+    if total <= len(head):
+        return head
+
+    buffer = bytearray(total)
+    view = memoryview(buffer)
+    view[:len(head)] = head
+    etag = first['ETag']
+
+    def fetch(start):
+        end = min(start + part_size, total) - 1
+        data = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag)['Body'].read()
+        if len(data) != end + 1 - start:
+            raise IOError(f"s3://{bucket}/{key}: rango {start}-{end} incompleto ({len(data)} bytes)")
+        view[start:end + 1] = data
+
+    starts = range(len(head), total, part_size)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(starts)))) as pool:
+        list(pool.map(fetch, starts))
+    view.release()
+    return buffer
+
+def download_many(s3_client, locations, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Descarga en paralelo a memoria una lista de (bucket, key).
+    Devuelve una lista alineada con locations: bytes, o la excepcion si fallo.
+    """
+    def fetch(loc):
+        try:
+            return get_bytes(s3_client, *loc)
+        except Exception as e:
+            return e
+
+    if not locations:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(locations))) as pool:
+        return list(pool.map(fetch, locations))
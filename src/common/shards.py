@@ -0,0 +1,133 @@
+import io
+import os
+import json
+import tarfile
+
+# Tamano objetivo de cada shard: pocos objetos grandes en S3 en vez de miles de archivos chicos
+SHARD_SIZE = int(os.environ.get('SHARD_SIZE_MB', 256)) * 1024 * 1024
+
+INDEX_NAME = 'index.json'
+
+def _member_ext(name):
+    """
+    'dir/18.0_r0c1.jpg' -> ('dir/18.0_r0c1', 'jpg'): la extensión va desde el último
+    punto (los nombres de foto pueden tener puntos, ej: 18.0)
+    """
+    head, base = os.path.split(name)
+    key, dot, ext = base.rpartition('.')
+    if not dot:
+        key, ext = base, ''
+    return os.path.join(head, key) if head else key, ext
+
+class ShardWriter:
+    """
+    Escribe muestras {ext: bytes} en shards tar de tamano fijo (formato WebDataset:
+    los archivos de una muestra van seguidos y comparten la clave, ej: x.jpg + x.txt).
+    Por cada shard deja <shard>.idx (clave, ext, offset, bytes por linea) para leer una
+    muestra suelta con un GET por rango, y al cerrar un index.json con la lista de shards.
+    Los tar son deterministas (mtime 0, orden de llegada).
+    """
+
+    def __init__(self, out_dir, prefix, max_bytes=SHARD_SIZE, meta=None):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.meta = meta or {}
+        self.shards = []
+        self._tar = None
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _open_next(self):
+        self._close_current()
+        name = f"{self.prefix}-{len(self.shards):06d}.tar"
+        self._path = os.path.join(self.out_dir, name)
+        self._file = open(self._path, 'wb')
+        self._tar = tarfile.open(fileobj=self._file, mode='w')
+        self._index = []
+        self.shards.append({'name': name, 'samples': 0, 'bytes': 0})
+
+    def _close_current(self):
+        if self._tar is None:
+            return
+        self._tar.close()
+        self._file.close()
+        self.shards[-1]['bytes'] = os.path.getsize(self._path)
+        with open(self._path[:-len('.tar')] + '.idx', 'w') as f:
+            f.writelines(f"{key}\t{ext}\t{offset}\t{size}\n" for key, ext, offset, size in self._index)
+        self._tar = None
+
+    def write(self, key, files):
+        """Agrega una muestra: files = {ext: bytes}"""
+        size = sum(512 + len(data) + (-len(data)) % 512 for data in files.values())
+        if self._tar is None or (self.shards[-1]['samples'] and self._file.tell() + size > self.max_bytes):
+            self._open_next()
+        for ext, data in files.items():
+            info = tarfile.TarInfo(f"{key}.{ext}")
+            info.size = len(data)
+            info.mtime = 0
+            self._tar.addfile(info, io.BytesIO(data))
+            # Tras addfile, tar.offset queda al final de los datos (rellenos a 512 bytes)
+            offset_data = self._tar.offset - len(data) - (-len(data)) % 512
+            self._index.append((key, ext, offset_data, len(data)))
+        # El tar guarda la lista de miembros en memoria: la vaciamos por muestra
+        self._tar.members.clear()
+        self.shards[-1]['samples'] += 1
+
+    def close(self):
+        """Cierra el ultimo shard y escribe index.json. Devuelve el indice"""
+        self._close_current()
+        index = {**self.meta, 'shards': self.shards, 'samples': sum(s['samples'] for s in self.shards)}
+        with open(os.path.join(self.out_dir, INDEX_NAME), 'w') as f:
+            json.dump(index, f, indent=2)
+        return index
+
+def load_index(shard_dir):
+    """index.json de un directorio de shards (None si no existe)"""
+    path = os.path.join(shard_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def iter_shard(fileobj):
+    """
+    Lee un shard tar en streaming (sin seek: sirve para un archivo de FastFile o un
+    Body de S3) y genera (clave, {ext: bytes}) agrupando miembros consecutivos.
+    """
+    key, files = None, {}
+    with tarfile.open(fileobj=fileobj, mode='r|') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            member_key, ext = _member_ext(member.name)
+            if member_key != key and files:
+                yield key, files
+                files = {}
+            key = member_key
+            files[ext] = tar.extractfile(member).read()
+    if files:
+        yield key, files
+
+def iter_samples(shard_paths):
+    """Todas las muestras de una lista de shards, uno detras de otro (lectura secuencial)"""
+    for path in shard_paths:
+        with open(path, 'rb') as f:
+            yield from iter_shard(f)
+
+def read_index(idx_path):
+    """<shard>.idx -> {clave: {ext: (offset, bytes)}}"""
+    entries = {}
+    with open(idx_path) as f:
+        for line in f:
+            key, ext, offset, size = line.rstrip('\n').split('\t')
+            entries.setdefault(key, {})[ext] = (int(offset), int(size))
+    return entries
+
+def read_sample(shard_path, entry):
+    """Lee una muestra suelta con los offsets del .idx (sin recorrer el tar)"""
+    files = {}
+    with open(shard_path, 'rb') as f:
+        for ext, (offset, size) in entry.items():
+            f.seek(offset)
+            files[ext] = f.read(size)
+    return files
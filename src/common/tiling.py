@@ -1,4 +1,8 @@
+import io
 import os
+import re
+import json
+import math
 import cv2
 import numpy as np
 
@@ -6,73 +10,181 @@ import numpy as np
 OVERLAP = 0.15
 MIN_AREA_THRESHOLD = 0.002  # Si queda menos del 30% de la caja, la descarta
 
+# Planificador de la cuadricula (ver plan_tiling): fixed = 3x4/4x3 historico | adaptive
+TILING_MODE = os.environ.get('TILING_MODE', 'fixed')
+# Lado de entrada del modelo (imgsz de train_yolo)
+TILING_IMGSZ = int(os.environ.get('TILING_IMGSZ', 640))
+# Objeto mas chico a detectar (px en la foto original) y tamano minimo que debe
+# conservar en la entrada del modelo
+TILING_MIN_OBJECT_PX = int(os.environ.get('TILING_MIN_OBJECT_PX', 24))
+TILING_MIN_MODEL_OBJECT_PX = int(os.environ.get('TILING_MIN_MODEL_OBJECT_PX', 12))
+# Objeto mas grande (px): el solape debe alcanzar para contenerlo entero en algun tile (0 = OVERLAP fijo)
+TILING_MAX_OBJECT_PX = int(os.environ.get('TILING_MAX_OBJECT_PX', 0))
+MAX_OVERLAP = 0.5
+
+# Codificacion de los tiles de inferencia: jpg | webp | npy (crudo, para uso en proceso)
+TILE_FORMAT = os.environ.get('TILE_FORMAT', 'jpg')
+TILE_JPEG_QUALITY = int(os.environ.get('TILE_JPEG_QUALITY', 95))   # 95 = valor por defecto de OpenCV
+TILE_WEBP_QUALITY = int(os.environ.get('TILE_WEBP_QUALITY', 90))
+# Decodificar la foto a 1/2, 1/4 u 1/8 cuando el modelo igual va a reducir los tiles
+TILE_DECODE_REDUCE = os.environ.get('TILE_DECODE_REDUCE', '0') == '1'
+
+# Factor de reduccion -> flag de cv2.imdecode (los REDUCED aplican la orientacion EXIF igual que IMREAD_COLOR)
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# Orientaciones EXIF que giran 90 grados
+EXIF_ROTATED = (5, 6, 7, 8)
+NPY_MAGIC = b'\x93NUMPY'
+
 def load_yolo_boxes(lbl_path, img_w, img_h):
-    """Lee las cajas YOLO y las convierte a coordenadas absolutas (píxeles)"""
-    boxes = []
+    """
+    Lee las cajas YOLO y las convierte a coordenadas absolutas (píxeles).
+    Devuelve un array (N, 5) float64 con columnas [cls_id, x1, y1, x2, y2].
+    """
+    rows = []
     if lbl_path and os.path.exists(lbl_path):
         with open(lbl_path, 'r') as f:
             for line in f.readlines():
                 parts = line.strip().split()
                 if len(parts) >= 5:
-                    cls_id = int(parts[0])
-                    xc, yc, w, h = map(float, parts[1:5])
-
-                    # Convertir coordenadas normalizadas a pixeles absolutos
-                    x_center = xc * img_w
-                    y_center = yc * img_h
-                    width = w * img_w
-                    height = h * img_h
-
-                    # Bounding box absoluto
-                    x1 = x_center - (width / 2)
-                    x2 = x_center + (width / 2)
-                    y1 = y_center - (height / 2)
-                    y2 = y_center + (height / 2)
-
-                    boxes.append({
-                        'cls_id': cls_id,
-                        'x1': x1, 'y1': y1,
-                        'x2': x2, 'y2': y2
-                    })
+                    rows.append([int(parts[0])] + [float(v) for v in parts[1:5]])
+
+    if not rows:
+        return np.zeros((0, 5), dtype=np.float64)
+
+    raw = np.asarray(rows, dtype=np.float64)
+
+    # Convertir coordenadas normalizadas a pixeles absolutos
+    x_center = raw[:, 1] * img_w
+    y_center = raw[:, 2] * img_h
+    width = raw[:, 3] * img_w
+    height = raw[:, 4] * img_h
+
+    # Bounding box absoluto
+    boxes = np.empty_like(raw)
+    boxes[:, 0] = raw[:, 0]
+    boxes[:, 1] = x_center - (width / 2)
+    boxes[:, 2] = y_center - (height / 2)
+    boxes[:, 3] = x_center + (width / 2)
+    boxes[:, 4] = y_center + (height / 2)
     return boxes
 
-def process_tiling(img_path, output_dir_img, output_dir_lbl=None, lbl_path=None, filename_prefix="tile"):
+def remap_boxes_to_tiles(boxes, tiles):
     """
-    Función Universal de Tiling.
-    - Si output_dir_lbl y lbl_path tienen valor -> Genera tiles + etiquetas (TRAINING).
-    - Si son None -> Solo genera tiles de imagen (INFERENCE).
+    Calcula las etiquetas YOLO de TODOS los tiles a la vez (broadcasting tiles x cajas).
+    - boxes: array (N, 5) de load_yolo_boxes.
+    - tiles: lista de (r, c, x_start, y_start, x_end, y_end) de compute_tile_grid.
+    Devuelve una lista con las lineas de etiqueta de cada tile (mismo orden que tiles).
     """
-    
-    img = cv2.imread(img_path)
-    if img is None:
-        print(f"Error leyendo imagen: {img_path}")
+    if len(tiles) == 0:
         return []
+    if len(boxes) == 0:
+        return [[] for _ in tiles]
 
-    h, w = img.shape[:2]
+    t = np.asarray([tile[2:] for tile in tiles], dtype=np.float64)
+    x_start, y_start = t[:, 0:1], t[:, 1:2]   # (T, 1)
+    x_end, y_end = t[:, 2:3], t[:, 3:4]
+    cur_w = x_end - x_start
+    cur_h = y_end - y_start
 
-    # Decidir cuadricula segun orientacion
-    if h > w:
-        ROWS, COLS = 4, 3
-    else:
-        ROWS, COLS = 3, 4
+    cls_id = boxes[:, 0].astype(np.int64)
+    bx1, by1 = boxes[None, :, 1], boxes[None, :, 2]   # (1, N)
+    bx2, by2 = boxes[None, :, 3], boxes[None, :, 4]
 
-    # Cargar cajas solo si estamos en modo entrenamiento
-    boxes = []
-    if lbl_path:
-        boxes = load_yolo_boxes(lbl_path, w, h)
+    # Interseccion (T, N)
+    inter_x1 = np.maximum(bx1, x_start)
+    inter_y1 = np.maximum(by1, y_start)
+    inter_x2 = np.minimum(bx2, x_end)
+    inter_y2 = np.minimum(by2, y_end)
+
+    area_visible = (inter_x2 - inter_x1) * (inter_y2 - inter_y1)
+    box_area = (bx2 - bx1) * (by2 - by1)
+
+    # Filtro por area visible
+    with np.errstate(divide='ignore', invalid='ignore'):
+        keep = (
+            (inter_x2 > inter_x1) & (inter_y2 > inter_y1) &
+            (box_area > 0) & (area_visible / box_area >= MIN_AREA_THRESHOLD)
+        )
+
+    # Coordenadas relativas al tile
+    new_x1 = inter_x1 - x_start
+    new_y1 = inter_y1 - y_start
+    new_w = (inter_x2 - x_start) - new_x1
+    new_h = (inter_y2 - y_start) - new_y1
+
+    # Normalizar a formato YOLO (0-1) + clip para seguridad
+    nxc = np.clip((new_x1 + new_w / 2) / cur_w, 0, 1)
+    nyc = np.clip((new_y1 + new_h / 2) / cur_h, 0, 1)
+    nwn = np.clip(new_w / cur_w, 0, 1)
+    nhn = np.clip(new_h / cur_h, 0, 1)
+
+    labels = []
+    for i in range(len(tiles)):
+        idx = np.flatnonzero(keep[i])
+        labels.append([
+            f"{cls_id[j]} {nxc[i, j]:.6f} {nyc[i, j]:.6f} {nwn[i, j]:.6f} {nhn[i, j]:.6f}"
+            for j in idx
+        ])
+    return labels
+
+def plan_tiling(w, h, mode=None, imgsz=None, min_object_px=None, min_model_object_px=None, max_object_px=None):
+    """
+    Elige (ROWS, COLS, overlap) para una imagen de w x h. Lo usan igual el
+    entrenamiento (process_tiling) y la inferencia (tiler) para que los tiles sean comparables.
+    - mode="fixed": cuadricula historica 3x4 (apaisada) / 4x3 (vertical) con OVERLAP.
+    - mode="adaptive": el lado del tile se limita para que el objeto mas chico
+      (min_object_px en la foto) siga midiendo al menos min_model_object_px al
+      reducir el tile a imgsz, y nunca baja de imgsz (no se agranda nada).
+      El solape crece si hace falta para que entre el objeto mas grande (max_object_px).
+    """
+    mode = mode or TILING_MODE
+    if mode == "fixed":
+        return (4, 3, OVERLAP) if h > w else (3, 4, OVERLAP)
+    if mode != "adaptive":
+        raise ValueError(f"Modo de tiling desconocido: {mode}")
+
+    imgsz = imgsz or TILING_IMGSZ
+    min_object_px = min_object_px or TILING_MIN_OBJECT_PX
+    min_model_object_px = min_model_object_px or TILING_MIN_MODEL_OBJECT_PX
+    max_object_px = TILING_MAX_OBJECT_PX if max_object_px is None else max_object_px
+
+    max_tile_side = max(imgsz, min_object_px * imgsz / min_model_object_px)
+    overlap = OVERLAP
+    for _ in range(3):
+        # El solape depende del tamano de celda y la celda de la cantidad de tiles
+        cols = max(1, math.ceil(w * (1 + overlap) / max_tile_side))
+        rows = max(1, math.ceil(h * (1 + overlap) / max_tile_side))
+        cell = min(w / cols, h / rows)
+        needed = min(max_object_px / cell, MAX_OVERLAP) if max_object_px else 0.0
+        if needed <= overlap:
+            break
+        overlap = needed
+    return rows, cols, round(overlap, 4)
+
+def compute_tile_grid(w, h, plan=None):
+    """
+    Calcula la cuadricula de tiles para una imagen de w x h.
+    - plan: (ROWS, COLS, overlap); por defecto el de plan_tiling (TILING_MODE).
+    Devuelve (ROWS, COLS, tiles) donde cada tile es (r, c, x_start, y_start, x_end, y_end).
+    """
+    ROWS, COLS, overlap = plan or plan_tiling(w, h)
 
     # Tamano de celdas
     base_w = w / COLS
     base_h = h / ROWS
 
-    tile_w = int(base_w * (1 + OVERLAP))
-    tile_h = int(base_h * (1 + OVERLAP))
+    tile_w = int(base_w * (1 + overlap))
+    tile_h = int(base_h * (1 + overlap))
 
     stride_x = int(base_w)
     stride_y = int(base_h)
 
-    generated_files = []
-
+    tiles = []
     for r in range(ROWS):
         for c in range(COLS):
 
@@ -86,63 +198,231 @@ def process_tiling(img_path, output_dir_img, output_dir_lbl=None, lbl_path=None,
             x_end = min(x_start + tile_w, w)
             y_end = min(y_start + tile_h, h)
 
-            crop = img[y_start:y_end, x_start:x_end]
-            cur_h, cur_w = crop.shape[:2]
-
-            # Nombre base del archivo
-            base_name = f"{filename_prefix}_grid{ROWS}x{COLS}_r{r}c{c}"
-            save_img_path = os.path.join(output_dir_img, base_name + '.jpg')
-            
-            # Guardar imagen
-            cv2.imwrite(save_img_path, crop)
-            generated_files.append(save_img_path)
-
-            # --- Logica de Etiquetas (Solo si hay cajas y carpeta de salida) ---
-            if output_dir_lbl and boxes:
-                new_lines = []
-                for box in boxes:
-                    # Interseccion
-                    inter_x1 = max(box['x1'], x_start)
-                    inter_y1 = max(box['y1'], y_start)
-                    inter_x2 = min(box['x2'], x_end)
-                    inter_y2 = min(box['y2'], y_end)
-
-                    if inter_x2 > inter_x1 and inter_y2 > inter_y1:
-                        box_w_visible = inter_x2 - inter_x1
-                        box_h_visible = inter_y2 - inter_y1
-                        area_visible = box_w_visible * box_h_visible
-
-                        box_area = (box['x2'] - box['x1']) * (box['y2'] - box['y1'])
-                        
-                        # Filtro por area visible
-                        if box_area > 0 and (area_visible / box_area >= MIN_AREA_THRESHOLD):
-                            
-                            # Coordenadas relativas al tile
-                            new_x1 = inter_x1 - x_start
-                            new_y1 = inter_y1 - y_start
-                            new_x2 = inter_x2 - x_start
-                            new_y2 = inter_y2 - y_start
-
-                            new_w = new_x2 - new_x1
-                            new_h = new_y2 - new_y1
-
-                            # Normalizar a formato YOLO (0-1)
-                            nxc = (new_x1 + new_w / 2) / cur_w
-                            nyc = (new_y1 + new_h / 2) / cur_h
-                            nwn = new_w / cur_w
-                            nhn = new_h / cur_h
-
-                            # Clip para seguridad
-                            nxc = np.clip(nxc, 0, 1)
-                            nyc = np.clip(nyc, 0, 1)
-                            nwn = np.clip(nwn, 0, 1)
-                            nhn = np.clip(nhn, 0, 1)
-
-                            new_lines.append(f"{box['cls_id']} {nxc:.6f} {nyc:.6f} {nwn:.6f} {nhn:.6f}")
-
-                # Guardar txt solo si hay etiquetas validas en este tile (o crear vacio si prefieres)
-                # YOLO v8 maneja archivos vacíos como "background", es seguro crearlo.
-                with open(os.path.join(output_dir_lbl, base_name + '.txt'), 'w') as f:
-                    f.write('\n'.join(new_lines))
+            tiles.append((r, c, x_start, y_start, x_end, y_end))
+
+    return ROWS, COLS, tiles
+
+def tile_base_name(filename_prefix, rows, cols, r, c):
+    """Nombre base del tile (sin extension), compartido por training e inferencia"""
+    return f"{filename_prefix}_grid{rows}x{cols}_r{r}c{c}"
+
+def tile_manifest(filename_prefix, w, h, plan=None, scale=1, source_size=None):
+    """
+    Geometría del tiling de una imagen (sin decodificarla, solo con su tamaño):
+    tamaño original, cuadrícula, solape y offset/tamaño real de cada tile
+    (ya con el recorte en los bordes). Se guarda junto a los tiles para que la
+    fusión y la reconstrucción no tengan que re-derivarla del nombre.
+    - w, h: tamaño de la imagen que se tileó (decodificada, quizás reducida).
+    - scale: pixeles originales por pixel de tile (decodificación reducida).
+      Offsets y tamaños del manifest quedan siempre en pixeles de la foto original.
+    """
+    plan = plan or plan_tiling(w, h)
+    ROWS, COLS, tiles = compute_tile_grid(w, h, plan)
+    width, height = source_size or (w * scale, h * scale)
+    return {
+        "source": filename_prefix,
+        "width": int(width),
+        "height": int(height),
+        "rows": ROWS,
+        "cols": COLS,
+        "overlap": plan[2],
+        "scale": scale,
+        "tiles": [
+            {
+                "name": tile_base_name(filename_prefix, ROWS, COLS, r, c),
+                "r": r, "c": c,
+                "x": x_start * scale, "y": y_start * scale,
+                "w": (x_end - x_start) * scale, "h": (y_end - y_start) * scale,
+            }
+            for r, c, x_start, y_start, x_end, y_end in tiles
+        ],
+    }
+
+# Prefijo (en el bucket de tiles) del manifest de geometría de cada foto
+GEOMETRY_PREFIX = "geometry"
+
+def geometry_key(filename_prefix):
+    return f"{GEOMETRY_PREFIX}/{filename_prefix}.json"
+
+def read_geometry(s3_client, bucket, filename_prefix):
+    """Lee el manifest de geometría guardado por el tiler. Devuelve None si no existe."""
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=geometry_key(filename_prefix))['Body'].read()
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(body)
+
+def manifest_tile_boxes(manifest):
+    """
+    {nombre_tile: (x_start, y_start, x_end, y_end)} en pixeles de la foto original.
+    Las cajas detectadas en un tile se pasan a la foto con caja * manifest["scale"] + offset.
+    """
+    return {t["name"]: (t["x"], t["y"], t["x"] + t["w"], t["y"] + t["h"]) for t in manifest["tiles"]}
+
+TILE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.npy')
+TILE_NAME_RE = re.compile(r"^(?P<prefix>.+)_grid(?P<rows>\d+)x(?P<cols>\d+)_r(?P<r>\d+)c(?P<c>\d+)$")
+
+def parse_tile_name(tile_name):
+    """
+    Inversa de tile_base_name: 'foto_grid3x4_r1c2(.jpg)' -> (prefix, rows, cols, r, c).
+    Devuelve None si el nombre no sigue el formato de tiling.
+    """
+    base = os.path.basename(tile_name)
+    base = base.rsplit('.', 1)[0] if base.lower().endswith(TILE_EXTENSIONS) else base
+    m = TILE_NAME_RE.match(base)
+    if not m:
+        return None
+    return m.group('prefix'), int(m.group('rows')), int(m.group('cols')), int(m.group('r')), int(m.group('c'))
+
+def decode_image(image, reduce=1):
+    """
+    Acepta un np.ndarray (BGR) o un buffer (bytes/bytearray/memoryview) con la imagen codificada
+    (jpg/png/webp, o un .npy de encode_tile).
+    - reduce: 1, 2, 4 u 8; decodifica directamente a esa fraccion del tamano (mucho mas rapido en JPEG).
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if bytes(image[:len(NPY_MAGIC)]) == NPY_MAGIC:
+        return np.load(io.BytesIO(image), allow_pickle=False)
+    buf = np.frombuffer(image, dtype=np.uint8)
+    if buf.size == 0:
+        return None
+    return cv2.imdecode(buf, REDUCED_DECODE_FLAGS[reduce])
+
+def image_size(data):
+    """
+    (w, h) de una imagen codificada leyendo solo la cabecera, ya con la orientacion
+    EXIF aplicada (como la entrega cv2.imdecode). data pueden ser solo los primeros KB.
+    """
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as img:
+        w, h = img.size
+        orientation = img.getexif().get(0x0112, 1)
+    return (h, w) if orientation in EXIF_ROTATED else (w, h)
+
+def decode_reduction(w, h, plan=None, imgsz=None):
+    """
+    Mayor factor de reduccion (1, 2, 4, 8) con el que el lado mayor de cada tile
+    sigue siendo >= imgsz: por debajo de eso el modelo veria menos detalle.
+    """
+    imgsz = imgsz or TILING_IMGSZ
+    ROWS, COLS, overlap = plan or plan_tiling(w, h)
+    tile_side = max(min(w, w / COLS * (1 + overlap)), min(h, h / ROWS * (1 + overlap)))
+    factor = 1
+    for candidate in (2, 4, 8):
+        if tile_side / candidate >= imgsz:
+            factor = candidate
+    return factor
+
+def encode_tile(crop, fmt=None, quality=None):
+    """
+    Codifica un tile. Devuelve (extension, bytes) o None si falla.
+    - jpg: calidad TILE_JPEG_QUALITY (con 95 los bytes son los de cv2.imwrite por defecto).
+    - webp: mas chico a igual calidad, decodifica algo mas lento.
+    - npy: sin compresion (para pasar tiles en proceso o por disco local).
+    """
+    fmt = fmt or TILE_FORMAT
+    if fmt == 'npy':
+        buf = io.BytesIO()
+        np.save(buf, np.ascontiguousarray(crop), allow_pickle=False)
+        return '.npy', buf.getvalue()
+    if fmt == 'jpg':
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality or TILE_JPEG_QUALITY]
+    elif fmt == 'webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality or TILE_WEBP_QUALITY]
+    else:
+        raise ValueError(f"Formato de tile desconocido: {fmt}")
+    ok, encoded = cv2.imencode('.' + fmt, crop, params)
+    return ('.' + fmt, encoded.tobytes()) if ok else None
+
+def iter_tile_crops(image, filename_prefix="tile", plan=None):
+    """
+    Igual que iter_tiles pero sin codificar: genera (base_name, tile_box, crop)
+    con crop como vista np.ndarray BGR sobre la imagen (para inferencia en proceso).
+    - plan: (ROWS, COLS, overlap) ya decidido (ej: sobre el tamano original antes
+      de una decodificacion reducida); por defecto plan_tiling de la imagen.
+    """
+    img = decode_image(image)
+    if img is None:
+        print(f"Error decodificando imagen: {filename_prefix}")
+        return
+
+    h, w = img.shape[:2]
+    ROWS, COLS, tiles = compute_tile_grid(w, h, plan)
+
+    for r, c, x_start, y_start, x_end, y_end in tiles:
+        crop = img[y_start:y_end, x_start:x_end]
+        yield tile_base_name(filename_prefix, ROWS, COLS, r, c), (x_start, y_start, x_end, y_end), crop
+
+def iter_tiles(image, filename_prefix="tile", fmt=None, quality=None, plan=None, skip=None):
+    """
+    Tiling en memoria (INFERENCE), sin tocar disco.
+    - image: bytes con la imagen codificada o np.ndarray BGR.
+    - fmt / quality: ver encode_tile (por defecto TILE_FORMAT).
+    - skip: nombres base de tiles que no se codifican (ej: fondo descartado por el filtro).
+    Genera de forma perezosa (tile_name, tile_box, tile_bytes), con
+    tile_box = (x_start, y_start, x_end, y_end) en pixeles de la imagen recibida.
+    En jpg con la calidad por defecto los bytes son identicos a los que escribe
+    process_tiling con cv2.imwrite.
+    """
+    for base_name, tile_box, crop in iter_tile_crops(image, filename_prefix, plan):
+        if skip and base_name in skip:
+            continue
+        encoded = encode_tile(crop, fmt, quality)
+        if encoded is None:
+            print(f"Error codificando tile {base_name}")
+            continue
+
+        ext, data = encoded
+        yield base_name + ext, tile_box, data
+
+def process_tiling(img_path, output_dir_img, output_dir_lbl=None, lbl_path=None, filename_prefix="tile",
+                   return_manifest=False):
+    """
+    Función Universal de Tiling.
+    - Si output_dir_lbl y lbl_path tienen valor -> Genera tiles + etiquetas (TRAINING).
+    - Si son None -> Solo genera tiles de imagen (INFERENCE).
+    - Con return_manifest=True devuelve (archivos, tile_manifest) en vez de solo los archivos.
+    """
+    
+    img = cv2.imread(img_path)
+    if img is None:
+        print(f"Error leyendo imagen: {img_path}")
+        return ([], None) if return_manifest else []
+
+    h, w = img.shape[:2]
+    ROWS, COLS, tiles = compute_tile_grid(w, h)
+
+    # Cargar cajas solo si estamos en modo entrenamiento
+    boxes = np.zeros((0, 5), dtype=np.float64)
+    if lbl_path:
+        boxes = load_yolo_boxes(lbl_path, w, h)
+
+    # --- Logica de Etiquetas (Solo si hay cajas y carpeta de salida) ---
+    # Todas las intersecciones tile x caja se calculan de una vez
+    tile_lines = None
+    if output_dir_lbl and len(boxes):
+        tile_lines = remap_boxes_to_tiles(boxes, tiles)
+
+    generated_files = []
+
+    for i, (r, c, x_start, y_start, x_end, y_end) in enumerate(tiles):
+        crop = img[y_start:y_end, x_start:x_end]
+
+        # Nombre base del archivo
+        base_name = tile_base_name(filename_prefix, ROWS, COLS, r, c)
+        save_img_path = os.path.join(output_dir_img, base_name + '.jpg')
+        
+        # Guardar imagen
+        cv2.imwrite(save_img_path, crop)
+        generated_files.append(save_img_path)
+
+        if tile_lines is not None:
+            # Guardar txt solo si hay etiquetas validas en este tile (o crear vacio si prefieres)
+            # YOLO v8 maneja archivos vacíos como "background", es seguro crearlo.
+            with open(os.path.join(output_dir_lbl, base_name + '.txt'), 'w') as f:
+                f.write('\n'.join(tile_lines[i]))
     
+    if return_manifest:
+        return generated_files, tile_manifest(filename_prefix, w, h)
     return generated_files
\ No newline at end of file
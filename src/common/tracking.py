@@ -0,0 +1,118 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+from botocore.exceptions import ClientError
+
+TABLE_NAME = os.environ.get('DYNAMO_TABLE')
+
+# UpdateItems en paralelo al cerrar un lote de SQS
+UPDATE_CONCURRENCY = int(os.environ.get('TRACKING_UPDATE_CONCURRENCY', 16))
+
+_dynamodb = None
+
+def get_table(table_name=None):
+    """Tabla de tracking (el recurso se crea una vez por contenedor)"""
+    global _dynamodb
+    if _dynamodb is None:
+        _dynamodb = boto3.resource('dynamodb')
+    return _dynamodb.Table(table_name or TABLE_NAME)
+
+def media_id_for(bucket, key, etag=None):
+    """
+    media_id determinístico de una foto: el ingest y el tiler reciben el mismo evento
+    de S3 y calculan el mismo id, así escriben sobre el mismo item y un reintento no
+    crea duplicados. Con ETag, volver a subir otra foto con el mismo nombre es otro id.
+    """
+    etag = (etag or '').strip('"')
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"s3://{bucket}/{key}" + (f"#{etag}" if etag else '')))
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def _update_args(media_id, values, defaults=None, remove=()):
+    """
+    Arma un UpdateItem: values se escriben siempre, defaults solo si el atributo no
+    existe (if_not_exists), para que el item quede completo sin importar qué Lambda
+    escribe primero. remove borra atributos (ej: el error de un intento anterior).
+    """
+    names, exprs, attr_values = {}, [], {}
+    for i, (name, value) in enumerate(values.items()):
+        names[f'#v{i}'] = name
+        attr_values[f':v{i}'] = value
+        exprs.append(f'#v{i} = :v{i}')
+    for i, (name, value) in enumerate((defaults or {}).items()):
+        names[f'#d{i}'] = name
+        attr_values[f':d{i}'] = value
+        exprs.append(f'#d{i} = if_not_exists(#d{i}, :d{i})')
+
+    expression = 'SET ' + ', '.join(exprs)
+    if remove:
+        for i, name in enumerate(remove):
+            names[f'#r{i}'] = name
+        expression += ' REMOVE ' + ', '.join(f'#r{i}' for i in range(len(remove)))
+
+    return {
+        'Key': {'media_id': media_id},
+        'UpdateExpression': expression,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': attr_values,
+    }
+
+def update_status(updates, table_name=None, max_workers=UPDATE_CONCURRENCY):
+    """
+    Aplica actualizaciones de estado [(media_id, values, defaults, remove), ...].
+    Un UpdateItem por foto (1 WCU; una transacción cobra 2 y falla entera si el lote
+    repite un media_id), en paralelo para no pagar una ida y vuelta por foto.
+    Si un media_id aparece más de una vez (mensaje de SQS duplicado) gana la última.
+    Cada actualización es idempotente: si alguna falla, se relanza el primer error
+    y el lote se puede reintentar completo.
+    Devuelve la cantidad de items actualizados.
+    """
+    latest = {}
+    for update in updates:
+        latest[update[0]] = update
+    return _apply_updates([_update_args(*update) for update in latest.values()], table_name, max_workers)
+
+def add_results_key(media_ids, results_key, table_name=None, max_workers=UPDATE_CONCURRENCY):
+    """
+    Agrega el Parquet de resultados al set results_keys de cada foto (ADD: idempotente,
+    un reintento que reescribe la misma key no la duplica). La reconstrucción lee solo
+    esos archivos en vez de listar las particiones del día.
+    Solo toca items existentes: resultados con un id que no es de tracking (ej: el
+    prefijo de archivo de geometrías viejas) no crean items sueltos.
+    Devuelve la cantidad de items actualizados.
+    """
+    args = [{
+        'Key': {'media_id': media_id},
+        'UpdateExpression': 'ADD results_keys :k',
+        'ConditionExpression': 'attribute_exists(media_id)',
+        'ExpressionAttributeValues': {':k': {results_key}},
+    } for media_id in sorted(set(media_ids))]
+    return _apply_updates(args, table_name, max_workers)
+
+def _apply_updates(args, table_name, max_workers):
+    """
+    Un UpdateItem por item; con más de uno, en paralelo. Un ConditionExpression que
+    no se cumple no es un error (el item no corresponde). Devuelve los aplicados.
+    """
+    table = get_table(table_name)
+    # Los recursos de boto3 no son thread-safe: en paralelo se usa su cliente (que sí
+    # lo es y serializa los valores igual que la tabla)
+    client = table.meta.client
+
+    def apply(update_args):
+        try:
+            client.update_item(TableName=table.name, **update_args)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    if len(args) <= 1:
+        return sum(apply(update_args) for update_args in args)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(args)))) as pool:
+        return sum(pool.map(apply, args))
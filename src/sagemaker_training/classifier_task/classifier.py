@@ -0,0 +1,150 @@
+import os
+import json
+import time
+
+import numpy as np
+
+from src.sagemaker_training.classifier_task.embedding_store import (
+    OnnxBackbone, open_store, embed_files, pull_store, push_store,
+)
+from src.sagemaker_training.classifier_task.heads import LinearHead, evaluate
+
+# Rutas estandar de SageMaker (igual que train_yolo)
+DATA_PATH = os.environ.get('SM_CHANNEL_TRAINING', '/opt/ml/input/data/training')
+MODEL_OUTPUT = os.environ.get('SM_MODEL_DIR', '/opt/ml/model')
+# Backbone congelado en ONNX, compartido por las tres cabezas
+BACKBONE_MODEL = os.environ.get(
+    'BACKBONE_MODEL',
+    os.path.join(os.environ.get('SM_CHANNEL_BACKBONE', '/opt/ml/input/data/backbone'), 'backbone.onnx'),
+)
+# Copia local del store de embeddings (fuera de /opt/ml/checkpoints: sin CheckpointConfig
+# no se sincroniza, y con él se subiría archivo por archivo durante el entrenamiento)
+EMBEDDING_CACHE_DIR = os.environ.get('EMBEDDING_CACHE_DIR', '/tmp/embeddings')
+# Store persistente entre ejecuciones (s3://bucket/prefijo): se baja al empezar y se sube al terminar
+EMBEDDING_STORE_S3 = os.environ.get('EMBEDDING_STORE_S3')
+EMBED_BATCH = int(os.environ.get('EMBED_BATCH', 64))
+EPOCHS = int(os.environ.get('SM_HP_EPOCHS', 40))
+# Fraccion de validacion si el dataset no trae carpeta val/
+VAL_FRACTION = 0.1
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp')
+
+def list_crops(split_dir, classes):
+    """
+    Recortes en formato carpeta por clase: split_dir/<clase>/*.jpg.
+    Devuelve (rutas, indices de clase). Las carpetas que no estan en classes se ignoran.
+    """
+    paths, labels = [], []
+    if not os.path.isdir(split_dir):
+        return paths, np.zeros(0, dtype=np.int64)
+    for name in sorted(os.listdir(split_dir)):
+        if not os.path.isdir(os.path.join(split_dir, name)):
+            continue
+        if name not in classes:
+            print(f"⚠️ Carpeta {name} no es una clase de la tarea ({classes}), se ignora")
+            continue
+        for entry in sorted(os.scandir(os.path.join(split_dir, name)), key=lambda e: e.name):
+            if entry.name.lower().endswith(IMAGE_EXTS):
+                paths.append(entry.path)
+                labels.append(classes.index(name))
+    return paths, np.array(labels, dtype=np.int64)
+
+def embed_split(paths, labels, store, backbone):
+    """Embeddings del split (sin los recortes que no se pudieron leer) y claves"""
+    start = time.time()
+    keys, X, computed = embed_files(paths, store, backbone, batch_size=EMBED_BATCH)
+    ok = ~np.isnan(X).any(axis=1)
+    if not ok.all():
+        print(f"⚠️ {int((~ok).sum())} recortes ilegibles, se ignoran")
+    print(f"   {len(paths)} recortes | {computed} embeddings nuevos | "
+          f"{len(paths) - computed} desde el store | {time.time() - start:.1f}s")
+    return [k for k, good in zip(keys, ok) if good], X[ok], labels[ok]
+
+def val_split(keys):
+    """Validacion determinista por clave: el mismo recorte cae siempre del mismo lado"""
+    return np.array([int(key[:8], 16) / 0xFFFFFFFF < VAL_FRACTION for key in keys], dtype=bool)
+
+def train_task(task, classes):
+    """
+    Entrena la cabeza de una tarea (filter_berry, filter_flowers, stage_classifier).
+    Los recortes se embeben una vez con el backbone congelado en el EmbeddingStore
+    (clave: hash del recorte + version del backbone); reentrenar una cabeza o entrenar
+    otra sobre los mismos recortes solo lee el store. Con EMBEDDING_STORE_S3 el store
+    se baja de S3 al empezar y se sube al terminar (se comparte entre trabajos).
+    Datos: DATA_PATH/train/<clase>/*.jpg y, opcional, DATA_PATH/val/<clase>/*.jpg.
+    Escribe head.npz y head.json en MODEL_OUTPUT.
+    """
+    classes = list(classes)
+    print(f"🧠 Tarea {task} | clases={classes} | backbone={BACKBONE_MODEL}")
+    backbone = OnnxBackbone(BACKBONE_MODEL)
+    s3_client = None
+    if EMBEDDING_STORE_S3:
+        from src.common.s3_io import make_s3_client
+        s3_client = make_s3_client()
+        pulled = pull_store(s3_client, EMBEDDING_STORE_S3, EMBEDDING_CACHE_DIR, backbone.version)
+        print(f"☁️ Store de {EMBEDDING_STORE_S3}: {pulled} archivos bajados")
+    store = open_store(EMBEDDING_CACHE_DIR, backbone)
+    print(f"📦 Store {store.dir}: {len(store)} embeddings (dim={store.dim})")
+
+    try:
+        return _train_head(task, classes, backbone, store)
+    finally:
+        # Los embeddings nuevos se guardan aunque el entrenamiento de la cabeza falle
+        if s3_client is not None:
+            push_store(s3_client, EMBEDDING_STORE_S3, store)
+            print(f"☁️ Store subido a {EMBEDDING_STORE_S3} ({len(store)} embeddings)")
+
+def _train_head(task, classes, backbone, store):
+    """Embeddings de train/val desde el store + entrenamiento y guardado de la cabeza"""
+    print("\n🔢 Embeddings de train...")
+    train_keys, X_train, y_train = embed_split(*list_crops(os.path.join(DATA_PATH, 'train'), classes), store, backbone)
+    print("🔢 Embeddings de val...")
+    _, X_val, y_val = embed_split(*list_crops(os.path.join(DATA_PATH, 'val'), classes), store, backbone)
+    if len(X_val) == 0 and len(X_train):
+        is_val = val_split(train_keys)
+        X_val, y_val = X_train[is_val], y_train[is_val]
+        X_train, y_train = X_train[~is_val], y_train[~is_val]
+        print(f"   Sin carpeta val/: {len(X_val)} recortes de train para validar")
+    if len(X_train) == 0:
+        raise RuntimeError(f"No hay recortes de entrenamiento en {DATA_PATH}/train")
+
+    counts = np.bincount(y_train, minlength=len(classes))
+    print("\n📊 Train: " + " | ".join(f"{name}={n}" for name, n in zip(classes, counts)))
+
+    start = time.time()
+    head = LinearHead(classes, backbone.version).fit(X_train, y_train, epochs=EPOCHS)
+    print(f"🚀 Cabeza entrenada en {time.time() - start:.1f}s")
+
+    report = {'train': evaluate(head, X_train, y_train), 'val': evaluate(head, X_val, y_val)}
+    print(f"✔ Accuracy train={report['train']['accuracy']:.3f} val={report['val']['accuracy']:.3f}")
+    for name, recall in report['val']['recall'].items():
+        print(f"   recall val {name}: {recall:.3f}")
+
+    os.makedirs(MODEL_OUTPUT, exist_ok=True)
+    head.save(os.path.join(MODEL_OUTPUT, 'head.npz'))
+    with open(os.path.join(MODEL_OUTPUT, 'head.json'), 'w') as f:
+        json.dump({
+            'task': task,
+            'classes': classes,
+            'backbone_version': backbone.version,
+            'n_train': int(len(X_train)),
+            'n_val': int(len(X_val)),
+            'metrics': report,
+        }, f, indent=2)
+    print(f"✅ Cabeza guardada en {MODEL_OUTPUT}/head.npz")
+    return head, report
+
+def predict_files(paths, head, backbone, store):
+    """
+    Probabilidades (N, clases) de recortes en disco con una cabeza ya entrenada. Los
+    embeddings salen del store (y los que faltan se calculan y se guardan), asi que las
+    tres cabezas sobre los mismos recortes pasan el backbone una sola vez.
+    """
+    if head.backbone_version and head.backbone_version != backbone.version:
+        raise ValueError(f"La cabeza es de {head.backbone_version}, el backbone es {backbone.version}")
+    _, X, _ = embed_files(paths, store, backbone, batch_size=EMBED_BATCH)
+    probs = np.full((len(paths), len(head.classes)), np.nan, dtype=np.float32)
+    ok = ~np.isnan(X).any(axis=1)
+    if ok.any():
+        probs[ok] = head.predict_proba(X[ok])
+    return probs
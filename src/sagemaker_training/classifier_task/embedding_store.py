@@ -0,0 +1,225 @@
+import os
+import json
+import hashlib
+
+import cv2
+import numpy as np
+
+# Normalizacion ImageNet (la de los backbones preentrenados de torchvision / timm)
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+DEFAULT_INPUT_SIZE = 224
+# Filas que se reservan de una vez al crecer el archivo de embeddings
+GROW_ROWS = 4096
+
+def crop_key(data):
+    """Clave de un recorte: hash de los bytes del archivo (mismo hash que la cache de tiles)"""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+def file_version(path, extra=''):
+    """Version de un artefacto: nombre + hash del contenido (cambia si cambian los pesos)"""
+    h = hashlib.blake2b(digest_size=6)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    h.update(extra.encode())
+    return f"{os.path.basename(path).rsplit('.', 1)[0]}-{h.hexdigest()}"
+
+class OnnxBackbone:
+    """
+    Backbone congelado exportado a ONNX (ej: MobileNet/ResNet sin la capa final),
+    ejecutado con onnxruntime en CPU. Si la salida es un mapa (B, C, H, W) se promedia
+    en H, W. version identifica los pesos: es parte de la clave del EmbeddingStore.
+    """
+
+    def __init__(self, path, version=None):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        side = model_input.shape[-1]
+        self.input_size = side if isinstance(side, int) else DEFAULT_INPUT_SIZE
+        self.version = version or file_version(path, extra=str(self.input_size))
+        self.dim = None
+
+    def preprocess(self, images):
+        """Lista de recortes BGR -> tensor NCHW float32 RGB normalizado"""
+        batch = [
+            cv2.resize(img, (self.input_size, self.input_size), interpolation=cv2.INTER_AREA)[:, :, ::-1]
+            for img in images
+        ]
+        tensor = (np.stack(batch).astype(np.float32) / 255.0 - IMAGENET_MEAN) / IMAGENET_STD
+        return np.ascontiguousarray(tensor.transpose(0, 3, 1, 2))
+
+    def embed(self, images):
+        """Lista de recortes BGR -> (N, dim) float32"""
+        out = self.session.run(None, {self.input_name: self.preprocess(images)})[0]
+        if out.ndim == 4:
+            out = out.mean(axis=(2, 3))
+        out = out.reshape(len(images), -1).astype(np.float32)
+        self.dim = out.shape[1]
+        return out
+
+class EmbeddingStore:
+    """
+    Embeddings en disco compartidos por todas las cabezas, en root/<backbone_version>/:
+      - vectors.f16: matriz (filas, dim) float16 leida con np.memmap (no se carga entera)
+      - keys.txt: una clave (crop_key) por linea; la linea i es la fila i
+    keys.txt se escribe despues de los vectores: si el proceso muere a mitad, las
+    filas sin clave se ignoran y se sobreescriben. Pensado para un solo escritor.
+    """
+
+    def __init__(self, root, backbone_version, dim):
+        self.dir = os.path.join(root, backbone_version)
+        self.dim = dim
+        os.makedirs(self.dir, exist_ok=True)
+        self.vectors_path = os.path.join(self.dir, 'vectors.f16')
+        self.keys_path = os.path.join(self.dir, 'keys.txt')
+
+        meta_path = os.path.join(self.dir, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                stored_dim = json.load(f)['dim']
+            if stored_dim != dim:
+                raise ValueError(f"El store {self.dir} tiene dim={stored_dim}, no {dim}")
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump({'backbone_version': backbone_version, 'dim': dim, 'dtype': 'float16'}, f)
+
+        self.keys = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, 'rb+') as f:
+                data = f.read()
+                # Una ultima linea sin '\n' es una escritura cortada: se descarta
+                complete = data[:data.rfind(b'\n') + 1]
+                if len(complete) != len(data):
+                    f.truncate(len(complete))
+            self.keys = complete.decode().splitlines()
+        self.index = {key: row for row, key in enumerate(self.keys)}
+        self._mm = None
+        self._reserve(max(len(self.keys), 1))
+
+    def _reserve(self, rows):
+        """Se asegura de que el archivo tenga al menos rows filas (crece de a GROW_ROWS)"""
+        capacity = os.path.getsize(self.vectors_path) // (2 * self.dim) if os.path.exists(self.vectors_path) else 0
+        if self._mm is not None and capacity >= rows:
+            return
+        if capacity < rows:
+            if self._mm is not None:
+                self._mm.flush()
+            capacity = rows + GROW_ROWS
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(capacity * self.dim * 2)
+        self._mm = np.memmap(self.vectors_path, dtype=np.float16, mode='r+', shape=(capacity, self.dim))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def rows(self, keys):
+        """Fila de cada clave (-1 si no esta)"""
+        return np.array([self.index.get(key, -1) for key in keys], dtype=np.int64)
+
+    def get(self, keys):
+        """(N, dim) float32 de claves que ya estan en el store"""
+        rows = self.rows(keys)
+        if (rows < 0).any():
+            raise KeyError(f"{int((rows < 0).sum())} claves sin embedding")
+        return np.asarray(self._mm[rows], dtype=np.float32)
+
+    def add(self, keys, vectors):
+        """Agrega (N, dim) embeddings; las claves que ya estaban se ignoran"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        new = [(key, vec) for key, vec in zip(keys, vectors) if key not in self.index]
+        # Claves repetidas dentro del mismo lote
+        new = list({key: vec for key, vec in new}.items())
+        if not new:
+            return 0
+        start = len(self.keys)
+        self._reserve(start + len(new))
+        self._mm[start:start + len(new)] = np.stack([vec for _, vec in new])
+        self._mm.flush()
+        with open(self.keys_path, 'a') as f:
+            f.write(''.join(key + '\n' for key, _ in new))
+        for key, _ in new:
+            self.index[key] = len(self.keys)
+            self.keys.append(key)
+        return len(new)
+
+def open_store(root, backbone):
+    """EmbeddingStore del backbone (la dimension se averigua con un recorte negro si hace falta)"""
+    if backbone.dim is None:
+        backbone.embed([np.zeros((backbone.input_size, backbone.input_size, 3), np.uint8)])
+    return EmbeddingStore(root, backbone.version, backbone.dim)
+
+# Archivos del store en el orden en que se suben: los vectores antes que las claves,
+# asi una clave que esta en S3 siempre tiene su fila (mismo criterio que add)
+STORE_FILES = ('meta.json', 'vectors.f16', 'keys.txt')
+
+def _store_location(s3_uri, backbone_version):
+    bucket, _, prefix = s3_uri.replace("s3://", "", 1).partition("/")
+    prefix = prefix.strip("/")
+    return bucket, f"{prefix}/{backbone_version}" if prefix else backbone_version
+
+def pull_store(s3_client, s3_uri, root, backbone_version):
+    """
+    Baja de s3_uri/<backbone_version>/ el store guardado por una ejecucion anterior
+    (si existe) a root/<backbone_version>/. Devuelve cuantos archivos bajo.
+    """
+    from botocore.exceptions import ClientError
+    bucket, prefix = _store_location(s3_uri, backbone_version)
+    local_dir = os.path.join(root, backbone_version)
+    os.makedirs(local_dir, exist_ok=True)
+    pulled = 0
+    for name in STORE_FILES:
+        try:
+            s3_client.download_file(bucket, f"{prefix}/{name}", os.path.join(local_dir, name))
+            pulled += 1
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+    return pulled
+
+def push_store(s3_client, s3_uri, store):
+    """Sube el store a s3_uri/<backbone_version>/ (vectores antes que claves)"""
+    if store._mm is not None:
+        store._mm.flush()
+    bucket, prefix = _store_location(s3_uri, os.path.basename(store.dir))
+    for name in STORE_FILES:
+        s3_client.upload_file(os.path.join(store.dir, name), bucket, f"{prefix}/{name}")
+
+def embed_files(paths, store, backbone, batch_size=64):
+    """
+    Embeddings (N, dim) de una lista de recortes en disco. Cada archivo se lee para
+    calcular su clave, pero solo se decodifican y pasan por el backbone los que no
+    estan en el store. Devuelve (claves, embeddings, cantidad calculada).
+    """
+    keys, pending = [], []
+    computed = 0
+
+    def flush():
+        nonlocal computed
+        images = [cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) for _, data in pending]
+        ok = [(key, img) for (key, _), img in zip(pending, images) if img is not None]
+        if ok:
+            computed += store.add([key for key, _ in ok], backbone.embed([img for _, img in ok]))
+        pending.clear()
+
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        key = crop_key(data)
+        keys.append(key)
+        if key not in store and all(key != k for k, _ in pending):
+            pending.append((key, data))
+            if len(pending) >= batch_size:
+                flush()
+    flush()
+
+    rows = store.rows(keys)
+    vectors = np.full((len(keys), store.dim), np.nan, dtype=np.float32)
+    if (rows >= 0).any():
+        vectors[rows >= 0] = store.get([k for k, r in zip(keys, rows) if r >= 0])
+    return keys, vectors, computed
@@ -0,0 +1,12 @@
+import sys
+
+# El código del repo se extrae en /opt/ml/code
+if "/opt/ml/code" not in sys.path:
+    sys.path.insert(0, "/opt/ml/code")
+from src.sagemaker_training.classifier_task.classifier import train_task
+
+# Filtro de falsos positivos sobre los recortes de detecciones de flor
+CLASSES = ["flor", "falso_positivo"]
+
+if __name__ == "__main__":
+    train_task("filter_flowers", CLASSES)
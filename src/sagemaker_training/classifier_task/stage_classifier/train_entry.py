@@ -0,0 +1,12 @@
+import sys
+
+# El código del repo se extrae en /opt/ml/code
+if "/opt/ml/code" not in sys.path:
+    sys.path.insert(0, "/opt/ml/code")
+from src.sagemaker_training.classifier_task.classifier import train_task
+
+# Estado de madurez de cada arándano detectado (mismos estados que feature_extraction)
+CLASSES = ["verde", "pinton", "madura"]
+
+if __name__ == "__main__":
+    train_task("stage_classifier", CLASSES)
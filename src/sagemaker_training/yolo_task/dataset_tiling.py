@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+
+from src.common import tiling
+from src.common.tiling import process_tiling, OVERLAP, MIN_AREA_THRESHOLD
+from src.common.shards import ShardWriter, load_index, iter_samples, SHARD_SIZE
+
+# Subir este numero invalida la cache si cambia la logica de tiling
+TILING_CACHE_VERSION = 2
+
+# Prefijo neutro de los tiles en la cache: la entrada es por contenido y la pueden
+# compartir fotos con distinto nombre; se renombran a <name>_... al enlazarlos
+CACHE_TILE_PREFIX = 'tile'
+
+# Cada cuanto (segundos) se imprime el progreso
+PROGRESS_EVERY_S = 10
+
+def tiling_params():
+    """Parametros que afectan al resultado del tiling (forman parte de la clave de cache)"""
+    return {
+        'version': TILING_CACHE_VERSION,
+        'overlap': OVERLAP,
+        'min_area_threshold': MIN_AREA_THRESHOLD,
+        'grid': '3x4/4x3' if tiling.TILING_MODE == 'fixed' else {
+            'mode': tiling.TILING_MODE,
+            'imgsz': tiling.TILING_IMGSZ,
+            'min_object_px': tiling.TILING_MIN_OBJECT_PX,
+            'min_model_object_px': tiling.TILING_MIN_MODEL_OBJECT_PX,
+            'max_object_px': tiling.TILING_MAX_OBJECT_PX,
+        },
+    }
+
+def content_key(img_path, lbl_path, params):
+    """Hash del contenido de la imagen + etiqueta + parametros de tiling"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(json.dumps(params, sort_keys=True).encode())
+    for path in (img_path, lbl_path):
+        h.update(b'\0')
+        if path:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+    return h.hexdigest()
+
+def _link_or_copy(src, dst):
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Distinto filesystem (ej: cache en /opt/ml/checkpoints y salida en /tmp)
+        shutil.copy2(src, dst)
+
+def _init_worker():
+    # Un hilo de OpenCV por proceso: el paralelismo lo da el pool
+    cv2.setNumThreads(1)
+
+def _tile_one(job):
+    """
+    Tilea una imagen (en un proceso del pool).
+    Con cache: tilea dentro de cache_dir/<hash>/ con nombres neutros y enlaza los
+    archivos a la salida con el nombre de la imagen.
+    Devuelve (n_tiles, n_labels, cache_hit).
+    """
+    img_path, lbl_path, name, out_img_dir, out_lbl_dir, cache_dir, params = job
+
+    if not cache_dir:
+        files = process_tiling(
+            img_path=img_path,
+            output_dir_img=out_img_dir,
+            output_dir_lbl=out_lbl_dir,
+            lbl_path=lbl_path,
+            filename_prefix=name,
+        )
+        bases = [os.path.basename(p).rsplit('.', 1)[0] for p in files]
+        n_labels = sum(os.path.exists(os.path.join(out_lbl_dir, b + '.txt')) for b in bases)
+        return len(files), n_labels, False
+
+    entry = os.path.join(cache_dir, content_key(img_path, lbl_path, params))
+    manifest_path = os.path.join(entry, 'manifest.json')
+    hit = os.path.exists(manifest_path)
+
+    if not hit:
+        tmp = f"{entry}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(os.path.join(tmp, 'images'))
+        os.makedirs(os.path.join(tmp, 'labels'))
+
+        _, geometry = process_tiling(
+            img_path=img_path,
+            output_dir_img=os.path.join(tmp, 'images'),
+            output_dir_lbl=os.path.join(tmp, 'labels'),
+            lbl_path=lbl_path,
+            filename_prefix=CACHE_TILE_PREFIX,
+            return_manifest=True,
+        )
+        manifest = {
+            'source': os.path.basename(img_path),
+            'params': params,
+            'geometry': geometry,
+            'images': sorted(os.listdir(os.path.join(tmp, 'images'))),
+            'labels': sorted(os.listdir(os.path.join(tmp, 'labels'))),
+        }
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Otro proceso ya publico la misma entrada (imagenes duplicadas)
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    for kind, out_dir in (('images', out_img_dir), ('labels', out_lbl_dir)):
+        for file_name in manifest[kind]:
+            out_name = name + file_name[len(CACHE_TILE_PREFIX):]
+            _link_or_copy(os.path.join(entry, kind, file_name), os.path.join(out_dir, out_name))
+
+    return len(manifest['images']), len(manifest['labels']), hit
+
+def tile_dataset(split_map, data_path, output_root, cache_dir=None, workers=None, chunksize=None):
+    """
+    Etapa de tiling paralela para el dataset de entrenamiento.
+    - split_map: {split: [img_path, ...]}. Las etiquetas se buscan en data_path/labels/<name>.txt
+    - Los tiles se escriben en output_root/images/<split> y output_root/labels/<split>
+      con nombres deterministas (<name>_grid{R}x{C}_r{r}c{c}).
+    - cache_dir: si se indica, se reutilizan los tiles de ejecuciones anteriores cuando
+      la imagen, su etiqueta y los parametros de tiling no cambiaron.
+    Devuelve un dict con las estadisticas de la etapa.
+    """
+    params = tiling_params()
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    jobs = []
+    for split in sorted(split_map):
+        for img_path in sorted(split_map[split]):
+            name = os.path.basename(img_path).rsplit(".", 1)[0]
+            lbl_path = os.path.join(data_path, "labels", name + ".txt")
+            lbl_path = lbl_path if os.path.exists(lbl_path) else None
+            jobs.append((
+                img_path, lbl_path, name,
+                f"{output_root}/images/{split}", f"{output_root}/labels/{split}",
+                cache_dir, params
+            ))
+
+    workers = workers or os.cpu_count() or 1
+    # Trozos pequenos para repartir bien la carga, grandes para no pagar IPC por imagen
+    chunksize = chunksize or max(1, min(32, len(jobs) // (workers * 4)))
+
+    stats = {'images': 0, 'tiles': 0, 'labels': 0, 'cache_hits': 0}
+    print(f"🧩 Tiling de {len(jobs)} imágenes con {workers} procesos (chunksize={chunksize})")
+
+    start = last_report = time.time()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for n_tiles, n_labels, hit in pool.map(_tile_one, jobs, chunksize=chunksize):
+            stats['images'] += 1
+            stats['tiles'] += n_tiles
+            stats['labels'] += n_labels
+            stats['cache_hits'] += int(hit)
+
+            now = time.time()
+            if now - last_report >= PROGRESS_EVERY_S:
+                last_report = now
+                _report(stats, len(jobs), now - start)
+
+    stats['seconds'] = time.time() - start
+    _report(stats, len(jobs), stats['seconds'])
+    return stats
+
+def _report(stats, total, elapsed):
+    elapsed = max(elapsed, 1e-9)
+    print(
+        f"   {stats['images']}/{total} imágenes | "
+        f"{stats['images'] / elapsed:.2f} img/s | {stats['tiles'] / elapsed:.1f} tiles/s | "
+        f"cache hits={stats['cache_hits']}"
+    )
+
+def dataset_key(raw_images, data_path, params):
+    """
+    Clave del dataset tileado: parametros de tiling + por cada imagen su nombre, tamano
+    y mtime (una foto reemplazada por otra del mismo tamano cambia de mtime) + el
+    contenido de su etiqueta (corregir una clase no cambia el tamano del .txt).
+    Las imagenes solo se stat-ean (en FastFile no se bajan); las etiquetas son KB.
+    """
+    h = hashlib.blake2b(digest_size=10)
+    h.update(json.dumps(params, sort_keys=True).encode())
+    for img_path in sorted(raw_images):
+        name = os.path.basename(img_path).rsplit(".", 1)[0]
+        stat = os.stat(img_path)
+        h.update(f"{os.path.basename(img_path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+        lbl_path = os.path.join(data_path, "labels", name + ".txt")
+        if os.path.exists(lbl_path):
+            with open(lbl_path, "rb") as f:
+                h.update(hashlib.blake2b(f.read(), digest_size=16).digest())
+        else:
+            h.update(b"-")
+        h.update(b"\n")
+    return h.hexdigest()
+
+def pack_dataset(output_root, shard_dir, splits=("train", "val", "test"), shard_size=SHARD_SIZE, meta=None):
+    """
+    Empaqueta el dataset tileado (output_root/images/<split> + labels/<split>) en shards
+    tar de shard_size: una muestra por tile con su .jpg y, si tiene, su .txt. La clave
+    de cada muestra es <split>/<tile> para poder reconstruir los splits.
+    Devuelve el indice (index.json).
+    """
+    start = time.time()
+    writer = ShardWriter(shard_dir, "tiles", shard_size, meta={**(meta or {}), 'splits': list(splits)})
+    for split in splits:
+        img_dir = os.path.join(output_root, "images", split)
+        lbl_dir = os.path.join(output_root, "labels", split)
+        for entry in sorted(os.scandir(img_dir), key=lambda e: e.name):
+            base, ext = entry.name.rsplit(".", 1)
+            with open(entry.path, "rb") as f:
+                files = {ext: f.read()}
+            lbl_path = os.path.join(lbl_dir, base + ".txt")
+            if os.path.exists(lbl_path):
+                with open(lbl_path, "rb") as f:
+                    files["txt"] = f.read()
+            writer.write(f"{split}/{base}", files)
+    index = writer.close()
+    total_mb = sum(s['bytes'] for s in index['shards']) / 1e6
+    print(f"📦 {index['samples']} tiles en {len(index['shards'])} shards ({total_mb:.0f} MB) en {time.time() - start:.1f}s")
+    return index
+
+def _unpack_shard(job):
+    shard_path, output_root = job
+    n = 0
+    for key, files in iter_samples([shard_path]):
+        split, base = key.split("/", 1)
+        for ext, data in files.items():
+            folder = "labels" if ext == "txt" else "images"
+            with open(os.path.join(output_root, folder, split, f"{base}.{ext}"), "wb") as f:
+                f.write(data)
+        n += 1
+    return n
+
+def unpack_dataset(shard_dir, output_root, workers=None):
+    """
+    Reconstruye output_root/images/<split> y labels/<split> desde los shards (Ultralytics
+    necesita el arbol de archivos). Cada shard se lee secuencialmente de principio a fin,
+    varios a la vez: en FastFile son pocas lecturas grandes en vez de una por tile.
+    Devuelve la cantidad de tiles.
+    """
+    index = load_index(shard_dir)
+    for split in index['splits']:
+        os.makedirs(os.path.join(output_root, "images", split), exist_ok=True)
+        os.makedirs(os.path.join(output_root, "labels", split), exist_ok=True)
+
+    start = time.time()
+    jobs = [(os.path.join(shard_dir, shard['name']), output_root) for shard in index['shards']]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        n_tiles = sum(pool.map(_unpack_shard, jobs))
+    print(f"📦 {n_tiles} tiles extraídos de {len(jobs)} shards en {time.time() - start:.1f}s")
+    return n_tiles
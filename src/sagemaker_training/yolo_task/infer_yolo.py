@@ -1,71 +1,288 @@
 import os
-import boto3
-import json
-from ultralytics import YOLO
-from PIL import Image, ImageDraw
-from pathlib import Path
+from collections import OrderedDict
+import numpy as np
+from src.common.s3_io import make_s3_client, parse_s3_uri, get_bytes, download_many, upload_many
+from src.common.tiling import decode_image, iter_tile_crops, parse_tile_name, read_geometry, manifest_tile_boxes
+from src.common.results_store import DetectionBuffer
+from src.common import tracking
+from src.common.detections import shift_to_image, concat_detections, merge_detections
+from src.common.metrics import timed
+from src.sagemaker_training.yolo_task.model_cache import get_model, model_version
+from src.aws_lambda.reconstruction.visualizer import should_render, render_overlay, overlay_key
 
-s3_client = boto3.client('s3')
+# Concurrencia de descargas/subidas a S3 y tamano maximo de lote para el modelo
+S3_CONCURRENCY = int(os.environ.get('S3_CONCURRENCY', 16))
+INFERENCE_BATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_SIZE', 16))
+CONF_THRESHOLD = 0.25
+# Runtime del modelo: torch (Ultralytics .pt) | onnx (onnxruntime) | openvino
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch')
+# Con MODEL_INT8=1 los runtimes exportados usan model_int8.onnx
+MODEL_INT8 = os.environ.get('MODEL_INT8', '0') == '1'
+# Fusion de duplicados entre tiles solapados (modo imagen completa)
+MERGE_METHOD = os.environ.get('MERGE_METHOD', 'nms')   # nms | wbf
+MERGE_IOS_THRESHOLD = float(os.environ.get('MERGE_IOS_THRESHOLD', 0.5))
+
+# Error permanente de un tile (no se arregla reintentando el evento)
+INVALID_IMAGE = "imagen inválida"
+
+# Manifests de geometría (offsets de cada tile) cacheados por foto
+GEOMETRY_CACHE_SIZE = 256
+
+s3_client = make_s3_client(max_pool_connections=S3_CONCURRENCY)
+_geometry_cache = OrderedDict()
 # Asegúrate de que esta variable solo tenga el nombre del bucket: "mi-bucket-name"
 OUTPUT_BUCKET = os.environ['OUTPUT_BUCKET']
 
-# --- CARGA DEL MODELO (Solo una vez al inicio para optimizar) ---
+# --- CARGA DEL MODELO ---
+# Versión resuelta desde el registro (LATEST_YOLO_MODEL), cacheada en /tmp por
+# versión + ETag y recargada en caliente cuando cambia (ver model_cache.py)
+def import_runtime():
+    """
+    Imports pesados diferidos (ultralytics/torch u onnxruntime/openvino):
+    solo se paga el del runtime elegido y solo cuando se va a inferir.
+    """
+    if INFERENCE_BACKEND == 'torch':
+        from ultralytics import YOLO
+        return YOLO
+
+    from src.sagemaker_training.yolo_task import onnx_backend
+    if INFERENCE_BACKEND == 'openvino':
+        import openvino
+    else:
+        import onnxruntime
+    return onnx_backend.ExportedYolo
+
+def build_model(local_path):
+    model_cls = import_runtime()
+    if INFERENCE_BACKEND == 'torch':
+        return model_cls(local_path)
+    return model_cls(local_path, runtime=INFERENCE_BACKEND)
+
+def model_artifact_suffix():
+    """El registro apunta al .pt; los runtimes exportados usan el .onnx de la misma carpeta"""
+    if INFERENCE_BACKEND == 'torch':
+        return None
+    return '_int8.onnx' if MODEL_INT8 else '.onnx'
+
 def load_model():
-    local_model_path = "/tmp/model.pt"
-    # Parseo manual o usa una función auxiliar para s3://
-    bucket = "phenoberry-dev-artifacts-038876987034"
-    key = "model_legacy/yolo_nano_gpu.pt"
-    
-    if not os.path.exists(local_model_path):
-        print(f"Descargando modelo desde S3: {key}...")
-        s3_client.download_file(bucket, key, local_model_path)
-    
-    return YOLO(local_model_path)
-
-model = load_model()
+    return get_model(build_model, artifact_suffix=model_artifact_suffix())
 
-def run_inference(tile_s3_path, tile_id):
-    # 1. Descarga del tile
-    # tile_s3_path asumiendo formato s3://bucket/key
-    path_parts = tile_s3_path.replace("s3://", "").split("/", 1)
-    tile_bucket = path_parts[0]
-    tile_key = path_parts[1]
-    
-    local_tile = f"/tmp/{os.path.basename(tile_key)}"
-    s3_client.download_file(tile_bucket, tile_key, local_tile)
-    
-    # 2. Inferencia
-    results = model(local_tile, conf=0.25) # Agregamos confianza mínima
-    result = results[0]
-    
-    # 3. Guardar resultados en JSON (Formato YOLOv8+)
-    json_results = []
-    for box in result.boxes:
-        json_results.append({
-            "box": box.xyxy[0].tolist(),
-            "conf": float(box.conf[0]),
-            "cls": int(box.cls[0]),
-            "name": result.names[int(box.cls[0])]
+def warmup():
+    """Primera inferencia en vacío (reserva memoria / compila kernels) fuera del camino de la petición"""
+    with timed('warmup'):
+        predict_arrays([np.zeros((640, 640, 3), dtype=np.uint8)])
+
+def predict_arrays(images, conf=CONF_THRESHOLD):
+    """
+    Una sola pasada del modelo para una lista de imagenes BGR (np.ndarray).
+    Devuelve una lista alineada de dicts con arrays: xyxy (N,4), conf (N,), cls (N,).
+    """
+    model = load_model()
+    if INFERENCE_BACKEND != 'torch':
+        return model.predict_arrays(images, conf=conf)
+
+    results = model(images, conf=conf, verbose=False)
+    outputs = []
+    for result in results:
+        boxes = result.boxes
+        outputs.append({
+            "xyxy": boxes.xyxy.cpu().numpy(),
+            "conf": boxes.conf.cpu().numpy(),
+            "cls": boxes.cls.cpu().numpy().astype(int),
         })
-    
-    json_path = f"/tmp/{tile_id}.json"
-    with open(json_path, 'w') as f:
-        json.dump(json_results, f)
-    
-    s3_client.upload_file(json_path, OUTPUT_BUCKET, f"results/{tile_id}.json")
-    
-    # 4. Crear overlay
-    img = Image.open(local_tile)
-    draw = ImageDraw.Draw(img)
-    
-    # Dibujamos las cajas detectadas
-    for res in json_results:
-        draw.rectangle(res["box"], outline="red", width=3)
-        # Opcional: Escribir la etiqueta
-        draw.text((res["box"][0], res["box"][1]), f"{res['name']} {res['conf']:.2f}")
-
-    overlay_path = f"/tmp/{tile_id}_overlay.jpg"
-    img.save(overlay_path)
-    s3_client.upload_file(overlay_path, OUTPUT_BUCKET, f"overlays/{tile_id}_detected.jpg")
-    
-    print(f"✅ Inferencia completada para {tile_id}")
\ No newline at end of file
+    return outputs
+
+def to_json_results(pred):
+    """Formato JSON de resultados por tile (YOLOv8+)"""
+    names = load_model().names
+    return [
+        {
+            "box": box.tolist(),
+            "conf": float(conf),
+            "cls": int(cls),
+            "name": names[int(cls)]
+        }
+        for box, conf, cls in zip(pred["xyxy"], pred["conf"], pred["cls"])
+    ]
+
+def tile_boxes_for(bucket, filename_prefix):
+    """
+    ({nombre_tile: (x_start, y_start, x_end, y_end)}, scale, media_id) del manifest que
+    guardó el tiler, o None si la foto no tiene manifest (tiles antiguos): sus coordenadas
+    en la imagen se calculan luego en la reconstrucción.
+    media_id es el id de la tabla de tracking (el prefijo en manifests anteriores).
+    Un error al leerlo (no que falte) se propaga: el tile se reintenta en vez de
+    guardarse bajo otro media_id.
+    """
+    key = (bucket, filename_prefix)
+    if key in _geometry_cache:
+        _geometry_cache.move_to_end(key)
+        return _geometry_cache[key]
+    manifest = read_geometry(s3_client, bucket, filename_prefix)
+    if manifest is None:
+        return None
+
+    geometry = (manifest_tile_boxes(manifest), manifest.get("scale", 1), manifest.get("media_id", filename_prefix))
+    _geometry_cache[key] = geometry
+    if len(_geometry_cache) > GEOMETRY_CACHE_SIZE:
+        _geometry_cache.popitem(last=False)
+    return geometry
+
+def record_results_key(buffer, results_key):
+    """
+    Anota el Parquet en results_keys del item de tracking de cada foto del buffer, para
+    que la reconstrucción no tenga que listar la partición del día. Sin DYNAMO_TABLE
+    no se anota (la reconstrucción cae a listar las fechas).
+    """
+    if tracking.TABLE_NAME:
+        tracking.add_results_key(buffer.columns["media_id"], results_key)
+
+def run_inference_batch(tile_s3_paths, tile_ids=None, payloads=None, part_id=None, created=None):
+    """
+    Inferencia por lotes de N tiles.
+    - Descarga concurrente de los tiles a memoria (sin /tmp).
+    - Un forward del modelo por lote (hasta INFERENCE_BATCH_SIZE tiles).
+    - Detecciones de todos los tiles en un único Parquet (results/detections/...),
+      con coordenadas de la imagen original si el tiler guardó la geometría.
+    - Overlays solo para los tiles muestreados (OVERLAY_MODE), después de guardar
+      las detecciones: nunca retrasan ni hacen fallar los resultados.
+    - payloads: bytes ya descargados (alineados con tile_s3_paths), por ejemplo
+      mientras el modelo se cargaba en otro hilo.
+    - part_id / created: nombre y fecha fijos del Parquet (ver DetectionBuffer); con los
+      mismos valores un reintento reemplaza la parte anterior.
+    Devuelve {'processed': [tile_id, ...], 'failed': [(tile_id, error), ...]}.
+    """
+    if tile_ids is None:
+        tile_ids = [os.path.splitext(os.path.basename(p))[0] for p in tile_s3_paths]
+
+    processed, failed = [], []
+    buffer = DetectionBuffer(model_version(), part_id=part_id, created=created)
+    sampled = []
+    for start in range(0, len(tile_s3_paths), INFERENCE_BATCH_SIZE):
+        batch_paths = tile_s3_paths[start:start + INFERENCE_BATCH_SIZE]
+        batch_ids = tile_ids[start:start + INFERENCE_BATCH_SIZE]
+
+        # 1. Descarga concurrente de los tiles (si no vienen ya descargados)
+        if payloads is None:
+            batch_payloads = download_many(s3_client, [parse_s3_uri(p) for p in batch_paths], max_workers=S3_CONCURRENCY)
+        else:
+            batch_payloads = payloads[start:start + INFERENCE_BATCH_SIZE]
+
+        ids, paths, images = [], [], []
+        for tile_id, tile_path, payload in zip(batch_ids, batch_paths, batch_payloads):
+            img = None if isinstance(payload, Exception) else decode_image(payload)
+            if img is None:
+                failed.append((tile_id, str(payload) if isinstance(payload, Exception) else INVALID_IMAGE))
+                continue
+            ids.append(tile_id)
+            paths.append(tile_path)
+            images.append(img)
+
+        if not images:
+            continue
+
+        # 2. Inferencia (un solo forward para todo el lote)
+        preds = predict_arrays(images)
+
+        # 3. Detecciones al buffer columnar (los overlays se dejan para el final)
+        names = load_model().names
+        for tile_id, tile_path, img, pred in zip(ids, paths, images, preds):
+            parsed = parse_tile_name(tile_id)
+            prefix, row, col = (parsed[0], parsed[3], parsed[4]) if parsed else (tile_id, None, None)
+            try:
+                geometry = tile_boxes_for(parse_s3_uri(tile_path)[0], prefix) if parsed else None
+            except Exception as e:
+                failed.append((tile_id, f"geometría: {e}"))
+                continue
+            boxes, scale, media_id = geometry or ({}, 1, prefix)
+            offset = boxes[tile_id][:2] if tile_id in boxes else None
+            buffer.add(media_id, pred, names, tile=tile_id, row=row, col=col, offset=offset, scale=scale)
+            if should_render(tile_id):
+                sampled.append((tile_id, img, pred))
+            processed.append(tile_id)
+
+    # 4. Un solo Parquet por invocación (y su key en el item de cada foto)
+    try:
+        results_key = buffer.flush_to_s3(s3_client, OUTPUT_BUCKET)
+        if results_key:
+            print(f"Detecciones guardadas en s3://{OUTPUT_BUCKET}/{results_key}")
+            record_results_key(buffer, results_key)
+    except Exception as e:
+        failed.extend((tile_id, f"resultados: {e}") for tile_id in processed)
+        processed, sampled = [], []
+
+    # 5. Overlays muestreados (accesorios: si fallan no se reintenta la inferencia)
+    if sampled:
+        names = load_model().names
+        outputs = ((overlay_key(tile_id), render_overlay(img, pred, names)) for tile_id, img, pred in sampled)
+        _, overlay_failed = upload_many(s3_client, OUTPUT_BUCKET, outputs, max_workers=S3_CONCURRENCY, content_type='image/jpeg')
+        if overlay_failed:
+            print(f"⚠️ Fallaron {len(overlay_failed)} overlays: {overlay_failed[:3]}")
+
+    print(f"✅ Inferencia completada: {len(processed)} tiles OK, {len(failed)} con error")
+    return {'processed': processed, 'failed': failed}
+
+def run_inference(tile_s3_path, tile_id):
+    """Inferencia de un solo tile (compatibilidad): lote de tamano 1"""
+    return run_inference_batch([tile_s3_path], [tile_id])
+
+def predict_image(image, filename_prefix="image"):
+    """
+    Inferencia sobre la foto completa (slice-and-merge):
+    tiling en memoria -> tiles en lotes -> cajas desplazadas al offset de cada tile
+    -> fusion global por clase de los duplicados en las zonas de solape.
+    Devuelve (detecciones en coordenadas de la imagen, (w, h)) o (None, None).
+    """
+    img = decode_image(image)
+    if img is None:
+        return None, None
+    h, w = img.shape[:2]
+
+    crops = list(iter_tile_crops(img, filename_prefix))
+    shifted = []
+    for start in range(0, len(crops), INFERENCE_BATCH_SIZE):
+        batch = crops[start:start + INFERENCE_BATCH_SIZE]
+        preds = predict_arrays([crop for _, _, crop in batch])
+        shifted.extend(shift_to_image(pred, tile_box) for (_, tile_box, _), pred in zip(batch, preds))
+
+    # IoS (interseccion / caja menor): una baya cortada en el borde de un tile
+    # queda contenida en la caja completa del tile vecino
+    merged = merge_detections(
+        concat_detections(shifted), MERGE_IOS_THRESHOLD, method=MERGE_METHOD, metric="ios"
+    )
+    merged["xyxy"][:, [0, 2]] = merged["xyxy"][:, [0, 2]].clip(0, w)
+    merged["xyxy"][:, [1, 3]] = merged["xyxy"][:, [1, 3]].clip(0, h)
+    return merged, (w, h)
+
+def run_inference_image(image_s3_path, media_id, image_bytes=None, part_id=None, created=None):
+    """
+    Modo imagen completa: una llamada por foto original (sin subir tiles a S3).
+    Escribe las detecciones fusionadas (coordenadas de la imagen) en un Parquet;
+    el overlay queda para la reconstrucción.
+    - part_id / created: como en run_inference_batch; un reintento del mismo evento
+      reemplaza el Parquet de la foto en vez de duplicar sus filas.
+    """
+    if image_bytes is None:
+        image_bytes = get_bytes(s3_client, *parse_s3_uri(image_s3_path))
+    img = decode_image(image_bytes)
+    dets, size = predict_image(img, filename_prefix=media_id)
+    if dets is None:
+        raise ValueError(f"No se pudo decodificar la imagen: {image_s3_path}")
+
+    buffer = DetectionBuffer(model_version(), part_id=part_id, created=created)
+    buffer.add(media_id, dets, load_model().names, image_coords=True)
+    results_key = buffer.flush_to_s3(s3_client, OUTPUT_BUCKET)
+    if results_key:
+        record_results_key(buffer, results_key)
+    # El overlay de la foto no se dibuja acá: lo genera la reconstrucción (visualizer)
+    # para las fotos muestreadas, fuera del camino de la inferencia
+
+    payload = {
+        "media_id": media_id,
+        "source": image_s3_path,
+        "image_size": list(size),
+        "results_key": results_key,
+        "detections": to_json_results(dets),
+    }
+    print(f"✅ Inferencia (imagen completa) para {media_id}: {len(payload['detections'])} detecciones")
+    return payload
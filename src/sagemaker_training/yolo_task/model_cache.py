@@ -0,0 +1,125 @@
+import os
+import time
+import threading
+import boto3
+from botocore.exceptions import ClientError
+from src.common.s3_io import parse_s3_uri
+from src.common.metrics import timed
+
+# Registro de modelos: item fijo que escribe model_registry/register.py
+TABLE_NAME = os.environ.get('DYNAMO_TABLE')
+MODEL_REGISTRY_ID = 'LATEST_YOLO_MODEL'
+# Cada cuanto (segundos) se comprueba si hay un modelo nuevo
+MODEL_REFRESH_SECONDS = int(os.environ.get('MODEL_REFRESH_SECONDS', 300))
+MODEL_CACHE_DIR = os.environ.get('MODEL_CACHE_DIR', '/tmp/models')
+# Modelo por defecto si el registro no existe o no hay tabla configurada
+FALLBACK_MODEL_URI = os.environ.get(
+    'FALLBACK_MODEL_URI', "s3://phenoberry-dev-artifacts-038876987034/model_legacy/yolo_nano_gpu.pt"
+)
+
+s3_client = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+
+# Estado del contenedor (sobrevive entre invocaciones "calientes")
+_state = {'model': None, 'version': None, 's3_path': None, 'etag': None, 'checked_at': 0.0}
+_lock = threading.Lock()
+
+def resolve_registry_entry():
+    """Lee (model_version, s3_path) del item LATEST_YOLO_MODEL en DynamoDB"""
+    if TABLE_NAME:
+        item = dynamodb.Table(TABLE_NAME).get_item(
+            Key={'media_id': MODEL_REGISTRY_ID},
+            ProjectionExpression='model_version, s3_path'
+        ).get('Item')
+        if item and item.get('s3_path'):
+            return item.get('model_version') or 'unknown', item['s3_path']
+    return 'legacy', FALLBACK_MODEL_URI
+
+def local_model_path(version, etag, s3_path):
+    ext = os.path.splitext(s3_path)[1] or '.pt'
+    etag = etag.strip('"')
+    return os.path.join(MODEL_CACHE_DIR, f"{version}-{etag}{ext}")
+
+def _head_if_changed(bucket, key, etag):
+    """HEAD condicional: devuelve None si el objeto no cambió (304), si no la respuesta"""
+    try:
+        kwargs = {'IfNoneMatch': etag} if etag else {}
+        return s3_client.head_object(Bucket=bucket, Key=key, **kwargs)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+            return None
+        raise
+
+def _download(bucket, key, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.part{os.getpid()}"
+    s3_client.download_file(bucket, key, tmp_path)
+    os.replace(tmp_path, path)
+
+def _cleanup(keep_path):
+    # /tmp es limitado: solo conservamos el modelo activo
+    for name in os.listdir(MODEL_CACHE_DIR):
+        path = os.path.join(MODEL_CACHE_DIR, name)
+        if path != keep_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def artifact_path(s3_path, artifact_suffix):
+    """model/model.pt + '.onnx' -> model/model.onnx (artefacto hermano)"""
+    if not artifact_suffix:
+        return s3_path
+    return s3_path.rsplit('.', 1)[0] + artifact_suffix
+
+def _refresh(builder, artifact_suffix=None):
+    version, s3_path = resolve_registry_entry()
+    s3_path = artifact_path(s3_path, artifact_suffix)
+    bucket, key = parse_s3_uri(s3_path)
+
+    same_object = _state['model'] is not None and s3_path == _state['s3_path']
+    head = _head_if_changed(bucket, key, _state['etag'] if same_object else None)
+    if head is None:
+        return False
+
+    etag = head['ETag']
+    path = local_model_path(version, etag, s3_path)
+    if not os.path.exists(path):
+        print(f"Descargando modelo {version} desde {s3_path}...")
+        with timed('model_download'):
+            _download(bucket, key, path)
+
+    # Se construye el modelo nuevo antes de reemplazar el actual (hot-swap)
+    with timed('model_build'):
+        model = builder(path)
+    _state.update(model=model, version=version, s3_path=s3_path, etag=etag)
+    _cleanup(path)
+    print(f"Modelo activo: {version} ({etag})")
+    return True
+
+def get_model(builder, artifact_suffix=None):
+    """
+    Devuelve el modelo activo, construyéndolo con builder(local_path) si hace falta.
+    artifact_suffix elige un artefacto hermano del registrado (ej: '.onnx').
+    Como mucho cada MODEL_REFRESH_SECONDS se consulta el registro y se hace un HEAD
+    condicional (If-None-Match) sobre el artefacto; si cambió, se descarga y se
+    reemplaza el modelo sin reiniciar el contenedor.
+    """
+    if _state['model'] is not None and time.monotonic() - _state['checked_at'] < MODEL_REFRESH_SECONDS:
+        return _state['model']
+
+    with _lock:
+        if _state['model'] is None or time.monotonic() - _state['checked_at'] >= MODEL_REFRESH_SECONDS:
+            try:
+                _refresh(builder, artifact_suffix)
+            except Exception as e:
+                if _state['model'] is None:
+                    raise
+                # Si falla la comprobación seguimos con el modelo que ya tenemos
+                print(f"⚠️ No se pudo comprobar el modelo ({e}), se mantiene {_state['version']}")
+            _state['checked_at'] = time.monotonic()
+
+    return _state['model']
+
+def model_version():
+    return _state['version']
@@ -0,0 +1,114 @@
+import ast
+import cv2
+import numpy as np
+from src.common.detections import merge_detections
+
+# Mismos nombres que data.yaml de train_yolo (por si el artefacto no trae metadata)
+DEFAULT_NAMES = {0: "flor", 1: "arandano"}
+DEFAULT_IMGSZ = 640
+# IoU del NMS interno del modelo (el mismo valor por defecto que Ultralytics)
+NMS_IOU = 0.7
+
+def letterbox(img, imgsz):
+    """Redimensiona manteniendo proporción y rellena con gris (114) hasta imgsz x imgsz"""
+    h, w = img.shape[:2]
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_x, pad_y = (imgsz - new_w) / 2, (imgsz - new_h) / 2
+
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return img, ratio, (left, top)
+
+def preprocess(images, imgsz):
+    """Lista de imágenes BGR -> tensor NCHW float32 RGB [0, 1] + parámetros del letterbox"""
+    batch, meta = [], []
+    for img in images:
+        boxed, ratio, pad = letterbox(img, imgsz)
+        batch.append(boxed[:, :, ::-1].transpose(2, 0, 1))
+        meta.append((ratio, pad, img.shape[:2]))
+    tensor = np.ascontiguousarray(np.stack(batch), dtype=np.float32) / 255.0
+    return tensor, meta
+
+def postprocess(output, meta, conf):
+    """
+    Salida cruda de YOLOv8 (B, 4 + nc, anchors) -> lista de dicts xyxy/conf/cls
+    en coordenadas de cada imagen original.
+    """
+    results = []
+    for pred, (ratio, (pad_x, pad_y), (h, w)) in zip(output, meta):
+        pred = pred.T                      # (anchors, 4 + nc)
+        scores = pred[:, 4:]
+        cls = scores.argmax(axis=1)
+        best = scores[np.arange(len(scores)), cls]
+        keep = best >= conf
+
+        cx, cy, bw, bh = pred[keep, :4].T
+        xyxy = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+        dets = merge_detections(
+            {"xyxy": xyxy, "conf": best[keep].astype(np.float32), "cls": cls[keep].astype(np.int64)},
+            iou_threshold=NMS_IOU
+        )
+        # Deshacer el letterbox
+        xyxy = dets["xyxy"].astype(np.float32)
+        xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - pad_x) / ratio).clip(0, w)
+        xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pad_y) / ratio).clip(0, h)
+        results.append({"xyxy": xyxy, "conf": dets["conf"], "cls": dets["cls"]})
+    return results
+
+def _parse_names(raw):
+    if not raw:
+        return dict(DEFAULT_NAMES)
+    return {int(k): v for k, v in ast.literal_eval(raw).items()}
+
+class ExportedYolo:
+    """
+    Modelo YOLOv8 exportado a ONNX ejecutado sin Ultralytics/PyTorch.
+    - runtime="onnx": onnxruntime (CPUExecutionProvider).
+    - runtime="openvino": OpenVINO leyendo el mismo .onnx.
+    """
+
+    def __init__(self, path, runtime="onnx"):
+        self.runtime = runtime
+        self.names = dict(DEFAULT_NAMES)
+        self.imgsz = DEFAULT_IMGSZ
+        self.dynamic_batch = True
+
+        if runtime == "onnx":
+            import onnxruntime as ort
+            self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+            meta = self.session.get_modelmeta().custom_metadata_map
+            self.names = _parse_names(meta.get("names"))
+            if meta.get("imgsz"):
+                self.imgsz = int(ast.literal_eval(meta["imgsz"])[0])
+            model_input = self.session.get_inputs()[0]
+            self.input_name = model_input.name
+            self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        elif runtime == "openvino":
+            import openvino as ov
+            core = ov.Core()
+            model = core.read_model(path)
+            self.dynamic_batch = model.input(0).get_partial_shape()[0].is_dynamic
+            self.compiled = core.compile_model(model, "CPU")
+        else:
+            raise ValueError(f"Runtime desconocido: {runtime}")
+
+    def _forward(self, tensor):
+        if self.runtime == "onnx":
+            return self.session.run(None, {self.input_name: tensor})[0]
+        return self.compiled(tensor)[self.compiled.output(0)]
+
+    def predict_arrays(self, images, conf=0.25):
+        """Misma salida que infer_yolo.predict_arrays: lista de dicts xyxy/conf/cls"""
+        if not images:
+            return []
+        tensor, meta = preprocess(images, self.imgsz)
+        if self.dynamic_batch:
+            output = self._forward(tensor)
+        else:
+            output = np.concatenate([self._forward(tensor[i:i + 1]) for i in range(len(tensor))])
+        return postprocess(output, meta, conf)
@@ -30,11 +30,29 @@ if not S3_BUCKET:
 
 # El código del repo se extrae en /opt/ml/code
 sys.path.append("/opt/ml/code")
-from src.common.tiling import process_tiling
+from src.sagemaker_training.yolo_task.dataset_tiling import (
+    tile_dataset, tiling_params, dataset_key, pack_dataset, unpack_dataset
+)
+from src.common.tiling import TILING_IMGSZ
+from src.common.shards import load_index
+from src.common.s3_io import upload_files
 
 # Usamos /tmp para el procesamiento intermedio (es el disco local del contenedor)
 LOCAL_TILED = "/tmp/tiled"
 LOCAL_RUNS = "/tmp/runs"
+LOCAL_SHARDS = "/tmp/shards"
+# Cache de tiles por contenido en disco local (opcional, vacío = sin cache). No va en
+# /opt/ml/checkpoints: SageMaker sincroniza esa carpeta con S3 archivo por archivo.
+# Entre jobs el dataset tileado se reutiliza con los shards (ver SHARDS_DIR)
+TILE_CACHE_DIR = os.environ.get('TILE_CACHE_DIR') or None
+# Versión del dataset: la misma que usa sagemaker_trigger para el canal de entrenamiento
+DATASET_VERSION = os.environ.get('DATASET_VERSION', 'dataset_v001')
+TILING_WORKERS = int(os.environ.get('TILING_WORKERS', os.cpu_count() or 1))
+# Dataset tileado en shards dentro del canal de entrenamiento: DATA_PATH/shards/<clave>/.
+# Se producen una vez y se suben al mismo prefijo S3 del canal; con TrainingInputMode
+# FastFile los siguientes jobs leen pocos objetos grandes en vez de tilear de nuevo
+SHARDS_DIR = "shards"
+USE_SHARDS = os.environ.get('USE_SHARDS', '1') == '1'
 
 # Parámetros del Dataset
 TARGET_EMPTY_RATIO = 0.15
@@ -43,23 +61,50 @@ FLOWER_OVERSAMPLE_FACTOR = 10
 FLOWER_CLASS_ID = 0
 BLUEBERRY_CLASS_ID = 1
 
+# Artefactos para inferencia en CPU (junto a model.pt en MODEL_OUTPUT)
+# Mismo lado que usa el planificador de tiles (TILING_IMGSZ) para entrenar e inferir
+IMGSZ = TILING_IMGSZ
+EXPORT_INT8 = os.environ.get('EXPORT_INT8', '1') == '1'
+INT8_CALIBRATION_IMAGES = 200
+
 s3_client = boto3.client('s3')
 
 # =========================================================
 # UTILIDADES DE REPORTE
 # =========================================================
 
-def get_class_counts(label_dir):
-    counts = {FLOWER_CLASS_ID: 0, BLUEBERRY_CLASS_ID: 0}
-    for txt in glob.glob(os.path.join(label_dir, "*.txt")):
+def scan_labels(label_dir):
+    """
+    Una sola pasada por las etiquetas de un split.
+    Devuelve {basename: {clase: conteo}} (un dict vacío = tile de background).
+    """
+    label_stats = {}
+    for entry in os.scandir(label_dir):
+        if not entry.name.endswith(".txt"):
+            continue
+        counts = {}
         try:
-            with open(txt) as f:
+            with open(entry.path) as f:
                 for line in f:
-                    cls = int(line.split()[0])
-                    if cls in counts:
-                        counts[cls] += 1
-        except:
-            pass
+                    try:
+                        cls = int(line.split()[0])
+                    except (ValueError, IndexError):
+                        continue
+                    counts[cls] = counts.get(cls, 0) + 1
+        except OSError:
+            continue
+        label_stats[entry.name[:-len(".txt")]] = counts
+    return label_stats
+
+def get_class_counts(label_dir, label_stats=None, weights=None):
+    """Conteo por clase. Con weights ({basename: peso}) refleja el muestreo ponderado."""
+    if label_stats is None:
+        label_stats = scan_labels(label_dir)
+    counts = {FLOWER_CLASS_ID: 0, BLUEBERRY_CLASS_ID: 0}
+    for base, tile_counts in label_stats.items():
+        weight = 1 if weights is None else weights.get(base, 0)
+        for cls in counts:
+            counts[cls] += tile_counts.get(cls, 0) * weight
     return counts
 
 def simple_report(name, counts):
@@ -76,95 +121,171 @@ def simple_report(name, counts):
 # BALANCE BACKGROUND AUTOMÁTICO
 # =========================================================
 
-def enforce_background_ratio_train(img_dir, lbl_dir, background_ratio=0.15, seed=42):
-    random.seed(seed)
-    label_files = glob.glob(os.path.join(lbl_dir, "*.txt"))
-    empty_tiles, non_empty_tiles = [], []
+def enforce_background_ratio_train(label_stats, background_ratio=0.15, seed=42):
+    """
+    Elige qué tiles vacíos quedan fuera del entrenamiento (sin borrar archivos).
+    Devuelve el set de basenames descartados.
+    """
+    rng = random.Random(seed)
+    empty_tiles = sorted(base for base, counts in label_stats.items() if not counts)
 
-    for lbl in label_files:
-        try:
-            with open(lbl, "r") as f:
-                content = f.read().strip()
-            if content == "":
-                empty_tiles.append(lbl)
-            else:
-                non_empty_tiles.append(lbl)
-        except:
-            continue
-
-    total_tiles = len(label_files)
-    if total_tiles == 0: return
+    total_tiles = len(label_stats)
+    if total_tiles == 0: return set()
 
     target_empty = int(total_tiles * background_ratio)
     print(f"\n🎯 Control background: Tot={total_tiles}, Vacíos={len(empty_tiles)}, Obj={target_empty}")
 
+    dropped = set()
     if len(empty_tiles) > target_empty:
-        random.shuffle(empty_tiles)
-        to_remove = empty_tiles[target_empty:]
-        for lbl in to_remove:
-            base = os.path.splitext(os.path.basename(lbl))[0]
-            for img in glob.glob(os.path.join(img_dir, base + ".*")):
-                os.remove(img)
-            os.remove(lbl)
-        print(f"🧹 Eliminados {len(to_remove)} tiles vacíos adicionales.")
+        rng.shuffle(empty_tiles)
+        dropped = set(empty_tiles[target_empty:])
+        print(f"🧹 Excluidos {len(dropped)} tiles vacíos adicionales.")
+    return dropped
 
 # =========================================================
 # OVERSAMPLING DE FLORES
 # =========================================================
 
-def apply_balancing(train_img_dir, train_lbl_dir):
+def apply_balancing(label_stats, dropped=()):
+    """
+    Oversampling de flores como pesos de muestreo (sin copiar archivos).
+    Devuelve {basename: peso}; los tiles con muchas flores aparecen
+    1 + FLOWER_OVERSAMPLE_FACTOR veces en la lista de entrenamiento y los
+    descartados por enforce_background_ratio_train tienen peso 0.
+    """
     print("\n🌸 Aplicando oversampling de flores...")
-    txt_files = glob.glob(os.path.join(train_lbl_dir, "*.txt"))
+    weights = {}
     stats = {"aug_imgs": 0, "copies": 0}
 
-    for txt_path in txt_files:
-        try:
-            with open(txt_path) as f:
-                lines = f.readlines()
-        except: continue
-
-        total = flower_count = 0
-        for l in lines:
-            try:
-                cls = int(l.split()[0])
-                total += 1
-                if cls == FLOWER_CLASS_ID: flower_count += 1
-            except: pass
-
-        ratio = flower_count / total if total > 0 else 0.0
+    for base, counts in label_stats.items():
+        if base in dropped:
+            weights[base] = 0
+            continue
+        total = sum(counts.values())
+        ratio = counts.get(FLOWER_CLASS_ID, 0) / total if total > 0 else 0.0
 
+        weights[base] = 1
         if ratio >= MIN_FLOWER_RATIO:
-            basename = os.path.basename(txt_path).replace(".txt", "")
-            img_candidates = glob.glob(os.path.join(train_img_dir, basename + ".*"))
-            if not img_candidates: continue
-
-            src_img = img_candidates[0]
-            ext = os.path.splitext(src_img)[1]
+            weights[base] += FLOWER_OVERSAMPLE_FACTOR
             stats["aug_imgs"] += 1
-
-            for i in range(FLOWER_OVERSAMPLE_FACTOR):
-                new_name = f"{basename}_aug_{i}"
-                shutil.copy(src_img, os.path.join(train_img_dir, new_name + ext))
-                shutil.copy(txt_path, os.path.join(train_lbl_dir, new_name + ".txt"))
-                stats["copies"] += 1
-
-    print(f"✔ Tiles aumentados: {stats['aug_imgs']} | Copias: {stats['copies']}")
+            stats["copies"] += FLOWER_OVERSAMPLE_FACTOR
+
+    print(f"✔ Tiles aumentados: {stats['aug_imgs']} | Copias (virtuales): {stats['copies']}")
+    return weights
+
+def write_image_list(img_dir, weights, list_path):
+    """
+    Escribe la lista de imágenes de entrenamiento (formato txt de Ultralytics),
+    repitiendo cada ruta según su peso. Las imágenes sin archivo de etiqueta
+    (background sin anotaciones) entran con peso 1. Devuelve el total de líneas.
+    """
+    n_lines = 0
+    with open(list_path, "w") as f:
+        for entry in sorted(os.scandir(img_dir), key=lambda e: e.name):
+            base = os.path.splitext(entry.name)[0]
+            weight = weights.get(base, 1)
+            for _ in range(weight):
+                f.write(entry.path + "\n")
+                n_lines += 1
+    return n_lines
 
 def upload_dir_to_s3(local_dir, bucket, s3_prefix):
+    """Sube un directorio en paralelo (ver s3_io.upload_files)"""
+    uploads = []
     for root, dirs, files in os.walk(local_dir):
         for file in files:
             local_path = os.path.join(root, file)
             relative_path = os.path.relpath(local_path, local_dir)
             s3_path = os.path.join(s3_prefix, relative_path).replace("\\","/")
-            s3_client.upload_file(local_path, bucket, s3_path)
-    print(f"✅ Subido {local_dir} a s3://{bucket}/{s3_prefix}")
+            uploads.append((local_path, s3_path))
+    # Los .pt se suben al final: su llegada dispara el registro del modelo y
+    # los artefactos hermanos (.onnx) ya tienen que estar en S3
+    failed = []
+    for is_pt in (False, True):
+        batch = [u for u in uploads if u[0].endswith(".pt") == is_pt]
+        failed += upload_files(s3_client, bucket, batch)[1]
+        if failed:
+            break
+    if failed:
+        raise RuntimeError(f"Fallaron {len(failed)} subidas a s3://{bucket}/{s3_prefix}: {failed[:3]}")
+    print(f"✅ Subido {local_dir} a s3://{bucket}/{s3_prefix} ({len(uploads)} archivos)")
+
+def publish_shards(key, dataset_prefix):
+    """
+    Empaqueta LOCAL_TILED en shards y los sube a <dataset_prefix>/shards/<key>/ (dentro
+    del canal de entrenamiento). index.json se sube al final: su presencia indica que
+    los shards están completos. Un fallo no invalida el entrenamiento.
+    """
+    try:
+        if os.path.exists(LOCAL_SHARDS): shutil.rmtree(LOCAL_SHARDS)
+        pack_dataset(LOCAL_TILED, LOCAL_SHARDS, meta={'dataset_key': key, 'tiling': tiling_params()})
+        s3_prefix = f"{dataset_prefix}/{SHARDS_DIR}/{key}"
+        files = sorted(os.listdir(LOCAL_SHARDS), key=lambda name: name == "index.json")
+        for batch in (files[:-1], files[-1:]):
+            _, failed = upload_files(s3_client, S3_BUCKET, [(os.path.join(LOCAL_SHARDS, f), f"{s3_prefix}/{f}") for f in batch])
+            if failed:
+                raise RuntimeError(f"{len(failed)} subidas fallidas: {failed[:3]}")
+        print(f"✅ Shards publicados en s3://{S3_BUCKET}/{s3_prefix}")
+    except Exception as e:
+        print(f"⚠️ No se pudieron publicar los shards: {e}")
+
+# =========================================================
+# EXPORT PARA INFERENCIA EN CPU (ONNX / INT8)
+# =========================================================
+
+def quantize_onnx_int8(onnx_path, output_path, calib_dir):
+    """Cuantización estática INT8 (QDQ) calibrada con tiles de validación"""
+    from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_static
+    import cv2
+    import onnxruntime as ort
+    from src.sagemaker_training.yolo_task.onnx_backend import preprocess
+
+    input_name = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    images = sorted(glob.glob(os.path.join(calib_dir, "*.jpg")))[:INT8_CALIBRATION_IMAGES]
+
+    class TileReader(CalibrationDataReader):
+        def __init__(self):
+            self.paths = iter(images)
+
+        def get_next(self):
+            for path in self.paths:
+                img = cv2.imread(path)
+                if img is not None:
+                    return {input_name: preprocess([img], IMGSZ)[0]}
+            return None
+
+    quantize_static(
+        onnx_path, output_path, TileReader(),
+        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8
+    )
+
+def export_cpu_artifacts(best_model, calib_dir):
+    """
+    Exporta model.onnx (y model_int8.onnx si EXPORT_INT8) a MODEL_OUTPUT.
+    Un fallo del export no invalida el entrenamiento: model.pt sigue siendo válido.
+    """
+    try:
+        onnx_path = YOLO(best_model).export(format="onnx", imgsz=IMGSZ, dynamic=True, simplify=True)
+        shutil.copy(onnx_path, os.path.join(MODEL_OUTPUT, "model.onnx"))
+        print(f"✅ Export ONNX en {MODEL_OUTPUT}/model.onnx")
+    except Exception as e:
+        print(f"⚠️ Falló el export ONNX: {e}")
+        return
+
+    if EXPORT_INT8:
+        try:
+            quantize_onnx_int8(onnx_path, os.path.join(MODEL_OUTPUT, "model_int8.onnx"), calib_dir)
+            print(f"✅ Export INT8 en {MODEL_OUTPUT}/model_int8.onnx")
+        except Exception as e:
+            print(f"⚠️ Falló la cuantización INT8: {e}")
+
 # =========================================================
 # PIPELINE PRINCIPAL (MIGRADO A SAGEMAKER)
 # =========================================================
 
 def prepare_and_train():
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    dataset_version = "dataset_v001"  # Ajusta según tu dataset
+    dataset_version = DATASET_VERSION
     s3_prefix_base = f"sagemaker-runs/yolo/{dataset_version}_{timestamp}"
     # 1. Limpieza de carpetas temporales
     if os.path.exists(LOCAL_TILED): shutil.rmtree(LOCAL_TILED)
@@ -180,60 +301,74 @@ def prepare_and_train():
     for ext in ["*.jpg", "*.png", "*.JPG"]:
         raw_images.extend(glob.glob(os.path.join(DATA_PATH, "images", ext)))
 
-    populated, empty = [], []
-    for img in raw_images:
-        name = os.path.basename(img).rsplit(".", 1)[0]
-        lbl = os.path.join(DATA_PATH, "labels", name + ".txt")
-        if os.path.exists(lbl) and open(lbl).read().strip():
-            populated.append(img)
-        else:
-            empty.append(img)
-
-    random.shuffle(populated)
-    random.shuffle(empty)
-    final_dataset = populated + empty
-
-    n_total = len(final_dataset)
-    n_train = int(n_total * 0.8)
-    n_val = int(n_total * 0.1)
-
-    split_map = {
-        "train": final_dataset[:n_train],
-        "val": final_dataset[n_train:n_train + n_val],
-        "test": final_dataset[n_train + n_val:]
-    }
-
-    # 3. TILING
-    print("\n🧩 Ejecutando tiling...")
-    for split, imgs in split_map.items():
-        for img_path in imgs:
-            name = os.path.basename(img_path).rsplit(".", 1)[0]
-            lbl_path = os.path.join(DATA_PATH, "labels", name + ".txt")
-            lbl_path = lbl_path if os.path.exists(lbl_path) else None
-
-            process_tiling(
-                img_path=img_path,
-                output_dir_img=f"{LOCAL_TILED}/images/{split}",
-                output_dir_lbl=f"{LOCAL_TILED}/labels/{split}",
-                lbl_path=lbl_path,
-                filename_prefix=name,
-            )
+    # 3. TILING (paralelo + cache por contenido), o extracción de los shards de un job anterior
+    key = dataset_key(raw_images, DATA_PATH, tiling_params())
+    shard_dir = os.path.join(DATA_PATH, SHARDS_DIR, key)
+    if USE_SHARDS and load_index(shard_dir):
+        # Mismas imágenes y tiling: se reutilizan los tiles (y los splits) ya publicados
+        print(f"\n📦 Dataset {key} ya está en shards, se omite el tiling")
+        unpack_dataset(shard_dir, LOCAL_TILED, workers=TILING_WORKERS)
+    else:
+        populated, empty = [], []
+        for img in raw_images:
+            name = os.path.basename(img).rsplit(".", 1)[0]
+            lbl = os.path.join(DATA_PATH, "labels", name + ".txt")
+            if os.path.exists(lbl) and open(lbl).read().strip():
+                populated.append(img)
+            else:
+                empty.append(img)
+
+        random.shuffle(populated)
+        random.shuffle(empty)
+        final_dataset = populated + empty
+
+        n_total = len(final_dataset)
+        n_train = int(n_total * 0.8)
+        n_val = int(n_total * 0.1)
+
+        split_map = {
+            "train": final_dataset[:n_train],
+            "val": final_dataset[n_train:n_train + n_val],
+            "test": final_dataset[n_train + n_val:]
+        }
+
+        print(f"\n🧩 Ejecutando tiling... ({tiling_params()['grid']})")
+        tile_dataset(
+            split_map,
+            data_path=DATA_PATH,
+            output_root=LOCAL_TILED,
+            cache_dir=TILE_CACHE_DIR,
+            workers=TILING_WORKERS,
+        )
+
+        if USE_SHARDS:
+            publish_shards(key, f"datasets/yolo/{dataset_version}")
 
     # 4. BALANCEO Y REPORTES
-    enforce_background_ratio_train(f"{LOCAL_TILED}/images/train", f"{LOCAL_TILED}/labels/train", TARGET_EMPTY_RATIO)
-    
+    # Una sola lectura de las etiquetas de train; el balanceo se expresa como
+    # una lista ponderada de imágenes (train.txt) en vez de copiar/borrar archivos.
+    train_lbl_dir = f"{LOCAL_TILED}/labels/train"
+    label_stats = scan_labels(train_lbl_dir)
+
+    dropped = enforce_background_ratio_train(label_stats, TARGET_EMPTY_RATIO)
+    pre_weights = {base: 0 if base in dropped else 1 for base in label_stats}
+
     print("\n--- ESTADÍSTICAS PRE OVERSAMPLING ---")
-    simple_report("Train", get_class_counts(f"{LOCAL_TILED}/labels/train"))
+    simple_report("Train", get_class_counts(train_lbl_dir, label_stats, pre_weights))
     
-    apply_balancing(f"{LOCAL_TILED}/images/train", f"{LOCAL_TILED}/labels/train")
+    weights = apply_balancing(label_stats, dropped)
 
     print("\n--- ESTADÍSTICAS POST OVERSAMPLING ---")
-    simple_report("Train", get_class_counts(f"{LOCAL_TILED}/labels/train"))
+    simple_report("Train", get_class_counts(train_lbl_dir, label_stats, weights))
+
+    train_list = f"{LOCAL_TILED}/train.txt"
+    n_train_samples = write_image_list(f"{LOCAL_TILED}/images/train", weights, train_list)
+    print(f"📝 Lista de entrenamiento: {n_train_samples} muestras -> {train_list}")
 
     # 5. CONFIGURAR YAML PARA YOLO
     data_yaml = {
         "path": LOCAL_TILED,
-        "train": "images/train",
+        "train": "train.txt",
         "val": "images/val",
         "test": "images/test",
         "names": {0: "flor", 1: "arandano"},
@@ -249,7 +384,7 @@ def prepare_and_train():
     model.train(
         data="data.yaml",
         epochs=5, # Cambiando a 5 epocas para probar
-        imgsz=640,
+        imgsz=IMGSZ,
         batch=16,
         project=LOCAL_RUNS,
         name='yolo_aws',
@@ -279,6 +414,7 @@ def prepare_and_train():
         shutil.copy(best_model, os.path.join(MODEL_OUTPUT, "model.pt"))
         shutil.copy(best_model, os.path.join(run_dir, "best.pt"))
         print(f"✅ Modelo copiado a {MODEL_OUTPUT}")
+        export_cpu_artifacts(best_model, f"{LOCAL_TILED}/images/val")
     
     # Subiendo a S3 artifacts
     upload_dir_to_s3(run_dir, S3_BUCKET, f"{s3_prefix_base}/runs")
@@ -289,7 +425,12 @@ def prepare_and_train():
         "dataset_version": dataset_version,
         "timestamp": timestamp,
         "model_s3_path": f"s3://{S3_BUCKET}/{s3_prefix_base}/model/model.pt",
-        "runs_s3_path": f"s3://{S3_BUCKET}/{s3_prefix_base}/runs"
+        "runs_s3_path": f"s3://{S3_BUCKET}/{s3_prefix_base}/runs",
+        # La inferencia (tiler) debe usar la misma configuración de tiling
+        "tiling": tiling_params(),
+        # Shards del dataset tileado usados en este entrenamiento (datasets/yolo/<version>/shards/<clave>)
+        "dataset_key": key,
+        "imgsz": IMGSZ
     }
 
     manifest_path = os.path.join(LOCAL_RUNS, "manifest.json")
@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture
+def aws_env(monkeypatch):
+    """Credenciales y región falsas para los tests con moto (nunca tocan una cuenta real)"""
+    for name, value in (("AWS_DEFAULT_REGION", "us-east-1"), ("AWS_ACCESS_KEY_ID", "test"), ("AWS_SECRET_ACCESS_KEY", "test")):
+        monkeypatch.setenv(name, value)
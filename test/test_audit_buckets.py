@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+moto = pytest.importorskip("moto")
+
+import audit_buckets
+from src.common.tiling import tile_manifest
+
+
+def put_tiled_photo(s3, prefix, skipped_cells):
+    """Sube geometry/{prefix}.json y los tiles no descartados por el filtro (cuadrícula 3x4)"""
+    geometry = tile_manifest(prefix, 800, 600, plan=(3, 4, 0.2))
+    names = [t["name"] for t in geometry["tiles"]]
+    geometry["skipped"] = [names[i] for i in skipped_cells]
+    s3.put_object(Bucket="processed", Key=f"geometry/{prefix}.json", Body=json.dumps(geometry).encode())
+    for name in names:
+        if name not in geometry["skipped"]:
+            s3.put_object(Bucket="processed", Key=f"tiles/{prefix}/{name}.jpg", Body=b"x")
+
+
+def test_filtered_tiles_complete_photos_even_without_uploaded_tiles(aws_env):
+    boto3 = pytest.importorskip("boto3")
+    with moto.mock_aws():
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="processed")
+        put_tiled_photo(s3, "cielo", range(12))        # todo fondo: ningún tile subido
+        put_tiled_photo(s3, "parcial", [0, 1, 2])
+        put_tiled_photo(s3, "entera", [])
+
+        raw = audit_buckets.RawPhotos()
+        for name in ("cielo", "parcial", "entera", "sin_tilear"):
+            raw.add(f"uploads/{name}.jpg")
+        processed = audit_buckets.ProcessedTiles()
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket="processed"):
+            for obj in page["Contents"]:
+                processed.add(obj["Key"])
+
+        # Solo se leen las geometrías de las fotos que no están completas
+        assert audit_buckets.add_filtered_tiles(s3, "processed", processed, 4, raw.keys) == 2
+        # Solo "parcial" y "entera" pasaron por la inferencia
+        report = audit_buckets.audit(raw, processed, with_results={"parcial", "entera"})
+
+    assert report["missing_tiles"] == ["uploads/sin_tilear.jpg"]
+    assert report["incomplete_tiles"] == []
+    assert report["missing_results"] == []
+    assert report["all_filtered"] == ["cielo"]
+    assert report["complete"] == 3
@@ -0,0 +1,29 @@
+import cv2
+import numpy as np
+
+from src.sagemaker_training.yolo_task.dataset_tiling import tile_dataset
+
+
+def test_cache_entry_shared_by_identical_photos_links_under_each_name(tmp_path):
+    data = tmp_path / "data"
+    (data / "images").mkdir(parents=True)
+    (data / "labels").mkdir()
+    img = np.random.default_rng(0).integers(0, 255, (600, 800, 3), np.uint8)
+    for name in ("a", "b"):
+        cv2.imwrite(str(data / "images" / f"{name}.jpg"), img)
+        (data / "labels" / f"{name}.txt").write_text("0 0.5 0.5 0.1 0.1\n")
+
+    split_map = {"train": [str(data / "images" / "a.jpg")], "val": [str(data / "images" / "b.jpg")]}
+    out, cache = tmp_path / "out", tmp_path / "cache"
+    for kind in ("images", "labels"):
+        for split in split_map:
+            (out / kind / split).mkdir(parents=True)
+    stats = tile_dataset(split_map, str(data), str(out), cache_dir=str(cache), workers=1)
+
+    # Mismo contenido: una sola entrada de cache, pero cada split con sus propios nombres
+    assert stats["cache_hits"] == 1
+    train = sorted(p.name for p in (out / "images" / "train").iterdir())
+    val = sorted(p.name for p in (out / "images" / "val").iterdir())
+    assert train and all(n.startswith("a_grid") for n in train)
+    assert [n.replace("b_", "a_", 1) for n in val] == train
+    assert all(p.name.startswith("b_grid") for p in (out / "labels" / "val").iterdir())
@@ -0,0 +1,53 @@
+import numpy as np
+
+from src.common.detections import merge_detections, overlap_pairs, pairwise_overlap, shift_to_image
+
+
+def make_dets(boxes, conf, cls):
+    return {
+        "xyxy": np.asarray(boxes, dtype=np.float32),
+        "conf": np.asarray(conf, dtype=np.float32),
+        "cls": np.asarray(cls, dtype=np.int64),
+    }
+
+
+def test_merge_is_class_aware():
+    dets = make_dets(
+        [[0, 0, 10, 10], [1, 1, 11, 11], [0, 0, 10, 10], [50, 50, 60, 60]],
+        [0.9, 0.8, 0.7, 0.6],
+        [0, 0, 1, 0],
+    )
+    merged = merge_detections(dets)
+
+    assert merged["conf"].tolist() == np.float32([0.9, 0.7, 0.6]).tolist()
+    assert merged["cls"].tolist() == [0, 1, 0]
+
+
+def test_ios_merges_box_cut_at_tile_border():
+    # Misma baya: completa en un tile y cortada por el borde del tile vecino
+    full = shift_to_image(make_dets([[90, 10, 130, 50]], [0.9], [1]), (0, 0))
+    cut = shift_to_image(make_dets([[0, 10, 10, 50]], [0.6], [1]), (120, 0))
+    dets = {k: np.concatenate([full[k], cut[k]]) for k in full}
+
+    assert len(merge_detections(dets, metric="iou")["conf"]) == 2
+    merged = merge_detections(dets, metric="ios")
+    assert merged["xyxy"].tolist() == [[90, 10, 130, 50]]
+
+
+def test_wbf_averages_group_coordinates():
+    dets = make_dets([[0, 0, 10, 10], [2, 0, 12, 10]], [0.75, 0.25], [0, 0])
+    merged = merge_detections(dets, iou_threshold=0.5, method="wbf")
+
+    np.testing.assert_allclose(merged["xyxy"], [[0.5, 0, 10.5, 10]])
+
+
+def test_overlap_pairs_matches_dense_matrix():
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(0, 500, (300, 2))
+    boxes = np.concatenate([xy, xy + rng.uniform(5, 40, (300, 2))], axis=1)
+
+    for metric in ("iou", "ios"):
+        dense = np.triu(pairwise_overlap(boxes, metric) > 0.3, k=1)
+        a, b = overlap_pairs(boxes, 0.3, metric)
+        got = {(min(i, j), max(i, j)) for i, j in zip(a.tolist(), b.tolist())}
+        assert got == set(zip(*map(np.ndarray.tolist, np.nonzero(dense))))
@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.sagemaker_training.classifier_task import embedding_store
+from src.sagemaker_training.classifier_task.embedding_store import EmbeddingStore, embed_files
+from src.sagemaker_training.classifier_task.heads import LinearHead, evaluate
+
+
+class ColorBackbone:
+    """Backbone de prueba: el embedding es el color medio del recorte"""
+    version = "color-v1"
+    dim = 3
+    input_size = 8
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed(self, images):
+        self.calls += len(images)
+        return np.array([img.reshape(-1, 3).mean(axis=0) for img in images], np.float32)
+
+
+def write_crops(folder, colors):
+    paths = []
+    for i, color in enumerate(colors):
+        path = str(folder / f"crop_{i}.png")
+        cv2.imwrite(path, np.full((16, 16, 3), color, np.uint8))
+        paths.append(path)
+    return paths
+
+
+def test_store_grows_and_survives_reopen(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, "GROW_ROWS", 2)
+    store = EmbeddingStore(str(tmp_path), "bb-v1", dim=4)
+    vectors = np.arange(40, dtype=np.float32).reshape(10, 4)
+    for i in range(0, 10, 3):
+        store.add([f"k{j}" for j in range(i, min(i + 3, 10))], vectors[i:i + 3])
+    assert store.add(["k0"], vectors[:1] + 100) == 0
+
+    # Escritura cortada a mitad de una clave: la fila no cuenta
+    with open(store.keys_path, "a") as f:
+        f.write("k1")
+    reopened = EmbeddingStore(str(tmp_path), "bb-v1", dim=4)
+
+    assert len(reopened) == 10
+    np.testing.assert_array_equal(reopened.get(["k7", "k0"]), vectors[[7, 0]])
+    assert reopened.add(["k10"], vectors[:1]) == 1
+    assert EmbeddingStore(str(tmp_path), "bb-v1", dim=4).keys[-1] == "k10"
+    assert len(EmbeddingStore(str(tmp_path), "bb-v2", dim=4)) == 0
+
+
+def test_embed_files_only_runs_backbone_on_new_crops(tmp_path):
+    paths = write_crops(tmp_path, [(0, 0, 200), (0, 200, 0), (0, 0, 200)])
+    backbone = ColorBackbone()
+    store = EmbeddingStore(str(tmp_path / "store"), backbone.version, backbone.dim)
+
+    keys, X, computed = embed_files(paths, store, backbone)
+    assert computed == 2 and backbone.calls == 2        # dos recortes iguales, una clave
+    assert keys[0] == keys[2]
+    np.testing.assert_allclose(X[1], [0, 200, 0])
+
+    _, X_again, computed = embed_files(paths, store, backbone)
+    assert computed == 0 and backbone.calls == 2
+    np.testing.assert_allclose(X_again, X)
+
+
+def test_linear_head_trains_and_round_trips(tmp_path):
+    rng = np.random.default_rng(0)
+    centers = np.array([[0, 0, 5], [5, 0, 0], [0, 5, 0]], np.float32)
+    y = rng.integers(0, 3, 600)
+    X = centers[y] + rng.normal(0, 1, (600, 3)).astype(np.float32)
+
+    head = LinearHead(["verde", "pinton", "madura"], "bb-v1").fit(X, y, epochs=20)
+    assert evaluate(head, X, y)["accuracy"] > 0.95
+
+    head.save(str(tmp_path / "head.npz"))
+    loaded = LinearHead.load(str(tmp_path / "head.npz"))
+    assert loaded.classes == head.classes and loaded.backbone_version == "bb-v1"
+    np.testing.assert_allclose(loaded.predict_proba(X[:5]), head.predict_proba(X[:5]), rtol=1e-6)
+
+
+def test_store_round_trips_through_s3(tmp_path, aws_env):
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    from src.sagemaker_training.classifier_task.embedding_store import pull_store, push_store
+
+    vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+    with moto.mock_aws():
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="artifacts")
+        # Primera ejecución: no hay nada en S3 todavía
+        assert pull_store(s3, "s3://artifacts/embeddings", str(tmp_path / "job1"), "bb-v1") == 0
+        store = EmbeddingStore(str(tmp_path / "job1"), "bb-v1", dim=4)
+        store.add(["a", "b", "c"], vectors)
+        push_store(s3, "s3://artifacts/embeddings/", store)
+
+        # Otro trabajo (otro disco) arranca con los embeddings ya calculados
+        assert pull_store(s3, "s3://artifacts/embeddings", str(tmp_path / "job2"), "bb-v1") == 3
+        reopened = EmbeddingStore(str(tmp_path / "job2"), "bb-v1", dim=4)
+
+    assert reopened.keys == ["a", "b", "c"]
+    np.testing.assert_array_equal(reopened.get(["c", "a"]), vectors[[2, 0]])
@@ -0,0 +1,63 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.common import feature_extraction
+from src.common.feature_extraction import box_features, core_boxes, flower_density
+
+
+@pytest.mark.parametrize("coverage", [0.0, 2.0], ids=["integral", "gather"])
+def test_box_features_match_per_box_crops(monkeypatch, coverage):
+    monkeypatch.setattr(feature_extraction, "INTEGRAL_MIN_COVERAGE", coverage)
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (900, 1200, 3), dtype=np.uint8)
+    xy = rng.uniform(0, [1100, 800], (300, 2))
+    boxes = np.hstack([xy, xy + rng.uniform(3, 100, (300, 2))])
+    boxes[0] = [-20, -20, 15, 15]   # caja que sale de la foto
+    boxes[1] = [1190, 890, 1210, 910]
+
+    features = box_features(img, boxes, mm_per_px=0.1)
+
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    for i, (x1, y1, x2, y2) in enumerate(zip(*core_boxes(boxes, 1200, 900))):
+        crop, crop_hsv = img[y1:y2, x1:x2].reshape(-1, 3), hsv[y1:y2, x1:x2].reshape(-1, 3)
+        assert np.allclose([features['mean_b'][i], features['mean_g'][i], features['mean_r'][i]], crop.mean(axis=0), atol=1e-3)
+        assert np.isclose(features['mean_v'][i], crop_hsv[:, 2].mean(), atol=1e-3)
+    assert np.allclose(features['diameter_mm'], (boxes[:, 2] - boxes[:, 0] + boxes[:, 3] - boxes[:, 1]) / 20, rtol=1e-5)
+
+
+def test_integral_sums_survive_int32_overflow():
+    # 3000x3000 a 255: la integral pasa de 2^31 y la suma de cada caja tiene que seguir exacta
+    img = np.full((3000, 3000, 3), 255, np.uint8)
+    img[2900:, 2900:] = (10, 20, 30)
+    features = box_features(img, np.array([[0, 0, 3000, 3000], [2900, 2900, 3000, 3000]]), core_fraction=1.0)
+
+    assert np.isclose(features['mean_b'][0], (255 * (9e6 - 1e4) + 10 * 1e4) / 9e6)
+    assert np.allclose([features['mean_b'][1], features['mean_g'][1], features['mean_r'][1]], [10, 20, 30])
+
+
+def test_ripeness_and_hue_by_color():
+    img = np.zeros((100, 300, 3), np.uint8)
+    img[:, :100] = (140, 60, 70)     # azul/morado (madura)
+    img[:, 100:200] = (70, 40, 200)  # rojo (pinton)
+    img[:, 200:] = (40, 160, 60)     # verde
+    boxes = np.array([[10, 10, 90, 90], [110, 10, 190, 90], [210, 10, 290, 90]], np.float32)
+
+    features = box_features(img, boxes)
+
+    assert np.allclose(features['ripeness'], [1.0, 0.5, 0.0])
+    assert features['hue_deg'][1] > 340 or features['hue_deg'][1] < 20
+    assert 80 < features['hue_deg'][2] < 160
+
+
+def test_flower_density_per_tile():
+    dets = {
+        'xyxy': np.array([[10, 10, 20, 20], [600, 10, 620, 30], [1500, 900, 1510, 910]], np.float32),
+        'cls': np.array([0, 0, 1]),
+    }
+    tiles = np.array([[0, 0, 1000, 1000], [1000, 0, 2000, 1000]])
+
+    counts, density = flower_density(dets, tiles, flower_cls=0)
+
+    assert counts.tolist() == [2, 0]
+    assert np.allclose(density, [2.0, 0.0])
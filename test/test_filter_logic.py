@@ -0,0 +1,32 @@
+import cv2
+import numpy as np
+
+from src.aws_lambda.inference_coordinator.filter_logic import tile_features, background_reason, filter_tiles
+
+
+def texture(seed, size=640, cell=12):
+    """Textura en bloques de `cell` px con valores en [0, 1)"""
+    rng = np.random.default_rng(seed)
+    small = rng.random((size // cell, size // cell)).astype(np.float32)
+    return cv2.resize(small, (size, size), interpolation=cv2.INTER_NEAREST)
+
+
+def test_background_tiles_are_skipped_and_foliage_kept():
+    t = texture(0)
+    foliage = np.dstack([20 + 40 * t, 70 + 130 * t, 20 + 40 * texture(1)]).astype(np.uint8)
+    soil = np.dstack([50 + 60 * t, 70 + 70 * t, 90 + 80 * t]).astype(np.uint8)
+    # Cielo con degradé (no es plano): azul dominante y claro
+    ramp = np.linspace(0, 60, 640)[:, None] + np.zeros((1, 640))
+    sky = np.dstack([195 + ramp, 160 + ramp, 120 + ramp]).astype(np.uint8)
+    blurred = cv2.GaussianBlur(foliage, (0, 0), 12)
+    flat = np.full((640, 640, 3), 20, np.uint8)
+
+    assert background_reason(tile_features(foliage)) is None
+    assert background_reason(tile_features(sky)) == "sky"
+    assert background_reason(tile_features(soil)) == "no_vegetation"
+    assert background_reason(tile_features(blurred)) == "blur"
+    assert background_reason(tile_features(flat)) == "flat"
+
+    skipped, stats = filter_tiles([("a", None, foliage), ("b", None, sky), ("c", None, soil)])
+    assert skipped == {"b", "c"}
+    assert stats["tiles"] == 3 and stats["reasons"] == {"sky": 1, "no_vegetation": 1}
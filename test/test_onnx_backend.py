@@ -0,0 +1,105 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from src.common.detections import pairwise_overlap
+from src.sagemaker_training.yolo_task.onnx_backend import ExportedYolo, letterbox, postprocess, preprocess
+
+
+def test_postprocess_undoes_letterbox():
+    img = np.zeros((320, 480, 3), dtype=np.uint8)
+    boxed, ratio, (pad_x, pad_y) = letterbox(img, 640)
+    assert boxed.shape == (640, 640, 3)
+
+    # Una caja (100, 50, 200, 150) de la imagen original, en coordenadas del letterbox
+    x1, y1, x2, y2 = np.array([100, 50, 200, 150]) * ratio + [pad_x, pad_y, pad_x, pad_y]
+    raw = np.zeros((1, 6, 3), dtype=np.float32)   # (B, 4 + nc, anchors), nc = 2
+    raw[0, :, 0] = [(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, 0.1, 0.9]
+    raw[0, :, 1] = [10, 10, 5, 5, 0.2, 0.1]        # por debajo del umbral
+
+    (dets,) = postprocess(raw, [(ratio, (pad_x, pad_y), img.shape[:2])], conf=0.25)
+
+    np.testing.assert_allclose(dets["xyxy"], [[100, 50, 200, 150]], atol=1e-3)
+    assert dets["cls"].tolist() == [1]
+
+
+PARITY_MODEL = os.environ.get("PHENOBERRY_PARITY_MODEL")     # ruta al model.pt entrenado (con model.onnx al lado)
+PARITY_TILES = os.environ.get("PHENOBERRY_PARITY_TILES")     # carpeta con tiles .jpg de muestra
+PARITY_IMGSZ = 160
+
+
+def synthetic_tiles(n=4, size=200):
+    """Tiles de prueba: fondo verde con circulos azulados tipo arandano"""
+    cv2 = pytest.importorskip("cv2")
+    rng = np.random.default_rng(0)
+    tiles = []
+    for _ in range(n):
+        img = np.full((size, size + 40, 3), (40, 110, 50), np.uint8)
+        for x, y, r in zip(rng.integers(20, size, 8), rng.integers(20, size - 20, 8), rng.integers(6, 16, 8)):
+            cv2.circle(img, (int(x), int(y)), int(r), (120, 60, 40), -1)
+        tiles.append(img)
+    return tiles
+
+
+@pytest.fixture(scope="module")
+def parity_model(tmp_path_factory):
+    """
+    (model.pt, model.onnx, tiles). Sin PHENOBERRY_PARITY_MODEL arma un YOLOv8n chico desde
+    yolov8n.yaml (pesos aleatorios, sin descargas) y lo exporta igual que train_yolo.
+    """
+    cv2 = pytest.importorskip("cv2")
+    ultralytics = pytest.importorskip("ultralytics")
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+
+    if PARITY_TILES:
+        tiles = [cv2.imread(p) for p in sorted(glob.glob(os.path.join(PARITY_TILES, "*.jpg")))[:16]]
+    else:
+        tiles = synthetic_tiles()
+    if PARITY_MODEL:
+        return PARITY_MODEL, PARITY_MODEL.rsplit(".", 1)[0] + ".onnx", tiles
+
+    import torch
+    torch.manual_seed(0)
+    model_path = str(tmp_path_factory.mktemp("parity") / "model.pt")
+    ultralytics.YOLO("yolov8n.yaml").save(model_path)
+    onnx_path = ultralytics.YOLO(model_path).export(format="onnx", imgsz=PARITY_IMGSZ, dynamic=True, simplify=False)
+    return model_path, str(onnx_path), tiles
+
+
+def test_onnx_raw_output_matches_torch(parity_model):
+    import torch
+    from ultralytics import YOLO
+
+    model_path, onnx_path, tiles = parity_model
+    onnx_model = ExportedYolo(onnx_path, runtime="onnx")
+    tensor, _ = preprocess(tiles, onnx_model.imgsz)
+
+    torch_net = YOLO(model_path).model.float().eval()
+    with torch.no_grad():
+        ref = torch_net(torch.from_numpy(tensor))
+    ref = (ref[0] if isinstance(ref, (list, tuple)) else ref).numpy()
+
+    got = onnx_model._forward(tensor)
+    assert got.shape == ref.shape
+    np.testing.assert_allclose(got, ref, rtol=1e-3, atol=1e-2)
+
+
+@pytest.mark.skipif(not PARITY_MODEL, reason="las cajas solo son comparables con un modelo entrenado")
+def test_onnx_matches_torch_on_sample_tiles(parity_model):
+    from ultralytics import YOLO
+
+    model_path, onnx_path, tiles = parity_model
+    torch_model = YOLO(model_path)
+    onnx_model = ExportedYolo(onnx_path, runtime="onnx")
+
+    for img, ref, got in zip(tiles, torch_model(tiles, conf=0.25, verbose=False), onnx_model.predict_arrays(tiles)):
+        ref_xyxy = ref.boxes.xyxy.cpu().numpy()
+        # Tolerancia: el letterbox/NMS no es bit a bit igual, pero las cajas deben coincidir
+        assert abs(len(ref_xyxy) - len(got["xyxy"])) <= max(1, int(0.05 * len(ref_xyxy)))
+        if len(ref_xyxy) and len(got["xyxy"]):
+            iou = pairwise_overlap(np.concatenate([ref_xyxy, got["xyxy"]]).astype(np.float64))
+            best = iou[:len(ref_xyxy), len(ref_xyxy):].max(axis=1)
+            assert np.mean(best > 0.9) >= 0.95
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+from src.common.results_store import DetectionBuffer, compact_local
+
+
+def make_dets(n):
+    return {
+        "xyxy": np.tile(np.float32([[10, 20, 30, 40]]), (n, 1)),
+        "conf": np.full(n, 0.5, dtype=np.float32),
+        "cls": np.arange(n) % 2,
+    }
+
+
+def test_buffer_writes_tile_and_image_coordinates(tmp_path):
+    buffer = DetectionBuffer(model_version="v1")
+    buffer.add("foto", make_dets(2), {0: "flor", 1: "arandano"}, tile="foto_grid3x4_r1c2", row=1, col=2, offset=(100, 200))
+    buffer.add("foto", make_dets(0), {0: "flor"}, tile="foto_grid3x4_r0c0", row=0, col=0)
+    buffer.add("otra", make_dets(1), {0: "flor"}, tile="otra_grid3x4_r0c0", row=0, col=0)
+
+    path = tmp_path / "part-1.parquet"
+    path.write_bytes(buffer.to_parquet_bytes())
+    rows = pq.read_table(path).to_pylist()
+
+    assert len(rows) == 3
+    assert rows[1]["name"] == "arandano" and rows[1]["model_version"] == "v1"
+    assert (rows[0]["img_x1"], rows[0]["img_y2"]) == (110, 240)
+    assert rows[2]["img_x1"] is None and rows[2]["tile_x1"] == 10
+    assert buffer.partition_key().startswith("results/detections/date=")
+
+
+def test_fixed_part_id_gives_same_key_on_retry():
+    from datetime import datetime, timezone
+    created = datetime(2026, 1, 10, 12, 30, tzinfo=timezone.utc)
+    keys = {DetectionBuffer("v1", part_id="abc123", created=created).partition_key() for _ in range(2)}
+    assert keys == {"results/detections/date=2026-01-10/part-123000-abc123.parquet"}
+
+
+def test_compact_local_merges_parts(tmp_path):
+    for i in range(3):
+        buffer = DetectionBuffer(model_version="v1")
+        buffer.add(f"foto{i}", make_dets(4), {0: "flor", 1: "arandano"}, tile=f"foto{i}_grid3x4_r0c0")
+        (tmp_path / f"part-{i}.parquet").write_bytes(buffer.to_parquet_bytes())
+
+    written = compact_local(str(tmp_path))
+
+    assert len(written) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == [written[0].split("/")[-1]]
+    assert pq.read_table(written[0]).num_rows == 12
@@ -0,0 +1,98 @@
+import io
+import os
+
+import pytest
+
+moto = pytest.importorskip("moto")
+
+from src.common.s3_io import S3RangeFile, get_bytes_parallel, upload_files
+
+
+@pytest.fixture
+def s3(aws_env):
+    boto3 = pytest.importorskip("boto3")
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket="raw")
+        yield client
+
+
+def test_ranged_parallel_get_rebuilds_the_object(s3):
+    data = os.urandom(300_001)
+    s3.put_object(Bucket="raw", Key="uploads/foto.jpg", Body=data)
+    s3.put_object(Bucket="raw", Key="uploads/vacia.jpg", Body=b"")
+
+    for part_size in (4096, 100_000, 300_001, 10_000_000):
+        assert get_bytes_parallel(s3, "raw", "uploads/foto.jpg", part_size=part_size, max_workers=4) == data
+    assert get_bytes_parallel(s3, "raw", "uploads/vacia.jpg") == b""
+
+
+class ShortReadClient:
+    """Cliente S3 que devuelve cortos los rangos que no empiezan en 0 (conexion cortada)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_object(self, **kwargs):
+        response = self.client.get_object(**kwargs)
+        if not kwargs.get("Range", "bytes=0-").startswith("bytes=0-"):
+            response["Body"] = io.BytesIO(response["Body"].read()[:-1])
+        return response
+
+
+def test_ranged_parallel_get_rejects_short_parts(s3):
+    s3.put_object(Bucket="raw", Key="uploads/foto.jpg", Body=os.urandom(10_000))
+
+    with pytest.raises(IOError):
+        get_bytes_parallel(ShortReadClient(s3), "raw", "uploads/foto.jpg", part_size=4096)
+
+
+def test_upload_files_reports_failures(s3, tmp_path):
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"shard-{i}.tar"
+        path.write_bytes(os.urandom(1000 + i))
+        paths.append((str(path), f"shards/shard-{i}.tar"))
+    paths.append((str(tmp_path / "no_existe.tar"), "shards/no_existe.tar"))
+
+    uploaded, failed = upload_files(s3, "raw", paths, max_workers=3)
+
+    assert sorted(uploaded) == [f"shards/shard-{i}.tar" for i in range(5)]
+    assert [key for key, _ in failed] == ["shards/no_existe.tar"]
+    assert s3.get_object(Bucket="raw", Key="shards/shard-3.tar")["Body"].read() == (tmp_path / "shard-3.tar").read_bytes()
+
+
+class CountingClient:
+    """Cliente S3 que suma los bytes descargados"""
+
+    def __init__(self, client):
+        self.client, self.bytes = client, 0
+
+    def get_object(self, **kwargs):
+        response = self.client.get_object(**kwargs)
+        data = response["Body"].read()
+        self.bytes += len(data)
+        response["Body"] = io.BytesIO(data)
+        return response
+
+
+def test_range_file_reads_one_parquet_column_without_the_whole_object(s3):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    import numpy as np
+
+    n = 200_000
+    rng = np.random.default_rng(0)
+    table = pa.table({
+        "media_id": np.array([f"foto{i % 7}" for i in range(n)]),
+        **{f"v{j}": rng.random(n, dtype=np.float32) for j in range(6)},
+    })
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression="zstd", row_group_size=50_000)
+    s3.put_object(Bucket="raw", Key="results/part.parquet", Body=buf.getvalue())
+
+    client = CountingClient(s3)
+    got = pq.ParquetFile(S3RangeFile(client, "raw", "results/part.parquet")).read(columns=["media_id"])
+
+    assert set(got.column("media_id").to_pylist()) == {f"foto{i}" for i in range(7)}
+    assert client.bytes < len(buf.getvalue()) / 10
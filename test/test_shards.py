@@ -0,0 +1,65 @@
+import os
+
+from src.common.shards import ShardWriter, iter_samples, load_index, read_index, read_sample
+from src.sagemaker_training.yolo_task.dataset_tiling import dataset_key, pack_dataset, unpack_dataset
+
+
+def test_shards_roll_over_and_stream_back(tmp_path):
+    samples = [(f"tile_{i:03d}", {"jpg": os.urandom(3000 + i), "txt": f"1 0.5 0.5 0.1 0.1\n{i}".encode()}) for i in range(20)]
+    samples.append(("vacio", {"jpg": b"\xff\xd8"}))
+    # Fotos con puntos en el nombre (ej: 18.0): la clave no se corta en el primer punto
+    samples += [("train/18.0_grid3x4_r0c0", {"jpg": b"a", "txt": b"0"}), ("train/18.0_grid3x4_r0c1", {"jpg": b"b"})]
+
+    writer = ShardWriter(str(tmp_path), "tiles", max_bytes=20_000, meta={"dataset_key": "abc"})
+    for key, files in samples:
+        writer.write(key, files)
+    index = writer.close()
+
+    assert len(index["shards"]) > 1 and index["samples"] == 23
+    assert load_index(str(tmp_path))["dataset_key"] == "abc"
+    shard_paths = [str(tmp_path / s["name"]) for s in index["shards"]]
+    assert list(iter_samples(shard_paths)) == samples
+
+    # Lectura de una muestra suelta con los offsets del .idx
+    entries = read_index(shard_paths[1].replace(".tar", ".idx"))
+    key = next(iter(entries))
+    assert read_sample(shard_paths[1], entries[key]) == dict(samples)[key]
+
+
+def test_pack_and_unpack_tiled_dataset(tmp_path):
+    src, shards, dst = tmp_path / "tiled", tmp_path / "shards", tmp_path / "restored"
+    for split in ("train", "val"):
+        (src / "images" / split).mkdir(parents=True)
+        (src / "labels" / split).mkdir(parents=True)
+    (src / "images" / "train" / "a_r0c0.jpg").write_bytes(b"img-a")
+    (src / "labels" / "train" / "a_r0c0.txt").write_bytes(b"0 0.5 0.5 0.2 0.2\n")
+    (src / "images" / "train" / "a_r0c1.jpg").write_bytes(b"img-b")     # fondo sin etiqueta
+    (src / "images" / "val" / "b_r0c0.jpg").write_bytes(b"img-c")
+
+    pack_dataset(str(src), str(shards), splits=("train", "val"), shard_size=1024)
+    assert unpack_dataset(str(shards), str(dst), workers=2) == 3
+
+    for path in src.rglob("*.*"):
+        assert (dst / path.relative_to(src)).read_bytes() == path.read_bytes()
+    assert not (dst / "labels" / "train" / "a_r0c1.txt").exists()
+
+
+def test_dataset_key_sees_label_edits_and_replaced_images(tmp_path):
+    (tmp_path / "images").mkdir()
+    (tmp_path / "labels").mkdir()
+    img, lbl = tmp_path / "images" / "18.0.jpg", tmp_path / "labels" / "18.0.txt"
+    img.write_bytes(b"foto-1")
+    lbl.write_text("0 0.5 0.5 0.2 0.2\n")
+    params = {"mode": "fixed"}
+    base = dataset_key([str(img)], str(tmp_path), params)
+    assert dataset_key([str(img)], str(tmp_path), params) == base
+
+    # Misma longitud, otra clase
+    lbl.write_text("1 0.5 0.5 0.2 0.2\n")
+    relabeled = dataset_key([str(img)], str(tmp_path), params)
+    assert relabeled != base
+
+    # Otra foto del mismo tamano con el mismo nombre
+    img.write_bytes(b"foto-2")
+    os.utime(img, ns=(0, os.stat(img).st_mtime_ns + 1_000_000_000))
+    assert dataset_key([str(img)], str(tmp_path), params) != relabeled
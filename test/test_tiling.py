@@ -0,0 +1,222 @@
+import os
+
+import cv2
+import numpy as np
+
+from src.common.tiling import (
+    MIN_AREA_THRESHOLD, compute_tile_grid, iter_tiles, load_yolo_boxes, manifest_tile_boxes, plan_tiling,
+    decode_image, decode_reduction, iter_tile_crops, parse_tile_name, process_tiling, tile_manifest,
+)
+
+
+def make_image(w, h, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8)
+
+
+def test_iter_tiles_matches_process_tiling(tmp_path):
+    img = make_image(640, 480)
+    img_path = str(tmp_path / "foto.jpg")
+    cv2.imwrite(img_path, img)
+    out_dir = tmp_path / "tiles"
+    out_dir.mkdir()
+
+    files = process_tiling(img_path, str(out_dir), filename_prefix="foto")
+
+    with open(img_path, "rb") as f:
+        streamed = list(iter_tiles(f.read(), filename_prefix="foto"))
+
+    assert [name for name, _, _ in streamed] == [os.path.basename(p) for p in files]
+    for (name, _, data), path in zip(streamed, files):
+        with open(path, "rb") as f:
+            assert f.read() == data
+
+
+def test_iter_tiles_accepts_array_and_reports_boxes():
+    img = make_image(300, 400)
+    tiles = list(iter_tiles(img, filename_prefix="vertical"))
+
+    # Imagen vertical -> cuadricula 4x3
+    assert len(tiles) == 12
+    assert tiles[0][0] == "vertical_grid4x3_r0c0.jpg"
+    for _, (x1, y1, x2, y2), data in tiles:
+        assert 0 <= x1 < x2 <= 300 and 0 <= y1 < y2 <= 400
+        decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        assert decoded.shape[:2] == (y2 - y1, x2 - x1)
+
+
+def reference_tile_labels(lbl_path, w, h):
+    """Implementacion escalar original (dict por caja) usada como referencia"""
+    boxes = []
+    with open(lbl_path) as f:
+        for line in f.readlines():
+            parts = line.strip().split()
+            if len(parts) >= 5:
+                xc, yc, bw, bh = map(float, parts[1:5])
+                x_center, y_center, width, height = xc * w, yc * h, bw * w, bh * h
+                boxes.append({
+                    'cls_id': int(parts[0]),
+                    'x1': x_center - (width / 2), 'y1': y_center - (height / 2),
+                    'x2': x_center + (width / 2), 'y2': y_center + (height / 2),
+                })
+
+    rows, cols, tiles = compute_tile_grid(w, h)
+    labels = {}
+    for r, c, x_start, y_start, x_end, y_end in tiles:
+        cur_w, cur_h = x_end - x_start, y_end - y_start
+        new_lines = []
+        for box in boxes:
+            inter_x1 = max(box['x1'], x_start)
+            inter_y1 = max(box['y1'], y_start)
+            inter_x2 = min(box['x2'], x_end)
+            inter_y2 = min(box['y2'], y_end)
+            if inter_x2 > inter_x1 and inter_y2 > inter_y1:
+                area_visible = (inter_x2 - inter_x1) * (inter_y2 - inter_y1)
+                box_area = (box['x2'] - box['x1']) * (box['y2'] - box['y1'])
+                if box_area > 0 and (area_visible / box_area >= MIN_AREA_THRESHOLD):
+                    new_x1 = inter_x1 - x_start
+                    new_y1 = inter_y1 - y_start
+                    new_w = (inter_x2 - x_start) - new_x1
+                    new_h = (inter_y2 - y_start) - new_y1
+                    nxc = np.clip((new_x1 + new_w / 2) / cur_w, 0, 1)
+                    nyc = np.clip((new_y1 + new_h / 2) / cur_h, 0, 1)
+                    nwn = np.clip(new_w / cur_w, 0, 1)
+                    nhn = np.clip(new_h / cur_h, 0, 1)
+                    new_lines.append(f"{box['cls_id']} {nxc:.6f} {nyc:.6f} {nwn:.6f} {nhn:.6f}")
+        labels[f"foto_grid{rows}x{cols}_r{r}c{c}.txt"] = '\n'.join(new_lines)
+    return labels
+
+
+def write_random_labels(path, n, seed=0):
+    rng = np.random.default_rng(seed)
+    lines = []
+    for _ in range(n):
+        cls_id = int(rng.integers(0, 2))
+        xc, yc = rng.uniform(-0.05, 1.05, size=2)
+        bw, bh = rng.uniform(0.0, 0.2, size=2)
+        lines.append(f"{cls_id} {xc:.6f} {yc:.6f} {bw:.6f} {bh:.6f}")
+    lines.append("1 0.5 0.5 0.0 0.1")  # caja degenerada (area 0)
+    lines.append("0 0.1")              # linea incompleta, se ignora
+    path.write_text('\n'.join(lines))
+
+
+def test_load_yolo_boxes_returns_absolute_array(tmp_path):
+    lbl = tmp_path / "foto.txt"
+    lbl.write_text("1 0.5 0.25 0.2 0.1\n0 0.1 0.1 0.1 0.1 0.9\nbasura\n")
+
+    boxes = load_yolo_boxes(str(lbl), 200, 100)
+
+    assert boxes.shape == (2, 5)
+    np.testing.assert_allclose(boxes[0], [1, 80, 20, 120, 30])
+    assert load_yolo_boxes(str(tmp_path / "no_existe.txt"), 200, 100).shape == (0, 5)
+
+
+def test_vectorized_labels_are_byte_identical(tmp_path):
+    for w, h, n_boxes in [(640, 480, 300), (480, 640, 50), (1001, 333, 1)]:
+        img_path = str(tmp_path / "foto.jpg")
+        cv2.imwrite(img_path, make_image(w, h))
+        lbl_path = tmp_path / "foto.txt"
+        write_random_labels(lbl_path, n_boxes, seed=w)
+
+        img_dir, lbl_dir = tmp_path / f"img_{w}", tmp_path / f"lbl_{w}"
+        img_dir.mkdir()
+        lbl_dir.mkdir()
+        process_tiling(img_path, str(img_dir), str(lbl_dir), str(lbl_path), filename_prefix="foto")
+
+        expected = reference_tile_labels(str(lbl_path), w, h)
+        assert sorted(os.listdir(lbl_dir)) == sorted(expected)
+        for name, content in expected.items():
+            assert (lbl_dir / name).read_bytes() == content.encode()
+
+
+def test_manifest_matches_tiles_including_clamped_edges(tmp_path):
+    img = make_image(1403, 1001, seed=1)
+    img_path = str(tmp_path / "foto.jpg")
+    cv2.imwrite(img_path, img)
+    out_dir = tmp_path / "tiles"
+    out_dir.mkdir()
+
+    files, manifest = process_tiling(img_path, str(out_dir), filename_prefix="foto", return_manifest=True)
+    boxes = manifest_tile_boxes(manifest)
+
+    assert (manifest["width"], manifest["height"], manifest["rows"], manifest["cols"]) == (1403, 1001, 3, 4)
+    assert sorted(boxes) == sorted(os.path.basename(p)[:-4] for p in files)
+    for name, tile_box, _ in iter_tiles(img, filename_prefix="foto"):
+        assert boxes[name[:-4]] == tile_box
+    # El último tile de cada fila/columna termina justo en el borde
+    assert max(b[2] for b in boxes.values()) == 1403
+    assert max(b[3] for b in boxes.values()) == 1001
+
+
+def test_adaptive_plan_bounds_tile_size_and_keeps_fixed_default():
+    assert plan_tiling(4000, 3000, mode="fixed") == (3, 4, 0.15)
+    assert plan_tiling(3000, 4000, mode="fixed") == (4, 3, 0.15)
+    assert compute_tile_grid(4000, 3000)[:2] == (3, 4)
+
+    for w, h in [(4000, 3000), (8000, 6000), (1920, 1080)]:
+        plan = plan_tiling(w, h, mode="adaptive", imgsz=640, min_object_px=24, min_model_object_px=12)
+        _, _, tiles = compute_tile_grid(w, h, plan)
+        sides = [max(x2 - x1, y2 - y1) for _, _, x1, y1, x2, y2 in tiles]
+        assert max(sides) <= 1280
+        assert min(sides) >= 640 or len(tiles) == 1
+
+    rows, cols, overlap = plan_tiling(4000, 3000, mode="adaptive", max_object_px=300)
+    assert overlap * min(4000 / cols, 3000 / rows) >= 300
+
+
+def test_tile_formats_round_trip_and_reduced_manifest():
+    img = make_image(1600, 1200, seed=2)
+    default = [data for _, _, data in iter_tiles(img, filename_prefix="foto")]
+    assert default == [cv2.imencode(".jpg", crop)[1].tobytes() for _, _, crop in iter_tile_crops(img, "foto")]
+
+    for fmt in ("npy", "webp", "jpg"):
+        (name, box, data), = list(iter_tiles(img, filename_prefix="foto", fmt=fmt, quality=80))[:1]
+        decoded = decode_image(data)
+        assert name.endswith("." + fmt) and parse_tile_name(name)[3:] == (0, 0)
+        assert decoded.shape == (box[3] - box[1], box[2] - box[0], 3)
+        if fmt == "npy":
+            assert np.array_equal(decoded, img[box[1]:box[3], box[0]:box[2]])
+
+    # Decodificación a la mitad: el manifest sigue en pixeles originales
+    plan = plan_tiling(8000, 6000, mode="fixed")
+    assert decode_reduction(8000, 6000, plan, imgsz=640) == 2
+    manifest = tile_manifest("foto", 4000, 3000, plan=plan, scale=2, source_size=(8000, 6000))
+    boxes = manifest_tile_boxes(manifest)
+    assert (manifest["width"], manifest["height"], manifest["scale"]) == (8000, 6000, 2)
+    assert max(b[2] for b in boxes.values()) == 8000
+
+
+def test_tile_labels_round_trip_to_source_boxes(tmp_path):
+    w, h = 1600, 1200
+    img_path = str(tmp_path / "foto.jpg")
+    cv2.imwrite(img_path, make_image(w, h))
+    lbl_path = tmp_path / "foto.txt"
+    write_random_labels(lbl_path, 400, seed=3)
+    img_dir, lbl_dir = tmp_path / "img", tmp_path / "lbl"
+    img_dir.mkdir()
+    lbl_dir.mkdir()
+
+    process_tiling(img_path, str(img_dir), str(lbl_dir), str(lbl_path), filename_prefix="foto")
+
+    boxes = load_yolo_boxes(str(lbl_path), w, h)
+    _, _, tiles = compute_tile_grid(w, h)
+    for r, c, x1, y1, x2, y2 in tiles:
+        lines = (lbl_dir / f"foto_grid3x4_r{r}c{c}.txt").read_text().split("\n")
+        labels = np.array([[float(v) for v in line.split()] for line in lines if line]).reshape(-1, 5)
+        back = np.stack([
+            x1 + (labels[:, 1] - labels[:, 3] / 2) * (x2 - x1), y1 + (labels[:, 2] - labels[:, 4] / 2) * (y2 - y1),
+            x1 + (labels[:, 1] + labels[:, 3] / 2) * (x2 - x1), y1 + (labels[:, 2] + labels[:, 4] / 2) * (y2 - y1),
+        ], axis=1)
+        clipped = np.stack([
+            np.maximum(boxes[:, 1], x1), np.maximum(boxes[:, 2], y1),
+            np.minimum(boxes[:, 3], x2), np.minimum(boxes[:, 4], y2),
+        ], axis=1)
+        visible = (clipped[:, 2] > clipped[:, 0]) & (clipped[:, 3] > clipped[:, 1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            area_ratio = np.where(visible, (clipped[:, 2] - clipped[:, 0]) * (clipped[:, 3] - clipped[:, 1]), 0) / (
+                (boxes[:, 3] - boxes[:, 1]) * (boxes[:, 4] - boxes[:, 2]))
+        expected = clipped[area_ratio >= MIN_AREA_THRESHOLD]
+
+        assert len(back) == len(expected)
+        np.testing.assert_allclose(back, expected, atol=0.01)
+        np.testing.assert_array_equal(labels[:, 0], boxes[area_ratio >= MIN_AREA_THRESHOLD, 0])
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+moto = pytest.importorskip("moto")
+
+from src.common import tracking
+from src.common.tracking import media_id_for, update_status
+
+
+@pytest.fixture
+def table(aws_env, monkeypatch):
+    boto3 = pytest.importorskip("boto3")
+    monkeypatch.setattr(tracking, "_dynamodb", None)
+    with moto.mock_aws():
+        yield boto3.resource("dynamodb").create_table(
+            TableName="tracking",
+            KeySchema=[{"AttributeName": "media_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "media_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+
+def test_media_id_is_deterministic_per_object_version():
+    a = media_id_for("raw", "uploads/foto.jpg", '"abc"')
+    assert a == media_id_for("raw", "uploads/foto.jpg", "abc")
+    assert a != media_id_for("raw", "uploads/foto.jpg", "def")
+    assert a != media_id_for("raw", "uploads/otra.jpg", "abc")
+
+
+def test_updates_complete_missing_attributes_and_clear_errors(table):
+    ids = [media_id_for("raw", f"uploads/f{i}.jpg", "e") for i in range(3)]
+    base = {"s3_key": "uploads/f0.jpg", "upload_timestamp": "t0"}
+
+    # El tiler termina antes que el ingest: los atributos base se completan igual
+    update_status([(ids[0], {"status": "TILED_COMPLETE"}, base)], "tracking")
+    table.put_item(Item={"media_id": ids[1], "status": "UPLOADED", "upload_timestamp": "t1"})   # alta del ingest
+
+    # Lote con un mensaje duplicado: un UpdateItem por foto; el error de un intento anterior se borra
+    update_status([(ids[1], {"status": "TILING_FAILED", "error_message": "x"}, base)], "tracking")
+    batch = [(i, {"status": "TILED_COMPLETE"}, base, ("error_message",)) for i in ids + ids[:1]]
+    assert update_status(batch, "tracking") == 3
+
+    items = {item["media_id"]: item for item in table.scan()["Items"]}
+    assert {item["status"] for item in items.values()} == {"TILED_COMPLETE"}
+    assert items[ids[0]]["upload_timestamp"] == "t0"
+    assert items[ids[1]]["upload_timestamp"] == "t1"
+    assert "error_message" not in items[ids[1]]
+
+
+def test_ingest_registers_the_same_media_id_as_tracking(table, monkeypatch):
+    monkeypatch.setenv("DYNAMO_TABLE", "tracking")
+    from src.aws_lambda.ingest_trigger import app as ingest
+
+    monkeypatch.setattr(ingest, "table", table)
+    s3_record = {"s3": {"bucket": {"name": "raw"}, "object": {"key": "uploads/lote+1/18.0.jpg", "eTag": "abc"}}}
+    event = {"Records": [{"eventSource": "aws:sqs", "messageId": "m1", "body": json.dumps({"Records": [s3_record]})}]}
+
+    ingest.lambda_handler(event, None)
+    ingest.lambda_handler(event, None)   # reintento: no pisa el item
+
+    (item,) = table.scan()["Items"]
+    assert item["media_id"] == media_id_for("raw", "uploads/lote 1/18.0.jpg", '"abc"')
+    assert item["status"] == "UPLOADED"
+
+    # Reintento tardío, con el tiler ya terminado: el estado no vuelve atrás
+    update_status([(item["media_id"], {"status": "TILED_COMPLETE"})], "tracking")
+    ingest.lambda_handler(event, None)
+    assert table.scan()["Items"][0]["status"] == "TILED_COMPLETE"
+
+
+def test_results_keys_accumulate_only_on_tracked_items(table):
+    media_id = media_id_for("raw", "uploads/f0.jpg", "e")
+    update_status([(media_id, {"status": "TILED_COMPLETE"})], "tracking")
+
+    assert tracking.add_results_key([media_id, media_id], "results/p1.parquet", "tracking") == 1
+    tracking.add_results_key([media_id], "results/p1.parquet", "tracking")
+    assert tracking.add_results_key([media_id, "18.0"], "results/p2.parquet", "tracking") == 1
+
+    (item,) = table.scan()["Items"]
+    assert item["results_keys"] == {"results/p1.parquet", "results/p2.parquet"}
@@ -0,0 +1,190 @@
+import io
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from src.aws_lambda.reconstruction.visualizer import should_render, render_overlay
+
+
+def test_sampling_is_deterministic_and_close_to_rate():
+    keys = [f"foto{i}_grid3x4_r{i % 3}c{i % 4}" for i in range(5000)]
+    picked = [k for k in keys if should_render(k, mode="sample", rate=0.1)]
+
+    assert picked == [k for k in keys if should_render(k, mode="sample", rate=0.1)]
+    assert 0.08 < len(picked) / len(keys) < 0.12
+    assert not should_render(keys[0], mode="off", rate=1.0)
+    assert should_render(keys[0], mode="always", rate=0.0)
+
+
+def test_render_overlay_downscales_large_images():
+    img = np.zeros((3000, 4000, 3), dtype=np.uint8)
+    dets = {"xyxy": np.float32([[100, 100, 400, 400]]), "conf": np.float32([0.9]), "cls": np.array([1])}
+
+    overlay = cv2.imdecode(np.frombuffer(render_overlay(img, dets, {1: "arandano"}, max_side=1000), np.uint8), cv2.IMREAD_COLOR)
+
+    assert overlay.shape[:2] == (750, 1000)
+    assert overlay[25:100, 25:100].any()
+
+
+def test_reconstruct_maps_tiles_back_and_dedupes_overlaps(tmp_path):
+    pytest.importorskip("pyarrow")
+    from src.common.results_store import DetectionBuffer
+    from src.common.tiling import iter_tile_crops, parse_tile_name
+    from src.aws_lambda.reconstruction.visualizer import iter_media_rows, reconstruct_detections, count_by_class
+
+    # Apaisada con ancho no divisible: cuadrícula 3x4 y recorte en los bordes
+    w, h = 4001, 2999
+    berries = np.float32([[980, 700, 1060, 780], [3950, 2940, 4000, 2998]])
+    sources = []
+    for attempt in range(2):   # el segundo intento (reintento) reemplaza al primero
+        buffer = DetectionBuffer(model_version="v1")
+        for name, (x1, y1, x2, y2), _ in iter_tile_crops(np.zeros((h, w, 3), np.uint8), "foto"):
+            clipped = np.clip(berries, [x1, y1, x1, y1], [x2, y2, x2, y2])
+            visible = (clipped[:, 2] > clipped[:, 0]) & (clipped[:, 3] > clipped[:, 1])
+            _, _, _, r, c = parse_tile_name(name)
+            dets = {"xyxy": clipped[visible] - [x1, y1, x1, y1], "conf": np.full(visible.sum(), 0.9, np.float32), "cls": np.ones(visible.sum(), int)}
+            buffer.add("foto", dets, {1: "arandano"}, tile=name, row=r, col=c)
+        buffer.created = buffer.created.replace(microsecond=attempt * 1000)
+        path = tmp_path / f"part-{attempt}.parquet"
+        path.write_bytes(buffer.to_parquet_bytes())
+        sources.append(str(path))
+
+    dets, names = reconstruct_detections(iter_media_rows(sources, "foto"), (w, h))
+
+    assert count_by_class(dets, names) == {"arandano": 2}
+    np.testing.assert_allclose(np.sort(dets["xyxy"], axis=0), np.sort(berries, axis=0), atol=1e-3)
+
+
+def test_image_size_follows_exif_orientation():
+    from PIL import Image
+    from src.common.tiling import image_size
+
+    exif = Image.Exif()
+    exif[0x0112] = 6   # rotada 90 grados: cv2 la decodifica en vertical
+    buf = io.BytesIO()
+    Image.new("RGB", (400, 300)).save(buf, format="JPEG", exif=exif.tobytes())
+
+    assert image_size(buf.getvalue()[:2048]) == (300, 400)
+    assert cv2.imdecode(np.frombuffer(buf.getvalue(), np.uint8), cv2.IMREAD_COLOR).shape[:2] == (400, 300)
+
+
+def test_result_dates_come_from_processed_timestamp_and_are_required(aws_env):
+    from datetime import datetime, timedelta, timezone
+    from src.aws_lambda.reconstruction.dashboard_update import result_dates
+    from src.aws_lambda.reconstruction.visualizer import list_result_keys
+
+    yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+    dates = result_dates({"processed_timestamp": yesterday.isoformat()}, window_days=3)
+    assert dates == [(yesterday + timedelta(days=i)).date().isoformat() for i in range(2)]
+    assert result_dates({"status": "UPLOADED"}) == []
+
+    with pytest.raises(ValueError):
+        list(list_result_keys(None, "out", dates=None))
+
+
+def test_tiler_and_reconstruction_update_the_same_tracking_item(aws_env, monkeypatch):
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    pytest.importorskip("pyarrow")
+    from src.common import tracking
+    from src.common.results_store import DetectionBuffer
+    from src.common.tiling import read_geometry
+    from src.aws_lambda.inference_coordinator import tiler
+    from src.aws_lambda.reconstruction import dashboard_update, visualizer
+
+    with moto.mock_aws():
+        s3 = boto3.client("s3")
+        for bucket in ("raw", "processed", "out"):
+            s3.create_bucket(Bucket=bucket)
+        table = boto3.resource("dynamodb").create_table(
+            TableName="tracking",
+            KeySchema=[{"AttributeName": "media_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "media_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        monkeypatch.setattr(tracking, "_dynamodb", None)
+        monkeypatch.setattr(tiler, "s3_client", s3)
+        monkeypatch.setattr(tiler, "PROCESSED_BUCKET", "processed")
+        monkeypatch.setattr(tiler, "TABLE_NAME", "tracking")
+        monkeypatch.setattr(visualizer, "s3_client", s3)
+        monkeypatch.setattr(dashboard_update, "dynamodb", boto3.resource("dynamodb"))
+        monkeypatch.setattr(dashboard_update, "TABLE_NAME", "tracking")
+        monkeypatch.setenv("OUTPUT_BUCKET", "out")
+        monkeypatch.setenv("PROCESSED_BUCKET", "processed")
+
+        # Nombre con puntos y en una subcarpeta: el prefijo "18.0" no identifica la foto
+        key = "uploads/lote/18.0.jpg"
+        etag = s3.put_object(Bucket="raw", Key=key, Body=cv2.imencode(".jpg", np.full((600, 800, 3), 90, np.uint8))[1].tobytes())["ETag"]
+        tiler.lambda_handler({"Records": [{"s3": {"bucket": {"name": "raw"}, "object": {"key": key, "eTag": etag.strip('"')}}}]}, None)
+
+        # Inferencia (simulada): una baya por tile, con el media_id del manifest
+        geometry = read_geometry(s3, "processed", "18.0")
+        buffer = DetectionBuffer("v1")
+        berry = {"xyxy": np.float32([[10, 10, 30, 30]]), "conf": np.float32([0.9]), "cls": np.array([1])}
+        for t in geometry["tiles"]:
+            buffer.add(geometry["media_id"], berry, {1: "arandano"}, tile=t["name"], row=t["r"], col=t["c"], offset=(t["x"], t["y"]))
+        results_key = buffer.flush_to_s3(s3, "out")
+
+        media_id = tracking.media_id_for("raw", key, etag)
+        visualizer.lambda_handler({"action": "reconstruct", "media_id": media_id, "overlay": False}, None)
+
+        # Disparo por S3: la parte nueva reconstruye sus fotos; los compactados no
+        parts = (results_key, "results/detections/date=2026-01-10/compacted-abc.parquet")
+        event = {"Records": [{"s3": {"bucket": {"name": "out"}, "object": {"key": k}}} for k in parts]}
+        assert json.loads(visualizer.lambda_handler(event, None)["body"]) == {"reconstructed": 1}
+
+        (item,) = table.scan()["Items"]
+        assert item["media_id"] == geometry["media_id"] == media_id
+        assert item["status"] == "RECONSTRUCTED" and item["grid"] == "3x4"
+        assert item["total_detections"] == len(geometry["tiles"]) == 12
+        assert s3.get_object(Bucket="out", Key=f"reconstruction/{media_id}.json")
+
+
+class KeyRecordingClient:
+    """Cliente S3 que anota las keys que se leen"""
+
+    def __init__(self, client):
+        self.client, self.keys = client, []
+
+    def get_object(self, **kwargs):
+        self.keys.append(kwargs["Key"])
+        return self.client.get_object(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def test_reconstruction_reads_recorded_parts_and_falls_back_after_compaction(aws_env):
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    pytest.importorskip("pyarrow")
+    from datetime import datetime, timezone
+    from src.common.results_store import DetectionBuffer, compact_s3
+    from src.aws_lambda.reconstruction.visualizer import reconstruct_media
+
+    created = datetime(2026, 1, 10, 12, tzinfo=timezone.utc)
+    berry = {"xyxy": np.float32([[10, 10, 30, 30]]), "conf": np.float32([0.9]), "cls": np.array([1])}
+    with moto.mock_aws():
+        s3 = boto3.client("s3")
+        for bucket in ("raw", "out"):
+            s3.create_bucket(Bucket=bucket)
+        s3.put_object(Bucket="raw", Key="uploads/a.jpg", Body=cv2.imencode(".jpg", np.zeros((600, 800, 3), np.uint8))[1].tobytes())
+        keys = {}
+        for media_id, part in (("foto-a", "a"), ("foto-b", "b")):
+            buffer = DetectionBuffer("v1", part_id=part, created=created)
+            buffer.add(media_id, berry, {1: "arandano"}, image_coords=True)
+            keys[media_id] = buffer.flush_to_s3(s3, "out")
+
+        client = KeyRecordingClient(s3)
+        summary = reconstruct_media(client, "out", "foto-a", ["2026-01-10"], "s3://raw/uploads/a.jpg",
+                                    overlay=False, results_keys={keys["foto-a"]})
+        assert summary["total"] == 1
+        assert keys["foto-b"] not in client.keys
+
+        # Partes compactadas: la key anotada ya no existe y se lista la partición
+        compact_s3(s3, "out", "results/detections/date=2026-01-10/")
+        summary = reconstruct_media(s3, "out", "foto-a", ["2026-01-10"], "s3://raw/uploads/a.jpg",
+                                    overlay=False, results_keys={keys["foto-a"]})
+        assert summary["total"] == 1